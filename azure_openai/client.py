@@ -0,0 +1,89 @@
+import threading
+from openai import OpenAI, AsyncOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
+from openai import DefaultHttpxClient, DefaultAsyncHttpxClient
+import httpx
+from uitils.logger import custom_logger
+
+try:
+    import h2
+except ImportError:
+    # httpx speaks HTTP/2 only with the h2 package (pip install httpx[http2]); without it HTTP/1.1 is used.
+    h2 = None
+
+logger = custom_logger.get_logger()
+
+class SharedOpenAIClient:
+    """
+    OpenAI client shared by StudentQnA and RecommendationsQuestions, created on first use.
+
+    All calls go through one httpx connection pool, so connections and TLS
+    sessions to the endpoint are reused across both classes instead of each
+    keeping its own pool. Nothing is created, and the credentials are not
+    checked, until the first call: the app starts without loading the TLS
+    certificates or reaching the endpoint.
+    """
+
+    def __init__(self, api_key, azure_endpoint, api_version, openai_type, asynchronous=True,
+                 max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0,
+                 connect_timeout=5.0, read_timeout=60.0, http2=True):
+        self.api_key = api_key
+        self.azure_endpoint = azure_endpoint
+        self.api_version = api_version
+        self.openai_type = openai_type
+        self.asynchronous = asynchronous
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        # The read timeout bounds a single read; each call also gets the time left before its deadline.
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.http2 = http2 and h2 is not None
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the OpenAI client, creating it and its connection pool on the first call."""
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    try:
+                        self._client = self._create_client()
+                    except Exception as e:
+                        logger.error(f"Error initializing OpenAI client: {str(e)}")
+                        raise Exception("Error initializing OpenAI client")
+                client = self._client
+        return client
+
+    def _create_client(self):
+        http_client_class = DefaultAsyncHttpxClient if self.asynchronous else DefaultHttpxClient
+        http_client = http_client_class(limits=self.limits, timeout=self.timeout, http2=self.http2)
+        kind = "async " if self.asynchronous else ""
+        if self.openai_type == 'azure_openai':
+            client_class = AsyncAzureOpenAI if self.asynchronous else AzureOpenAI
+            client = client_class(
+                azure_endpoint=self.azure_endpoint,
+                api_key=self.api_key,
+                api_version=self.api_version,
+                max_retries=0,
+                http_client=http_client
+            )
+            logger.info("Initialized {}Azure OpenAI client with endpoint: {} (HTTP/2: {})", kind, self.azure_endpoint, self.http2)
+            return client
+        client_class = AsyncOpenAI if self.asynchronous else OpenAI
+        client = client_class(api_key=self.api_key, max_retries=0, http_client=http_client)
+        logger.info("Initialized {}OpenAI client (HTTP/2: {})", kind, self.http2)
+        return client
+
+    async def aclose(self):
+        """Closes the connection pool of an async client, if it was created."""
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            await client.close()
+
+    def close(self):
+        """Closes the connection pool of a blocking client, if it was created."""
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
@@ -0,0 +1,119 @@
+from uitils.cache import LRUCache
+from uitils.logger import custom_logger
+
+logger = custom_logger.get_logger()
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    # tiktoken is optional; without it tokens are estimated from the length of the text.
+    _encoding = None
+
+def count_tokens(text):
+    """Returns the number of tokens of text, estimated at 4 characters per token without tiktoken."""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+PENDING = "not answered"
+
+class ConversationContext:
+    """
+    Bounded conversation history for the prompts.
+
+    The last `recent_turns` turns are rendered verbatim. Older turns are
+    folded into a summary of one short line per turn, which is cached per
+    session and only extended with the turns that aged out since the previous
+    call. When the context exceeds `max_tokens`, the oldest summary lines are
+    collapsed into counts, so late-session prompts cost the same as early ones.
+    Turns not graded yet are always rendered verbatim: their summary line
+    would stay cached with the pending result once they are graded.
+    """
+
+    SUMMARY_QUESTION_CHARS = 120
+
+    def __init__(self, max_tokens=1500, recent_turns=4, cache_size=1024):
+        self.max_tokens = max_tokens
+        self.recent_turns = recent_turns
+        self.summaries = LRUCache(cache_size)
+
+    def _turn(self, interaction, question_label, answer_label):
+        return f"{question_label}: {interaction['question']}\n{answer_label}: {interaction['answer']}"
+
+    def _summary_line(self, interaction):
+        question = " ".join(interaction["question"].split())
+        if len(question) > self.SUMMARY_QUESTION_CHARS:
+            question = question[:self.SUMMARY_QUESTION_CHARS] + "..."
+        return f"- {question} -> {interaction['correct_answer']} (confidence {interaction['confidence_level']})"
+
+    def _summary(self, older):
+        """
+        Returns the cache key and the summary state of the turns in `older`:
+        {"turns", "last_id", "folded", "lines"}. `lines` holds (result, line, tokens)
+        per summarized turn and `folded` counts the results of collapsed lines.
+        """
+        key = older[0]["interaction_id"]
+        state = self.summaries.get(key)
+        if state is None or state["turns"] > len(older) or \
+                (state["turns"] and older[state["turns"] - 1]["interaction_id"] != state["last_id"]):
+            state = {"turns": 0, "last_id": None, "folded": {}, "lines": []}
+        if state["turns"] < len(older):
+            new_lines = []
+            for interaction in older[state["turns"]:]:
+                line = self._summary_line(interaction)
+                new_lines.append((interaction["correct_answer"], line, count_tokens(line) + 1))
+            state = {
+                "turns": len(older),
+                "last_id": older[-1]["interaction_id"],
+                "folded": state["folded"],
+                "lines": state["lines"] + new_lines
+            }
+            self.summaries.put(key, state)
+        return key, state
+
+    def _summary_header(self, folded):
+        header = "Summary of earlier turns:"
+        if folded:
+            counts = ", ".join(f"{count} {result}" for result, count in folded.items())
+            header += f"\n{sum(folded.values())} earlier questions ({counts})."
+        return header
+
+    def _fold(self, key, state, budget):
+        """Collapses the oldest summary lines into counts until the summary fits in budget."""
+        lines = state["lines"]
+        folded = dict(state["folded"])
+        tokens = sum(line[2] for line in lines)
+        start = 0
+        while start < len(lines) and count_tokens(self._summary_header(folded)) + tokens > budget:
+            result, _, line_tokens = lines[start]
+            folded[result] = folded.get(result, 0) + 1
+            tokens -= line_tokens
+            start += 1
+        if start:
+            state = {**state, "folded": folded, "lines": lines[start:]}
+            self.summaries.put(key, state)
+        return state
+
+    def render(self, history, question_label="Question", answer_label="Student Answer"):
+        """Returns the context text for the turns in history, oldest first."""
+        if not history:
+            return ""
+        graded = len(history)
+        while graded > 0 and history[graded - 1]["correct_answer"] == PENDING:
+            graded -= 1
+        recent = history[min(max(len(history) - self.recent_turns, 0), graded):] if self.recent_turns > 0 else history[graded:]
+        older = history[:len(history) - len(recent)]
+        recent_text = "\n".join(self._turn(t, question_label, answer_label) for t in recent)
+        # Long answers can overflow the budget on their own: keep at least the last turn.
+        while len(recent) > 1 and len(older) < graded and count_tokens(recent_text) > self.max_tokens:
+            older = history[:len(older) + 1]
+            recent = recent[1:]
+            recent_text = "\n".join(self._turn(t, question_label, answer_label) for t in recent)
+        if not older:
+            return recent_text
+        key, state = self._summary(older)
+        state = self._fold(key, state, self.max_tokens - count_tokens(recent_text))
+        summary_text = "\n".join([self._summary_header(state["folded"])] + [line for _, line, _ in state["lines"]])
+        logger.debug("Context covers {} turns: {} verbatim, {} summarized, {} counted", len(history), len(recent), len(state['lines']), sum(state['folded'].values()))
+        return f"{summary_text}\n\n{recent_text}".strip()
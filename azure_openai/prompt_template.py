@@ -0,0 +1,21 @@
+from string import Formatter
+
+class PromptTemplate:
+    """
+    str.format-style template parsed once, when the module is imported.
+
+    Rendering only joins the literal parts with the values, instead of
+    re-parsing the template on every request.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self._parts = []
+        for literal, field, _, _ in Formatter().parse(template):
+            if literal:
+                self._parts.append((True, literal))
+            if field is not None:
+                self._parts.append((False, field))
+
+    def render(self, **values):
+        return "".join(part if literal else str(values[part]) for literal, part in self._parts)
@@ -1,32 +1,31 @@
-from openai import OpenAI
-from openai import AzureOpenAI
-import time
+from azure_openai.client import SharedOpenAIClient
+from azure_openai.resilience import ResilientCaller
+from azure_openai.context import ConversationContext, count_tokens
+from azure_openai.prompt_template import PromptTemplate
 from uitils.logger import custom_logger
 import json
 
 logger = custom_logger.get_logger()
 
 class RecommendationsQuestions:
-    def __init__(self, gpt_engine_name, api_key, azure_endpoint, api_version, openai_type) -> None:
+    # Whether the OpenAI client is the async one; set by the async subclass.
+    asynchronous = False
+
+    def __init__(self, gpt_engine_name, api_key, azure_endpoint, api_version, openai_type, caller=None, context=None, client=None) -> None:
         self.answer=''
         self.gpt_engine_name=gpt_engine_name
-        try:
-            if openai_type == 'azure_openai':
-                self.openai_client = AzureOpenAI(
-                    azure_endpoint=azure_endpoint,
-                    api_key=api_key,
-                    api_version=api_version
-                )
-                logger.info(f"Initialized Azure OpenAI client with endpoint: {azure_endpoint}")
-            else:
-                self.openai_client = OpenAI(api_key=api_key)
-                logger.info("Initialized OpenAI client")
-        except Exception as e:
-            logger.error(f"Error initializing OpenAI client: {str(e)}")
-            raise Exception("Error initializing OpenAI client")
-
-    def _system_prompt(self,student_level,difficulty_level,conversation,topics):
-        prompt =f"""
+        self.caller=caller or ResilientCaller()
+        self.context=context or ConversationContext()
+        # Created on first use; main.py passes one client shared with the other class.
+        self.client=client or SharedOpenAIClient(api_key, azure_endpoint, api_version, openai_type, asynchronous=self.asynchronous)
+
+    @property
+    def openai_client(self):
+        return self.client.get()
+
+    # The system prompts are identical for every request so that the provider can cache them
+    # as a prompt prefix; everything that depends on the request is sent in the user message.
+    SYSTEM_PROMPT = """
 Your are AI Assistant that helps students by recommending new question based on the given topics. These questions helps students to enhance the understanding of the topic
 Analyse the given conversation and generate one question based on student level
 If the student is poor then generate easy questions, if he is average then generate modarate question else generate hard question only from the context given
@@ -38,22 +37,12 @@ Instructions to find student intellegence level:
 - If the student conversation is normal without any follow up question or he never said that he didn't understand the topic then the student has a normal understanding.
 - Recommend new question based on below difficulty level.
 
-Conversation:
-{conversation}
-
-Student Level:
-{student_level}
-
-Difficulty Level:
-{difficulty_level}
-
-Topics:
-{topics}
+The conversation, student level, difficulty level and topics are given in the user message.
 
 Based on the student intelligence level and student level ask him different type of questions.
 
 *** Output Format ***
-The response should always be in a JSON format with ONE key: 'question'. The 'question' key has the recommended new quesstion based on the the given topics. Just follow the below example for output compliance:"""+"""
+The response should always be in a JSON format with ONE key: 'question'. The 'question' key has the recommended new quesstion based on the the given topics. Just follow the below example for output compliance:
  
 Output Format Example:
 '''{"question": "Your question here"}'''
@@ -61,75 +50,78 @@ Output Format Example:
 *NOTE :
 *Response always in JSON format.
 *Don't include anything like poor, average or good student."""
-        return prompt
+
+    QUESTION_PROMPT = PromptTemplate("""Conversation:
+{conversation}
+
+Student Level:
+{student_level}
+
+Difficulty Level:
+{difficulty_level}
+
+Topics:
+{topics}
+
+Your task is to generate ONLY ONE best question based on these topics: {topics}. Your response should be as truthful as possible, and should include all the information covered about the topic: {topics}. Start generating with an engaging sentence.
+    *NOTE:
+    * Do not include anything about poor, average, or good students.
+    *Response always in above JSON format.""")
     
     def format_history_recommend(self,history):
         try:
-            s = ''
-            for i in history[:-1]:
-                s += f"Bot: {i['question']}\n"
-                s += f"Student: {i['answer']}\n"
-            return s.strip()
+            return self.context.render(history[:-1], "Bot", "Student")
         except KeyError as e:
             logger.error(f"Missing key in history format: {e}")
             raise ValueError("History format error: Missing key")
 
+    def _build_question_messages(self, learning_goals, student_level, difficulty_level, history=None):
+        # Log input values
+        logger.info("Received recommendation request for learning goals: {}, rating: {}", learning_goals, student_level)
+        
+        topics = ",".join(learning_goals)
+        if history:
+            if len(history) > 1:
+                his = self.format_history_recommend(history)
+            else:
+                his=""
+        else:
+            his = ''
+        
+        # Construct system prompt for OpenAI
+        conversation_history = [
+            {"role": "system", "content": self.SYSTEM_PROMPT}
+        ]
+
+        user_prompt = self.QUESTION_PROMPT.render(conversation=his, student_level=student_level, difficulty_level=difficulty_level, topics=topics)
+
+        # Log the user prompt for tracking
+        logger.debug("User prompt: {}", user_prompt)
+        messages = conversation_history + [{"role": "user", "content": user_prompt}]
+        logger.opt(lazy=True).debug("Recommendation prompt: about {} tokens, context {} tokens", lambda: sum(count_tokens(m['content']) for m in messages), lambda: count_tokens(his))
+        return messages
+
+    def _parse_answer(self, ans):
+        json_answer = ans.choices[0].message.content
+        json_answer=json_answer.replace("`","").replace("json","")
+        return json.loads(json_answer)
+
     def recommend_question(self, learning_goals, student_level,difficulty_level, history=None):
-        response = {"question":"OpenAI Not Responding"}
-        for delay_secs in (2**x for x in range(0, 3)):
-            try:
-                # Log input values
-                logger.info(f"Received recommendation request for learning goals: {learning_goals}, rating: {student_level}")
-                
-                topics = ",".join(learning_goals)
-                if history:
-                    if len(history) > 1:
-                        his = self.format_history_recommend(history)
-                    else:
-                        his=""
-                else:
-                    his = ''
-                
-                # Construct system prompt for OpenAI
-                conversation_history = [
-                    {"role": "system", "content": self._system_prompt(student_level,difficulty_level,his,topics)}
-                ]
-
-                user_prompt = f"""Your task is to generate ONLY ONE best question based on these topics: {topics}. Your response should be as truthful as possible, and should include all the information covered about the topic: {topics}. Start generating with an engaging sentence.
-    *NOTE:
-    * Do not include anything about poor, average, or good students.
-    *Response always in above JSON format."""
-
-                # Log the user prompt for tracking
-                logger.debug(f"User prompt: {user_prompt}")
-
-                # Call OpenAI or Azure API
-                ans = self.openai_client.chat.completions.create(
-                    model=self.gpt_engine_name,
-                    messages=conversation_history + [{"role": "user", "content": user_prompt}],
-                    max_tokens=300
-                )
-
-                json_answer = ans.choices[0].message.content
-                logger.info("Successfully generated questions.")
-                json_answer=json_answer.replace("`","").replace("json","")
-                response=json.loads(json_answer)
-                break
-            except Exception as e:
-                time.sleep(delay_secs)
-                logger.error(f"Error while generating new question recommendations: {str(e)}")
-                continue
-        return response
+        messages = self._build_question_messages(learning_goals, student_level, difficulty_level, history)
+        return self.caller.call(
+            lambda timeout: self.openai_client.chat.completions.create(
+                model=self.gpt_engine_name,
+                messages=messages,
+                max_tokens=300,
+                timeout=timeout
+            ),
+            self._parse_answer,
+            {"question":"OpenAI Not Responding"},
+            name="question recommendation"
+        )
     
-    def _system_prompt_next(self,avg_confidence_level,student_level,difficulty_level,conversation,topics):
-        prompt =f"""
-You are an adaptive learning assistant designed to offer personalized recommendations and identify knowledge gaps based on student input. Use the following details to guide your responses:
-
-- **Learning Goals**: {topics}
-- **Student Level**: {student_level}
-- **Difficulty Level**: {difficulty_level}
-- **Average Confidence Level**: {avg_confidence_level}
-- **Interaction History**: {conversation}
+    SYSTEM_PROMPT_NEXT = """
+You are an adaptive learning assistant designed to offer personalized recommendations and identify knowledge gaps based on student input. Use the details given in the user message (learning goals, student level, difficulty level, average confidence level and interaction history) to guide your responses.
 
 ### Instructions:
 
@@ -140,7 +132,7 @@ You are an adaptive learning assistant designed to offer personalized recommenda
 Your response should be clear, concise, and foster critical thinking, with actionable steps and guidance to help the student move forward.
 
 *** Output Format ***
-The response should always be in a JSON format with TWO key: The "next_steps" key has the recommended Suggest Personalized Next Steps based on the the given topics. "knowledge_gaps" key has the Identify Knowledge Gaps based on the the given topics. Just follow the below example for output compliance:"""+"""
+The response should always be in a JSON format with TWO key: The "next_steps" key has the recommended Suggest Personalized Next Steps based on the the given topics. "knowledge_gaps" key has the Identify Knowledge Gaps based on the the given topics. Just follow the below example for output compliance:
  
 Output Format Example:
 '''{"next_steps":"Your response here","knowledge_gaps": "Your response here"}'''
@@ -148,59 +140,109 @@ Output Format Example:
 *NOTE :
 *Response always in JSON format.
 *Don't include anything like poor, average or good student."""
-        return prompt
+
+    NEXT_PROMPT = PromptTemplate("""- **Learning Goals**: {topics}
+- **Student Level**: {student_level}
+- **Difficulty Level**: {difficulty_level}
+- **Average Confidence Level**: {avg_confidence_level}
+- **Interaction History**: {conversation}
+
+Your task is to generate Suggest Personalized Next Steps and Identify Knowledge Gaps based on these topics: {topics}. Your response should be as truthful as possible, and should include all the information covered about the topic: {topics}. Start generating with an engaging sentence.
+    *NOTE:
+    * Do not include anything about poor, average, or good students.
+    *Response always in above JSON format.""")
     
     def format_history(self,history):
         try:
-            s = ''
-            for i in history:
-                s += f"Bot: {i['question']}\n"
-                s += f"Student: {i['answer']}\n"
-            return s.strip()
+            return self.context.render(history, "Bot", "Student")
         except KeyError as e:
             logger.error(f"Missing key in history format: {e}")
             raise ValueError("History format error: Missing key")
 
+    def _build_next_messages(self, avg_confidence_level, learning_goals, student_level, difficulty_level, history=None):
+        # Log input values
+        logger.info("Received recommendation request for learning goals: {}, rating: {}", learning_goals, student_level)
+        
+        topics = ",".join(learning_goals)
+        if history:
+            his = self.format_history(history)
+        else:
+            his = ''
+        
+        # Construct system prompt for OpenAI
+        conversation_history = [
+            {"role": "system", "content": self.SYSTEM_PROMPT_NEXT}
+        ]
+
+        user_prompt = self.NEXT_PROMPT.render(topics=topics, student_level=student_level, difficulty_level=difficulty_level, avg_confidence_level=avg_confidence_level, conversation=his)
+
+        # Log the user prompt for tracking
+        logger.debug("User prompt: {}", user_prompt)
+        messages = conversation_history + [{"role": "user", "content": user_prompt}]
+        logger.opt(lazy=True).debug("Recommendation prompt: about {} tokens, context {} tokens", lambda: sum(count_tokens(m['content']) for m in messages), lambda: count_tokens(his))
+        return messages
+
     def recommend_next(self, avg_confidence_level,learning_goals, student_level,difficulty_level, history=None):
-        response = {"question":"OpenAI Not Responding"}
-        for delay_secs in (2**x for x in range(0, 3)):
-            try:
-                # Log input values
-                logger.info(f"Received recommendation request for learning goals: {learning_goals}, rating: {student_level}")
-                
-                topics = ",".join(learning_goals)
-                if history:
-                    his = self.format_history(history)
-                else:
-                    his = ''
-                
-                # Construct system prompt for OpenAI
-                conversation_history = [
-                    {"role": "system", "content": self._system_prompt_next(avg_confidence_level,student_level,difficulty_level,his,topics)}
-                ]
-
-                user_prompt = f"""Your task is to generate Suggest Personalized Next Steps and Identify Knowledge Gaps based on these topics: {topics}. Your response should be as truthful as possible, and should include all the information covered about the topic: {topics}. Start generating with an engaging sentence.
-    *NOTE:
-    * Do not include anything about poor, average, or good students.
-    *Response always in above JSON format."""
-
-                # Log the user prompt for tracking
-                logger.debug(f"User prompt: {user_prompt}")
-
-                # Call OpenAI or Azure API
-                ans = self.openai_client.chat.completions.create(
-                    model=self.gpt_engine_name,
-                    messages=conversation_history + [{"role": "user", "content": user_prompt}],
-                    max_tokens=300
-                )
-
-                json_answer = ans.choices[0].message.content
-                logger.info("Successfully generated recommendations.")
-                json_answer=json_answer.replace("`","").replace("json","")
-                response=json.loads(json_answer)
-                break
-            except Exception as e:
-                time.sleep(delay_secs)
-                logger.error(f"Error while generating recommendations: {str(e)}")
-                continue
-        return response
\ No newline at end of file
+        messages = self._build_next_messages(avg_confidence_level, learning_goals, student_level, difficulty_level, history)
+        return self.caller.call(
+            lambda timeout: self.openai_client.chat.completions.create(
+                model=self.gpt_engine_name,
+                messages=messages,
+                max_tokens=300,
+                timeout=timeout
+            ),
+            self._parse_answer,
+            {"question":"OpenAI Not Responding"},
+            name="next steps recommendation"
+        )
+
+class AsyncRecommendationsQuestions(RecommendationsQuestions):
+    """RecommendationsQuestions on the async OpenAI client, so waiting for the model does not block the event loop."""
+
+    asynchronous = True
+
+    async def recommend_question(self, learning_goals, student_level,difficulty_level, history=None):
+        messages = self._build_question_messages(learning_goals, student_level, difficulty_level, history)
+        return await self.caller.acall(
+            lambda timeout: self.openai_client.chat.completions.create(
+                model=self.gpt_engine_name,
+                messages=messages,
+                max_tokens=300,
+                timeout=timeout
+            ),
+            self._parse_answer,
+            {"question":"OpenAI Not Responding"},
+            name="question recommendation"
+        )
+
+    async def recommend_next(self, avg_confidence_level,learning_goals, student_level,difficulty_level, history=None):
+        messages = self._build_next_messages(avg_confidence_level, learning_goals, student_level, difficulty_level, history)
+        return await self.caller.acall(
+            lambda timeout: self.openai_client.chat.completions.create(
+                model=self.gpt_engine_name,
+                messages=messages,
+                max_tokens=300,
+                timeout=timeout
+            ),
+            self._parse_answer,
+            {"question":"OpenAI Not Responding"},
+            name="next steps recommendation"
+        )
+
+    async def recommend_next_stream(self, avg_confidence_level,learning_goals, student_level,difficulty_level, history=None):
+        """Yields the text of the recommendations as the model produces it."""
+        messages = self._build_next_messages(avg_confidence_level, learning_goals, student_level, difficulty_level, history)
+        stream = self.caller.astream(
+            lambda timeout: self.openai_client.chat.completions.create(
+                model=self.gpt_engine_name,
+                messages=messages,
+                max_tokens=300,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout
+            ),
+            name="next steps recommendation stream"
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
@@ -0,0 +1,322 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+import openai
+from uitils.logger import custom_logger
+from uitils.metrics import REGISTRY
+from uitils.tracing import span
+
+logger = custom_logger.get_logger()
+
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    "llm_call_duration_seconds", "Duration of OpenAI calls including retries and backoff, and the whole stream of "
+    "streaming calls, by call and outcome (success, fallback, short_circuited or interrupted).", ["call", "outcome"]
+)
+LLM_RETRIES = REGISTRY.counter("llm_retries_total", "OpenAI attempts retried after a retryable error.", ["call"])
+LLM_PARSE_FAILURES = REGISTRY.counter("llm_parse_failures_total", "Model answers that could not be parsed.", ["call"])
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens used by OpenAI calls, by kind (prompt, cached_prompt, completion).", ["call", "kind"])
+
+# Errors worth another attempt: the service was unreachable, slow, overloaded or failed.
+# Anything else (bad request, authentication, unparsable answer) fails the same way again.
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+def is_retryable(error):
+    """Returns True if the OpenAI call that raised error may succeed when retried."""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+class CircuitBreaker:
+    """
+    Stops calling the model once too many recent calls failed.
+
+    The outcomes of the last `window` calls are kept. When at least `min_calls`
+    are known and the failure rate reaches `failure_threshold`, the breaker
+    opens and calls fail fast for `reset_timeout` seconds. It then lets one
+    trial call through (half open): a success closes it, a failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=0.5, window=20, min_calls=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self._outcomes = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._opened_at = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """Returns True if a call may be made now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                logger.info("Circuit breaker closed after a successful trial call")
+                self._state = self.CLOSED
+                self._outcomes.clear()
+                self._trial_in_flight = False
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trial_in_flight = False
+                self._open()
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if self._state == self.CLOSED and len(self._outcomes) >= self.min_calls \
+                    and failures / len(self._outcomes) >= self.failure_threshold:
+                self._open()
+
+    def release(self):
+        """Ends a trial call whose outcome says nothing about the service's health."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+        logger.warning(f"Circuit breaker opened for {self.reset_timeout} seconds")
+
+    def stats(self):
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": self._outcomes.count(False),
+                "times_opened": self.times_opened
+            }
+
+class ResilientCaller:
+    """
+    Runs OpenAI chat calls with a deadline, jittered exponential backoff and a circuit breaker.
+
+    `create(timeout)` sends the request with the given per-attempt timeout and
+    `parse(answer)` turns the answer into the caller's response. Only retryable
+    errors are retried, the backoff never outlasts the deadline and there is no
+    wait after the last attempt. When the call cannot succeed, `fallback` is
+    returned. Shared by StudentQnA and RecommendationsQuestions so that they
+    use one breaker and one set of counters.
+    """
+
+    def __init__(self, max_attempts=3, deadline=20, base_delay=0.5, max_delay=4, breaker=None):
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self.counters = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "non_retryable_errors": 0,
+            "parse_failures": 0,
+            "deadline_exceeded": 0,
+            "short_circuited": 0,
+            "prompt_tokens": 0,
+            "cached_prompt_tokens": 0,
+            "completion_tokens": 0
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _backoff(self, attempt):
+        # Full jitter: spreads the retries of concurrent requests instead of synchronizing them.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _next_step(self, error, attempt, expires_at, name):
+        """
+        Decides what to do after a failed attempt: returns the number of seconds
+        to wait before retrying, or None to give up.
+        """
+        if isinstance(error, (json.JSONDecodeError, KeyError, IndexError, AttributeError)):
+            self._count("parse_failures")
+            LLM_PARSE_FAILURES.labels(name).inc()
+            logger.error(f"Unparsable answer from {name}: {str(error)}")
+            return None
+        if not is_retryable(error):
+            self._count("non_retryable_errors")
+            logger.error(f"Non-retryable error from {name}: {str(error)}")
+            return None
+        logger.warning(f"Attempt {attempt + 1} of {name} failed: {str(error)}")
+        if attempt + 1 >= self.max_attempts:
+            return None
+        delay = self._backoff(attempt)
+        if time.monotonic() + delay >= expires_at:
+            self._count("deadline_exceeded")
+            return None
+        self._count("retries")
+        LLM_RETRIES.labels(name).inc()
+        return delay
+
+    def _record_usage(self, answer, name):
+        usage = getattr(answer, "usage", None)
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+        prompt_tokens = usage.prompt_tokens or 0
+        logger.info("{} used {} prompt tokens ({} cached, {} uncached) and {} completion tokens", name, prompt_tokens, cached, prompt_tokens - cached, usage.completion_tokens)
+        with self._lock:
+            self.counters["prompt_tokens"] += prompt_tokens
+            self.counters["cached_prompt_tokens"] += cached
+            self.counters["completion_tokens"] += usage.completion_tokens or 0
+        LLM_TOKENS.labels(name, "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(name, "cached_prompt").inc(cached)
+        LLM_TOKENS.labels(name, "completion").inc(usage.completion_tokens or 0)
+
+    def _start(self, name):
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            logger.warning(f"Circuit breaker is open, skipping {name}")
+            return False
+        return True
+
+    def _finish(self, error):
+        if error is None:
+            self._count("successes")
+            self.breaker.record_success()
+            return
+        self._count("failures")
+        if is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+
+    def call(self, create, parse, fallback, name="OpenAI call"):
+        """Runs a blocking call; see the class docstring."""
+        with span("llm", call=name):
+            return self._call(create, parse, fallback, name)
+
+    def _call(self, create, parse, fallback, name):
+        started = time.perf_counter()
+        if not self._start(name):
+            LLM_CALL_SECONDS.labels(name, "short_circuited").observe(time.perf_counter() - started)
+            return fallback
+        expires_at = time.monotonic() + self.deadline
+        error = asyncio.TimeoutError("Deadline exceeded")
+        for attempt in range(self.max_attempts):
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                self._count("deadline_exceeded")
+                break
+            try:
+                with span("llm_attempt", attempt=attempt + 1):
+                    answer = create(remaining)
+                self._record_usage(answer, name)
+                response = parse(answer)
+                self._finish(None)
+                LLM_CALL_SECONDS.labels(name, "success").observe(time.perf_counter() - started)
+                return response
+            except Exception as e:
+                error = e
+                delay = self._next_step(e, attempt, expires_at, name)
+                if delay is None:
+                    break
+                with span("llm_backoff"):
+                    time.sleep(delay)
+        self._finish(error)
+        LLM_CALL_SECONDS.labels(name, "fallback").observe(time.perf_counter() - started)
+        return fallback
+
+    async def acall(self, create, parse, fallback, name="OpenAI call"):
+        """Runs a call on the async client; `create` returns an awaitable."""
+        with span("llm", call=name):
+            return await self._acall(create, parse, fallback, name)
+
+    async def astream(self, create, name="OpenAI stream"):
+        """
+        Opens a streaming call on the async client as acall does, then yields its chunks.
+
+        The request should pass stream_options={"include_usage": True}: the token usage
+        then comes in the last chunk. The call is observed once the stream has been
+        read to the end (success) or closed before (interrupted), so the duration
+        covers every chunk. Raises if the stream could not be opened.
+        """
+        started = time.perf_counter()
+        with span("llm", call=name):
+            stream = await self._acall(create, lambda stream: stream, None, name, observe_success=False)
+        if stream is None:
+            raise Exception("OpenAI Not Responding")
+        outcome = "interrupted"
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    self._record_usage(chunk, name)
+                yield chunk
+            outcome = "success"
+        finally:
+            LLM_CALL_SECONDS.labels(name, outcome).observe(time.perf_counter() - started)
+
+    async def _acall(self, create, parse, fallback, name, observe_success=True):
+        started = time.perf_counter()
+        if not self._start(name):
+            LLM_CALL_SECONDS.labels(name, "short_circuited").observe(time.perf_counter() - started)
+            return fallback
+        expires_at = time.monotonic() + self.deadline
+        error = asyncio.TimeoutError("Deadline exceeded")
+        for attempt in range(self.max_attempts):
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                self._count("deadline_exceeded")
+                break
+            try:
+                with span("llm_attempt", attempt=attempt + 1):
+                    answer = await asyncio.wait_for(create(remaining), remaining)
+                self._record_usage(answer, name)
+                response = parse(answer)
+                self._finish(None)
+                if observe_success:
+                    LLM_CALL_SECONDS.labels(name, "success").observe(time.perf_counter() - started)
+                return response
+            except Exception as e:
+                error = e
+                delay = self._next_step(e, attempt, expires_at, name)
+                if delay is None:
+                    break
+                with span("llm_backoff"):
+                    await asyncio.sleep(delay)
+        self._finish(error)
+        LLM_CALL_SECONDS.labels(name, "fallback").observe(time.perf_counter() - started)
+        return fallback
+
+    def stats(self):
+        """Returns the retry counters and the breaker state for monitoring."""
+        with self._lock:
+            counters = dict(self.counters)
+        return {**counters, "circuit_breaker": self.breaker.stats()}
@@ -1,33 +1,32 @@
-from openai import OpenAI
-from openai import AzureOpenAI
+from azure_openai.client import SharedOpenAIClient
 import json
-import time
+from azure_openai.resilience import ResilientCaller
+from azure_openai.context import ConversationContext, count_tokens
+from azure_openai.prompt_template import PromptTemplate
 from uitils.logger import custom_logger
 
 logger = custom_logger.get_logger()
 
 class StudentQnA:
 
-    def __init__(self, gpt_engine_name, api_key, azure_endpoint, api_version, openai_type) -> None:
+    # Whether the OpenAI client is the async one; set by the async subclass.
+    asynchronous = False
+
+    def __init__(self, gpt_engine_name, api_key, azure_endpoint, api_version, openai_type, caller=None, context=None, client=None) -> None:
 
         self.gpt_engine_name=gpt_engine_name
-        try:
-            if openai_type == 'azure_openai':
-                self.openai_client = AzureOpenAI(
-                    azure_endpoint=azure_endpoint,
-                    api_key=api_key,
-                    api_version=api_version
-                )
-                logger.info(f"Initialized Azure OpenAI client with endpoint: {azure_endpoint}")
-            else:
-                self.openai_client = OpenAI(api_key=api_key)
-                logger.info("Initialized OpenAI client")
-        except Exception as e:
-            logger.error(f"Error initializing OpenAI client: {str(e)}")
-            raise Exception("Error initializing OpenAI client")
+        self.caller=caller or ResilientCaller()
+        self.context=context or ConversationContext()
+        # Created on first use; main.py passes one client shared with the other class.
+        self.client=client or SharedOpenAIClient(api_key, azure_endpoint, api_version, openai_type, asynchronous=self.asynchronous)
+
+    @property
+    def openai_client(self):
+        return self.client.get()
 
-    def _system_prompt(self,conversation,student_level,difficulty_level,topics):
-        prompt = f"""You are a mentor and adaptive learning assistant dedicated to providing customized support to students in a unique manner. Your role goes beyond being a mentor; it is to facilitate learning and encourage critical thinking. You are responsible for evaluating student responses and adapting to their learning needs. Importantly, you must ensure that you do not repeat questions the student has already answered in previous interactions. Here are the core features and instructions that define your role:
+    # Identical for every request so that the provider can cache it as a prompt prefix;
+    # everything that depends on the request is sent after it, in the user messages.
+    SYSTEM_PROMPT = """You are a mentor and adaptive learning assistant dedicated to providing customized support to students in a unique manner. Your role goes beyond being a mentor; it is to facilitate learning and encourage critical thinking. You are responsible for evaluating student responses and adapting to their learning needs. Importantly, you must ensure that you do not repeat questions the student has already answered in previous interactions. Here are the core features and instructions that define your role:
 
 #### Core Features and Instructions:
 
@@ -67,23 +66,13 @@ class StudentQnA:
 4. **Step 4:**  
    If the student responds with phrases like “I don’t know,” “no,” or “I’m not sure,” provide the correct answer and then generate a new question based on the same topic.
 
-Conversation:
-{conversation}
-
-Student Level:
-{student_level}
-
-Difficulty Level:
-{difficulty_level}
-
-Topics:
-{topics}
+The conversation, student level, difficulty level and topics are given with each question.
 
 ### Output Format:
 Your response should always be in a JSON format with three keys:  
 - "result": Indicates whether the student's answer is "correct" or "incorrect" or "partially correct". 
 - "confidence_level": Represents your confidence in the student's answer, ranging from 1 to 5.  
-- "follow_up_question": The follow-up question or suggested hints or guidance for pervious question based on the topic."""+"""
+- "follow_up_question": The follow-up question or suggested hints or guidance for pervious question based on the topic.
 
 Here is an example of the output format:
 {"result": "correct","confidence_level": 4,"follow_up_question": "Your question here"}
@@ -104,79 +93,126 @@ Response:'''{"result": "correct", "confidence_level": 5, "follow_up_question": "
 *Follow-up question always in above topics only.
 *Don't include anything like poor, average or good student
 """
-        return prompt
+
+    USER_PROMPT = PromptTemplate('''
+
+        Student Level: {student_level}
+        Difficulty Level: {difficulty_level}
+        Topics: {topics}
+
+        Conversation: {delimiter} {conversation} {delimiter}
+
+        ------------------------
+        Question: {delimiter} {query} {delimiter}
+        Answer: {delimiter} {answer} {delimiter}        
+    *NOTE :
+    *Response always in above JSON format.
+    *Follow-up question always in above topics only.
+    *Don't include anything like poor, average or good student
+        
+        ''')
+
     def format_history(self, history):
         try:
-            s = ''
-            if len(history) > 5:
-                for i in history[-5:-1]:
-                    s += f"Question: {i['question']}" + '\n'
-                    s += f"Student Answer: {i['answer']}" + '\n'
-            else:
-                for i in history[:-1]:
-                    s += f"Question: {i['question']}" + '\n'
-                    s += f"Student Answer: {i['answer']}" + '\n'
-            logger.info("Formatted conversation history successfully.")
-            return s.strip()
+            s = self.context.render(history[:-1], "Question", "Student Answer")
+            logger.debug("Formatted conversation history successfully.")
+            return s
         except Exception as e:
             logger.error(f"Error formatting history: {str(e)}")
             raise Exception("Error formatting history")
 
+    def _build_messages(self, query, answer, student_level, difficulty_level, learning_goals, history=None):
+        if history:
+            if len(history) > 1:
+                his = self.format_history(history)
+            else:
+                his=""
+            # his = self.format_history(history)
+        else:
+            his = ''
+        topics = ",".join(learning_goals)
+        logger.debug("Building prompt for query: {}", query)
+        
+        # Define the conversation history
+        conversation_history = [
+            {"role": "system", "content": self.SYSTEM_PROMPT}
+        ]
+        interactions = []
+
+        interactions.append(("user", query))
+
+        # Construct user_prompt
+        delimiter = "==="  # Replace with your desired delimiter
+        user_prompt = self.USER_PROMPT.render(
+            student_level=student_level,
+            difficulty_level=difficulty_level,
+            topics=topics,
+            conversation=his,
+            query=query,
+            answer=answer,
+            delimiter=delimiter
+        )
+
+        interactions.append(("user", user_prompt))
+        messages = conversation_history + [{"role": role, "content": content} for role, content in interactions]
+        logger.opt(lazy=True).debug("QnA prompt: about {} tokens, context {} tokens", lambda: sum(count_tokens(m['content']) for m in messages), lambda: count_tokens(his))
+        return messages
+
+    def _parse_answer(self, ans):
+        json_answer = ans.choices[0].message.content
+        json_answer=json_answer.replace("`","").replace("json","")
+        return json.loads(json_answer)
+
     def student_qna_fun(self, query,answer, student_level,difficulty_level,learning_goals, history=None):
-        response = {"follow_up_question":"OpenAI Not Responding"}
-        for delay_secs in (2**x for x in range(0, 3)):
-            try:
-                if history:
-                    if len(history) > 1:
-                        his = self.format_history(history)
-                    else:
-                        his=""
-                    # his = self.format_history(history)
-                else:
-                    his = ''
-                topics = ",".join(learning_goals)
-                res = self._system_prompt(his,student_level,difficulty_level,topics)
-                logger.info(f"Generated system prompt for query: {query}")
-                
-                # Define the conversation history
-                conversation_history = [
-                    {"role": "system", "content": res}
-                ]
-                interactions = []
-
-                interactions.append(("user", query))
-
-                # Construct user_prompt
-                delimiter = "==="  # Replace with your desired delimiter
-                user_prompt = f'''
-
-                Conversation: {delimiter} {his} {delimiter}
-
-                ------------------------
-                Question: {delimiter} {query} {delimiter}
-                Answer: {delimiter} {answer} {delimiter}        
-    *NOTE :
-    *Response always in above JSON format.
-    *Follow-up question always in above topics only.
-    *Don't include anything like poor, average or good student
-                
-                '''
-
-                interactions.append(("user", user_prompt))
-
-                logger.info("Sending API request to OpenAI...")
-                ans = self.openai_client.chat.completions.create(
-                    model=self.gpt_engine_name,
-                    messages=conversation_history + [{"role": role, "content": content} for role, content in interactions],
-                    max_tokens=500
-                )
-                
-                json_answer = ans.choices[0].message.content
-                json_answer=json_answer.replace("`","").replace("json","")
-                response=json.loads(json_answer)
-                break
-            except Exception as e:
-                time.sleep(delay_secs)
-                logger.error(f"Error generating QnA response: {str(e)}")
-                continue
-        return response
\ No newline at end of file
+        messages = self._build_messages(query, answer, student_level, difficulty_level, learning_goals, history)
+        logger.debug("Sending API request to OpenAI...")
+        return self.caller.call(
+            lambda timeout: self.openai_client.chat.completions.create(
+                model=self.gpt_engine_name,
+                messages=messages,
+                max_tokens=500,
+                timeout=timeout
+            ),
+            self._parse_answer,
+            {"follow_up_question":"OpenAI Not Responding"},
+            name="QnA response"
+        )
+
+class AsyncStudentQnA(StudentQnA):
+    """StudentQnA on the async OpenAI client, so waiting for the model does not block the event loop."""
+
+    asynchronous = True
+
+    async def student_qna_fun(self, query,answer, student_level,difficulty_level,learning_goals, history=None):
+        messages = self._build_messages(query, answer, student_level, difficulty_level, learning_goals, history)
+        logger.debug("Sending API request to OpenAI...")
+        return await self.caller.acall(
+            lambda timeout: self.openai_client.chat.completions.create(
+                model=self.gpt_engine_name,
+                messages=messages,
+                max_tokens=500,
+                timeout=timeout
+            ),
+            self._parse_answer,
+            {"follow_up_question":"OpenAI Not Responding"},
+            name="QnA response"
+        )
+
+    async def student_qna_stream(self, query,answer, student_level,difficulty_level,learning_goals, history=None):
+        """Yields the text of the answer as the model produces it."""
+        messages = self._build_messages(query, answer, student_level, difficulty_level, learning_goals, history)
+        logger.debug("Sending streaming API request to OpenAI...")
+        stream = self.caller.astream(
+            lambda timeout: self.openai_client.chat.completions.create(
+                model=self.gpt_engine_name,
+                messages=messages,
+                max_tokens=500,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout
+            ),
+            name="QnA response stream"
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
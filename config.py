@@ -1,13 +1,64 @@
 import os
 
-os.environ["OPENAI_TYPE"] = "azure_openai"
-os.environ["AZURE_OPENAI_API_KEY"] = "Azure OpenAI key" #Replace Azure API KEY
-os.environ["AZURE_OPENAI_API_BASE"] = "Azure Endpoint" #Replace Azure ENDPOINT/BASE
-os.environ["AZURE_OPENAI_API_VERSION"] = "2023-07-01-preview"
-os.environ["GPT4_MODEL"] = "gpt-4o" #Recommend GPT 4o model for best results
+# Defaults for the variables that are not set in the environment, e.g. by the load test.
+os.environ.setdefault("OPENAI_TYPE", "azure_openai")
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "Azure OpenAI key") #Replace Azure API KEY
+os.environ.setdefault("AZURE_OPENAI_API_BASE", "Azure Endpoint") #Replace Azure ENDPOINT/BASE
+os.environ.setdefault("AZURE_OPENAI_API_VERSION", "2023-07-01-preview")
+os.environ.setdefault("GPT4_MODEL", "gpt-4o") #Recommend GPT 4o model for best results
 
 openai_type = os.getenv("OPENAI_TYPE")
 api_key = os.getenv("AZURE_OPENAI_API_KEY")
 azure_endpoint = os.getenv("AZURE_OPENAI_API_BASE")
 api_version = os.getenv("AZURE_OPENAI_API_VERSION")
-gpt4_model = os.getenv("GPT4_MODEL")
\ No newline at end of file
+gpt4_model = os.getenv("GPT4_MODEL")
+# Session storage: "json" rewrites student_sessions.json on every write,
+# "wal" appends one record per write to a log and compacts it periodically,
+# "sqlite" keeps sessions and interactions in indexed tables of session_db_path,
+# "sharded" keeps one JSON file per student under session_dir with per-student locks.
+session_store = os.getenv("SESSION_STORE", "json")
+session_file_path = os.getenv("SESSION_FILE_PATH", "student_sessions.json")
+wal_compact_every = int(os.getenv("SESSION_WAL_COMPACT_EVERY", "1000"))
+session_db_path = os.getenv("SESSION_DB_PATH", "student_sessions.db")
+session_dir = os.getenv("SESSION_DIR", "student_sessions")
+session_cache_size = int(os.getenv("SESSION_CACHE_SIZE", "128"))
+# Format of the session files: "json" (compact, orjson when installed), "json-pretty" or "msgpack".
+session_serializer = os.getenv("SESSION_SERIALIZER", "json")
+# Threads running the session store calls of the route handlers, off the event loop.
+session_io_workers = int(os.getenv("SESSION_IO_WORKERS", "4"))
+# Misconceptions are counted per normalized question in at most MISCONCEPTION_CAPACITY counters;
+# the analytics endpoints return MISCONCEPTIONS_PAGE_SIZE of them unless ?limit= is given.
+misconception_capacity = int(os.getenv("MISCONCEPTION_CAPACITY", "1000"))
+misconceptions_page_size = int(os.getenv("MISCONCEPTIONS_PAGE_SIZE", "20"))
+# Pre-generated first questions per (learning goals, student level, difficulty level), for the
+# QUESTION_POOL_MAX_KEYS most recently requested ones that were requested more than once in the
+# last QUESTION_POOL_KEY_TTL seconds. A depth of 0 disables the pool.
+question_pool_path = os.getenv("QUESTION_POOL_PATH", "question_pool.db")
+question_pool_depth = int(os.getenv("QUESTION_POOL_DEPTH", "3"))
+question_pool_refill_interval = int(os.getenv("QUESTION_POOL_REFILL_INTERVAL", "60"))
+question_pool_max_keys = int(os.getenv("QUESTION_POOL_MAX_KEYS", "100"))
+question_pool_key_ttl = int(os.getenv("QUESTION_POOL_KEY_TTL", "86400"))
+# OpenAI calls: overall deadline per request, attempts on retryable errors and circuit breaker.
+llm_deadline = float(os.getenv("LLM_DEADLINE_SECONDS", "20"))
+llm_max_attempts = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+llm_breaker_threshold = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+llm_breaker_reset = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+# Connection pool of the OpenAI client shared by all calls, created on the first call.
+llm_max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+llm_max_keepalive_connections = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+llm_keepalive_expiry = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "30"))
+llm_connect_timeout = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+llm_read_timeout = float(os.getenv("LLM_READ_TIMEOUT_SECONDS", "60"))
+llm_http2 = os.getenv("LLM_HTTP2", "1") == "1"
+# Conversation history sent to the model: the last turns verbatim, older ones summarized within a token budget.
+context_max_tokens = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+context_recent_turns = int(os.getenv("CONTEXT_RECENT_TURNS", "4"))
+# Logging: minimum level, per-module levels ("uitils.session=WARNING,main=DEBUG") and per-module
+# sampling of records below WARNING ("uitils.session=10" writes one in ten per call site).
+log_level = os.getenv("LOG_LEVEL", "DEBUG")
+log_module_levels = os.getenv("LOG_MODULE_LEVELS", "")
+log_sampling = os.getenv("LOG_SAMPLING", "")
+# Tracing: requests taking at least TRACE_SLOW_MS milliseconds are written with their spans
+# to trace_file, one JSON object per line. 0 disables the file; Server-Timing headers are always sent.
+trace_slow_ms = float(os.getenv("TRACE_SLOW_MS", "0"))
+trace_file = os.getenv("TRACE_FILE", "slow_traces.jsonl")
@@ -1,25 +1,130 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel, validator
-from typing import List, Dict
+from typing import List
 import uuid
 import time
-import numpy as np
-from collections import defaultdict
 import datetime
-from uitils.session import SessionManager
-from azure_openai.student_qna import StudentQnA
+from uitils.session_store import build_session_manager
+from uitils.async_session import AsyncSessionManager
+from uitils.session import VERSION_CONFLICT
+from uitils.question_pool import QuestionPool
+from uitils.streaming import JsonFieldStream, sse_event
+from uitils.memo import VersionedMemo
+from azure_openai.student_qna import AsyncStudentQnA
 from uitils.uitil import Uitils
-from azure_openai.recommendations import RecommendationsQuestions
+from azure_openai.recommendations import AsyncRecommendationsQuestions
+from azure_openai.resilience import ResilientCaller, CircuitBreaker
+from azure_openai.client import SharedOpenAIClient
+from azure_openai.context import ConversationContext
 from uitils.logger import custom_logger
+from uitils.metrics import REGISTRY
+from uitils import tracing
 from config import gpt4_model,api_key,api_version,openai_type,azure_endpoint
+from config import session_store,session_file_path,session_db_path,wal_compact_every,session_cache_size,session_dir,session_serializer,session_io_workers
+from config import misconception_capacity,misconceptions_page_size
+from config import question_pool_path,question_pool_depth,question_pool_refill_interval,question_pool_max_keys,question_pool_key_ttl
+from config import llm_deadline,llm_max_attempts,llm_breaker_threshold,llm_breaker_reset
+from config import llm_max_connections,llm_max_keepalive_connections,llm_keepalive_expiry,llm_connect_timeout,llm_read_timeout,llm_http2
+from config import context_max_tokens,context_recent_turns
+from config import trace_slow_ms,trace_file
 
 app = FastAPI()
 
-session_manager=SessionManager('student_sessions.json')
-student_inter=StudentQnA(gpt4_model, api_key, azure_endpoint, api_version, openai_type)
-recommend_question=RecommendationsQuestions(gpt4_model, api_key, azure_endpoint, api_version, openai_type)
+session_manager=build_session_manager(session_store, session_file_path, wal_compact_every=wal_compact_every, db_path=session_db_path, cache_size=session_cache_size, session_dir=session_dir, serializer=session_serializer,
+                                      misconception_capacity=misconception_capacity)
+# Record the session store calls of each request as "session" spans of its trace.
+tracing.trace_methods(session_manager, ["load_sessions", "save_sessions", "insert_session", "update_interaction", "update_session", "grade_and_advance",
+                                        "get_session", "session_details", "interaction_details", "student_details", "student_analytics", "aggregate_analytics"], "session")
+# The route handlers call the store through this facade, which runs it on a pool of I/O threads.
+async_sessions=AsyncSessionManager(session_manager, max_workers=session_io_workers)
+slow_traces=tracing.SlowTraceLog(trace_file, trace_slow_ms)
+llm_caller=ResilientCaller(max_attempts=llm_max_attempts, deadline=llm_deadline, breaker=CircuitBreaker(failure_threshold=llm_breaker_threshold, reset_timeout=llm_breaker_reset))
+# One connection pool for both classes, created on the first OpenAI call.
+llm_client=SharedOpenAIClient(api_key, azure_endpoint, api_version, openai_type, max_connections=llm_max_connections,
+                              max_keepalive_connections=llm_max_keepalive_connections, keepalive_expiry=llm_keepalive_expiry,
+                              connect_timeout=llm_connect_timeout, read_timeout=llm_read_timeout, http2=llm_http2)
+student_inter=AsyncStudentQnA(gpt4_model, api_key, azure_endpoint, api_version, openai_type, caller=llm_caller, client=llm_client,
+                             context=ConversationContext(max_tokens=context_max_tokens, recent_turns=context_recent_turns))
+recommend_question=AsyncRecommendationsQuestions(gpt4_model, api_key, azure_endpoint, api_version, openai_type, caller=llm_caller, client=llm_client,
+                                                 context=ConversationContext(max_tokens=context_max_tokens, recent_turns=context_recent_turns))
+question_pool=QuestionPool(recommend_question, question_pool_path, depth=question_pool_depth, refill_interval=question_pool_refill_interval,
+                           max_keys=question_pool_max_keys, key_ttl=question_pool_key_ttl)
+# Recommendations per (student_id, session_id), reused until the session's version changes.
+recommendations_memo=VersionedMemo()
 adapt_difficult_obj=Uitils()
 logger = custom_logger.get_logger()
+# Disable caching and proxy buffering so that events reach the client as they are produced.
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram("http_request_duration_seconds", "Time to produce the response headers, by route template and status.", ["method", "route", "status"])
+REGISTRY.gauge("session_cache_hit_ratio", "Hit ratio of the parsed session cache.", lambda: session_manager.cache_stats()["hit_ratio"])
+REGISTRY.gauge("question_pool_ready_questions", "Pre-generated questions waiting in the pool.", lambda: question_pool.stats()["ready_questions"])
+REGISTRY.gauge("recommendations_in_flight", "Recommendation calls currently running.", lambda: recommendations_memo.stats()["in_flight"])
+REGISTRY.gauge("session_io_queue_depth", "Session store calls waiting for a free I/O thread.", lambda: async_sessions.stats()["queued"])
+
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template rather than path, so that student and session ids do not create new series.
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(request.method, route.path if route else "unmatched", status).observe(time.perf_counter() - started)
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """
+    Traces the request: the session store, file, lock and OpenAI spans it records are
+    summed per name in a Server-Timing header, and slow traces are written to TRACE_FILE.
+    """
+    trace, token = tracing.start_trace(request.headers.get("x-trace-id"))
+    try:
+        response = await call_next(request)
+    finally:
+        tracing.end_trace(token)
+    response.headers["X-Trace-Id"] = trace.trace_id
+    response.headers["Server-Timing"] = trace.server_timing()
+    if slow_traces.enabled:
+        body = response.body_iterator
+
+        async def body_then_record():
+            # Streamed responses are still being produced here; record the trace once the body is sent.
+            try:
+                async for chunk in body:
+                    yield chunk
+            finally:
+                route = request.scope.get("route")
+                slow_traces.record(trace, method=request.method, path=request.url.path,
+                                   route=route.path if route else None, status=response.status_code)
+
+        response.body_iterator = body_then_record()
+    return response
+
+@app.on_event("startup")
+async def start_question_pool():
+    question_pool.start()
+
+@app.on_event("shutdown")
+async def stop_question_pool():
+    await question_pool.stop()
+
+@app.on_event("shutdown")
+async def stop_session_io():
+    async_sessions.shutdown()
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm_client.aclose()
+
+@app.on_event("shutdown")
+async def flush_logs():
+    # Log records are written by a background thread; wait for the queued ones.
+    custom_logger.flush()
 
 class LearningSession(BaseModel):
     student_id:str
@@ -48,7 +153,7 @@ async def create_session(session: LearningSession):
         learning_goals = session.learning_goals
         student_level = session.student_level
         
-        logger.debug(f"Received data - Student ID: {student_id}, Learning Goals: {learning_goals}, Level: {student_level}")
+        logger.debug("Received data - Student ID: {}, Learning Goals: {}, Level: {}", student_id, learning_goals, student_level)
         
         # Determine difficulty level based on student's level
         if student_level == "beginner":
@@ -62,7 +167,12 @@ async def create_session(session: LearningSession):
             raise HTTPException(status_code=400, detail="Invalid student level")
         random_uuid = uuid.uuid4()
         interaction_id = random_uuid.hex
-        recom_question=recommend_question.recommend_question(learning_goals, student_level,difficulty_level,history=None)
+        pooled_question=await question_pool.take(learning_goals, student_level, difficulty_level)
+        if pooled_question:
+            logger.debug("Using a pooled question for {}, {}, {}", learning_goals, student_level, difficulty_level)
+            recom_question={"question": pooled_question}
+        else:
+            recom_question=await recommend_question.recommend_question(learning_goals, student_level,difficulty_level,history=None)
         if recom_question["question"] != "OpenAI Not Responding":
             first_question=[{"interaction_id": interaction_id,
                     "question": recom_question["question"],
@@ -84,65 +194,82 @@ async def create_session(session: LearningSession):
                 "interactions": first_question
             }
             
-            logger.info(f"Session data prepared for student {student_id} with session ID {session_id}")
+            logger.debug("Session data prepared for student {} with session ID {}", student_id, session_id)
             
-            response = session_manager.insert_session(student_id, session_data_1)
+            response = await async_sessions.insert_session(student_id, session_data_1)
             # Log the successful session creation
-            logger.info(f"Session successfully created with session ID {session_id} for student {student_id}")
+            logger.info("Session successfully created with session ID {} for student {}", session_id, student_id)
             
             return {"message": response, "session_id": session_id,"interaction_id": interaction_id,"question": recom_question["question"]}
-        logger.error(f"Error occurred while calling OpenAI: {str(e)}")
+        logger.error(f"OpenAI did not return a first question for student {student_id}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
+    except HTTPException as http_error:
+        logger.error(f"HTTP error occurred: {http_error.detail}")
+        raise http_error
     except Exception as e:
         # Log the error if something goes wrong
         logger.error(f"Error occurred while creating session: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@app.post("/sessions/{student_id}/{session_id}/interactions")
-async def track_interaction(student_id: str, session_id: str, request: InteractionRequest):
+async def read_interaction(student_id: str, session_id: str, interaction_id: str):
+    """Returns the interaction and its session context, or raises the HTTP error to answer with."""
     try:
-        session = session_manager.get_session(student_id, session_id)
-        if not session:
+        interaction_q=await async_sessions.interaction_details(student_id, session_id,interaction_id)
+    except Exception as e:
+        logger.error(f"Error while reading history for student_id: {student_id}, session_id: {session_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error retrieving session history")
+    if not interaction_q:
+        if not await async_sessions.get_session(student_id, session_id):
             logger.warning(f"Session not found for student_id: {student_id}, session_id: {session_id}")
             raise HTTPException(status_code=404, detail="Session not found")
+        logger.warning(f"Interaction {interaction_id} not found for student_id: {student_id}, session_id: {session_id}")
+        raise HTTPException(status_code=404, detail="Interaction not found")
+    logger.debug("Session history read successfully for student_id: {}, session_id: {}", student_id, session_id)
+    return interaction_q
+
+async def record_graded_answer(student_id: str, session_id: str, interaction_q: dict, request: InteractionRequest, answer_time: str, response: dict):
+    """Stores the graded answer and the follow-up question, and returns the new interaction ID."""
+    updated_difficulty_level=adapt_difficult_obj.adapt_difficulty(response["confidence_level"], interaction_q["difficulty_level"])
+    student_response_time=adapt_difficult_obj.calculate_time_difference_in_minutes(answer_time,interaction_q["interaction_details"]["query_time"])
+
+    random_uuid = uuid.uuid4()
+    new_interaction_id = random_uuid.hex
+    status = await async_sessions.grade_and_advance(student_id, session_id,request.interaction_id,request.answer,updated_difficulty_level,student_response_time,response["confidence_level"],response["result"], {
+            "interaction_id": new_interaction_id,
+            "question": response["follow_up_question"],
+            "answer": "",
+            "answer_time":0,
+            "query_time": datetime.datetime.now().isoformat(),
+            "correct_answer": "not answered",
+            "confidence_level": 0
+        }, expected_version=interaction_q["version"])
+    if status == VERSION_CONFLICT:
+        # The session was graded by a concurrent request, possibly in another worker, after it was read.
+        raise HTTPException(status_code=409, detail="Session was updated by another request, please retry")
+    if status != "Updated successfully. 🙂":
+        raise Exception(status)
+    return new_interaction_id
+
+@app.post("/sessions/{student_id}/{session_id}/interactions")
+async def track_interaction(student_id: str, session_id: str, request: InteractionRequest):
+    try:
         answer_time=datetime.datetime.now().isoformat()
-        logger.debug(f"Session found for student_id: {student_id}, session_id: {session_id}")
-        try:
-            interaction_q=session_manager.interaction_details(student_id, session_id,request.interaction_id)
-            
-            logger.debug(f"Session history read successfully for student_id: {student_id}, session_id: {session_id}")
-        except Exception as e:
-            logger.error(f"Error while reading history for student_id: {student_id}, session_id: {session_id}: {str(e)}")
-            raise HTTPException(status_code=500, detail="Error retrieving session history")
+        interaction_q=await read_interaction(student_id, session_id, request.interaction_id)
         
-        logger.debug(f"Current difficulty level: {interaction_q["difficulty_level"]}")
+        logger.debug("Current difficulty level: {}", interaction_q['difficulty_level'])
         try:
-            response = student_inter.student_qna_fun(interaction_q["interaction_details"]["question"],request.answer, interaction_q["student_level"],interaction_q["difficulty_level"],interaction_q["learning_goals"], interaction_q["interactions"])
-            logger.debug(f"Answer generated: {response}")
+            response = await student_inter.student_qna_fun(interaction_q["interaction_details"]["question"],request.answer, interaction_q["student_level"],interaction_q["difficulty_level"],interaction_q["learning_goals"], interaction_q["interactions"])
+            logger.debug("Answer generated: {}", response)
             if response["follow_up_question"] == "OpenAI Not Responding":
-                logger.error(f"Error during Q&A processing for student_id: {student_id}, session_id: {session_id}: {str(e)}")
-                raise HTTPException(status_code=500, detail="Error during Q&A processing")
+                raise Exception("OpenAI Not Responding")
         except Exception as e:
             logger.error(f"Error during Q&A processing for student_id: {student_id}, session_id: {session_id}: {str(e)}")
             raise HTTPException(status_code=500, detail="Error during Q&A processing")
         
         try:
-            updated_difficulty_level=adapt_difficult_obj.adapt_difficulty(response["confidence_level"], interaction_q["difficulty_level"])
-            student_response_time=adapt_difficult_obj.calculate_time_difference_in_minutes(answer_time,interaction_q["interaction_details"]["query_time"])
-            session_manager.update_interaction(student_id, session_id,request.interaction_id,request.answer,updated_difficulty_level,student_response_time,response["confidence_level"],response["result"])
-
-            random_uuid = uuid.uuid4()
-            new_interaction_id = random_uuid.hex
-            session_manager.update_session(student_id, session_id, {
-                    "interaction_id": new_interaction_id,
-                    "question": response["follow_up_question"],
-                    "answer": "",
-                    "answer_time":0,
-                    "query_time": datetime.datetime.now().isoformat(),
-                    "correct_answer": "not answered",
-                    "confidence_level": 0
-                })
-        
+            new_interaction_id=await record_graded_answer(student_id, session_id, interaction_q, request, answer_time, response)
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error updating session for student_id: {student_id}, session_id: {session_id}: {str(e)}")
             raise HTTPException(status_code=500, detail="Error updating session")
@@ -156,21 +283,69 @@ async def track_interaction(student_id: str, session_id: str, request: Interacti
         logger.error(f"Unexpected error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+@app.post("/sessions/{student_id}/{session_id}/interactions/stream")
+async def track_interaction_stream(student_id: str, session_id: str, request: InteractionRequest):
+    """
+    Same as POST /sessions/{student_id}/{session_id}/interactions, but streams the
+    follow-up question as Server-Sent Events while the model generates it:
+    "delta" events carry new text of the follow-up question, "field" events a
+    completed field, and "done" the stored result. The graded answer is saved
+    once the stream completes; on failure an "error" event is sent instead.
+    """
+    try:
+        answer_time=datetime.datetime.now().isoformat()
+        interaction_q=await read_interaction(student_id, session_id, request.interaction_id)
+    except HTTPException as http_error:
+        logger.error(f"HTTP error occurred: {http_error.detail}")
+        raise http_error
+    except Exception as e:
+        logger.error(f"Unexpected error occurred: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    async def events():
+        parser = JsonFieldStream()
+        try:
+            async for text in student_inter.student_qna_stream(interaction_q["interaction_details"]["question"],request.answer, interaction_q["student_level"],interaction_q["difficulty_level"],interaction_q["learning_goals"], interaction_q["interactions"]):
+                for kind, field, value in parser.feed(text):
+                    if kind == "delta" and field == "follow_up_question":
+                        yield sse_event("delta", {"field": field, "text": value})
+                    elif kind == "field":
+                        yield sse_event("field", {"field": field, "value": value})
+            response = parser.result()
+            logger.debug("Answer generated: {}", response)
+        except Exception as e:
+            logger.error(f"Error during Q&A processing for student_id: {student_id}, session_id: {session_id}: {str(e)}")
+            yield sse_event("error", {"detail": "Error during Q&A processing"})
+            return
+        try:
+            new_interaction_id=await record_graded_answer(student_id, session_id, interaction_q, request, answer_time, response)
+        except HTTPException as http_error:
+            logger.warning(f"Answer not recorded for student_id: {student_id}, session_id: {session_id}: {http_error.detail}")
+            yield sse_event("error", {"detail": http_error.detail})
+            return
+        except Exception as e:
+            logger.error(f"Error updating session for student_id: {student_id}, session_id: {session_id}: {str(e)}")
+            yield sse_event("error", {"detail": "Error updating session"})
+            return
+        yield sse_event("done", {"interaction_id": new_interaction_id, "question": response["follow_up_question"], "result": response["result"], "confidence_level": response["confidence_level"]})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.get("/sessions/{student_id}/{session_id}")
 async def get_session_state(student_id: str, session_id: str):
     try:
-        logger.info(f"Received request to get session state for student_id: {student_id}, session_id: {session_id}")
+        logger.info("Received request to get session state for student_id: {}, session_id: {}", student_id, session_id)
         
-        session = session_manager.get_session(student_id, session_id)
+        session = await async_sessions.get_session(student_id, session_id)
         if not session:
             logger.warning(f"Session not found for student_id: {student_id}, session_id: {session_id}")
             raise HTTPException(status_code=404, detail="Session not found")
         
-        logger.debug(f"Session found for student_id: {student_id}, session_id: {session_id}")
+        logger.debug("Session found for student_id: {}, session_id: {}", student_id, session_id)
 
         try:
-            response = session_manager.session_details(student_id, session_id)
-            logger.debug(f"Session details retrieved successfully for student_id: {student_id}, session_id: {session_id}")
+            response = await async_sessions.session_details(student_id, session_id)
+            logger.debug("Session details retrieved successfully for student_id: {}, session_id: {}", student_id, session_id)
         except Exception as e:
             logger.error(f"Error retrieving session details for student_id: {student_id}, session_id: {session_id}: {str(e)}")
             raise HTTPException(status_code=500, detail="Error retrieving session details")
@@ -196,30 +371,35 @@ async def get_session_state(student_id: str, session_id: str):
 @app.get("/sessions/{student_id}/{session_id}/recommendations")
 async def get_recommendations(student_id: str, session_id: str):
     try:
-        logger.info(f"Received request to get recommendations for student_id: {student_id}, session_id: {session_id}")
-        session = session_manager.get_session(student_id, session_id)
+        logger.info("Received request to get recommendations for student_id: {}, session_id: {}", student_id, session_id)
+        session = await async_sessions.get_session(student_id, session_id)
         if not session:
             logger.warning(f"Session not found for student_id: {student_id}, session_id: {session_id}")
             raise HTTPException(status_code=404, detail="Session not found")
         
-        logger.debug(f"Session found for student_id: {student_id}, session_id: {session_id}")
+        logger.debug("Session found for student_id: {}, session_id: {}", student_id, session_id)
         try:
-            response = session_manager.session_details(student_id, session_id)
-            logger.debug(f"Session details retrieved successfully for student_id: {student_id}, session_id: {session_id}")
+            response = await async_sessions.session_details(student_id, session_id)
+            logger.debug("Session details retrieved successfully for student_id: {}, session_id: {}", student_id, session_id)
         except Exception as e:
             logger.error(f"Error retrieving session details for student_id: {student_id}, session_id: {session_id}: {str(e)}")
             raise HTTPException(status_code=500, detail="Error retrieving session details")
         
         try:
             
-            ans = recommend_question.recommend_next(
-                learning_goals=response["learning_goals"],
-                student_level=response["student_level"],
-                difficulty_level=response["difficulty_level"],
-                avg_confidence_level=response["avg_confidence_level"],
-                history=response["interactions"]
+            ans = await recommendations_memo.get_or_compute(
+                (student_id, session_id),
+                response["version"],
+                lambda: recommend_question.recommend_next(
+                    learning_goals=response["learning_goals"],
+                    student_level=response["student_level"],
+                    difficulty_level=response["difficulty_level"],
+                    avg_confidence_level=response["avg_confidence_level"],
+                    history=response["interactions"]
+                ),
+                cacheable=lambda ans: ans.get("question") != "OpenAI Not Responding"
             )
-            logger.debug(f"Recommendations generated for student_id: {student_id}, session_id: {session_id}")
+            logger.debug("Recommendations generated for student_id: {}, session_id: {}", student_id, session_id)
         except Exception as e:
             logger.error(f"Error generating recommendations for student_id: {student_id}, session_id: {session_id}: {str(e)}")
             raise HTTPException(status_code=500, detail="Error generating recommendations")
@@ -233,117 +413,100 @@ async def get_recommendations(student_id: str, session_id: str):
         logger.error(f"Unexpected error occurred while getting recommendations: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
     
+@app.get("/sessions/{student_id}/{session_id}/recommendations/stream")
+async def get_recommendations_stream(student_id: str, session_id: str):
+    """
+    Same as GET /sessions/{student_id}/{session_id}/recommendations, but streams
+    the answer as Server-Sent Events: "delta" events carry new text of
+    "next_steps" or "knowledge_gaps", "done" the complete recommendations.
+    """
+    logger.info("Received request to stream recommendations for student_id: {}, session_id: {}", student_id, session_id)
+    try:
+        response = await async_sessions.session_details(student_id, session_id)
+    except Exception as e:
+        logger.error(f"Error retrieving session details for student_id: {student_id}, session_id: {session_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error retrieving session details")
+    if not isinstance(response, dict):
+        logger.warning(f"Session not found for student_id: {student_id}, session_id: {session_id}")
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    async def events():
+        ans = recommendations_memo.peek((student_id, session_id), response["version"])
+        if ans is not None:
+            yield sse_event("done", {"recommended questions": ans})
+            return
+        parser = JsonFieldStream()
+        try:
+            async for text in recommend_question.recommend_next_stream(
+                learning_goals=response["learning_goals"],
+                student_level=response["student_level"],
+                difficulty_level=response["difficulty_level"],
+                avg_confidence_level=response["avg_confidence_level"],
+                history=response["interactions"]
+            ):
+                for kind, field, value in parser.feed(text):
+                    if kind == "delta":
+                        yield sse_event("delta", {"field": field, "text": value})
+            ans = parser.result()
+            logger.debug("Recommendations generated for student_id: {}, session_id: {}", student_id, session_id)
+        except Exception as e:
+            logger.error(f"Error generating recommendations for student_id: {student_id}, session_id: {session_id}: {str(e)}")
+            yield sse_event("error", {"detail": "Error generating recommendations"})
+            return
+        recommendations_memo.put((student_id, session_id), response["version"], ans)
+        yield sse_event("done", {"recommended questions": ans})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.get("/analytics/student/{student_id}")
-async def get_student_analytics(student_id: str):
+async def get_student_analytics(student_id: str, limit: int = Query(misconceptions_page_size, ge=1, le=misconception_capacity), offset: int = Query(0, ge=0)):
     try:
         
-        logger.info(f"Retrieving analytics for student {student_id}")
+        logger.info("Retrieving analytics for student {}", student_id)
         
-        student_sessions = session_manager.student_details(student_id)
+        student_analytics = await async_sessions.student_analytics(student_id, limit, offset)
         
-        if not student_sessions:
+        if not student_analytics:
             logger.warning(f"No sessions found for student {student_id}")
             raise HTTPException(status_code=404, detail="Student not found or no sessions available")
-        
-        total_sessions = len(student_sessions)
-        total_interactions = sum(len(session["interactions"]) for session in student_sessions)
-        
-        total_correct_answers = sum(1 for session in student_sessions for interaction in session["interactions"] if interaction["correct_answer"] == "correct")
-        total_incorrect_answers = sum(1 for session in student_sessions for interaction in session["interactions"] if interaction["correct_answer"] == "incorrect")
-        total_partially_correct_answers = sum(1 for session in student_sessions for interaction in session["interactions"] if interaction["correct_answer"] == "partially correct")
-        
-        avg_confidence_level = np.mean([interaction["confidence_level"] for session in student_sessions for interaction in session["interactions"]])
-        
-        mastery = defaultdict(int)
-        misconceptions = defaultdict(int)
-        
-        for session in student_sessions:
-            for interaction in session["interactions"]:
-                question = interaction["question"]
-    
-                if interaction["correct_answer"] != "correct":
-                    misconceptions[question] += 1
-                else:
-                    mastery[question] += 1
-        
-        avg_interaction_duration = np.mean([interaction["answer_time"] for session in student_sessions for interaction in session["interactions"]])
-    
-        student_analytics = {
-            "total_sessions": total_sessions,
-            "total_interactions": total_interactions,
-            "total_correct_answers": total_correct_answers,
-            "total_incorrect_answers": total_incorrect_answers,
-            "total_partially_correct_answers": total_partially_correct_answers,
-            "avg_confidence_level": avg_confidence_level,
-            "avg_interaction_duration": avg_interaction_duration,
-            "concept_mastery": dict(mastery),
-            "misconceptions": dict(misconceptions)
-        }
 
-        logger.info(f"Student analytics successfully retrieved for student {student_id}")
+        logger.info("Student analytics successfully retrieved for student {}", student_id)
         return student_analytics
 
+    except HTTPException as http_error:
+        logger.error(f"HTTP error occurred: {http_error.detail}")
+        raise http_error
     except Exception as e:
         logger.error(f"Error retrieving analytics for student {student_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 @app.get("/analytics/aggregate")
-async def get_aggregate_analytics():
+async def get_aggregate_analytics(limit: int = Query(misconceptions_page_size, ge=1, le=misconception_capacity), offset: int = Query(0, ge=0)):
     try:
        
         logger.info("Retrieving aggregate analytics for all students")
         
-        all_sessions = session_manager.all_details()
-        if not all_sessions:
+        aggregate_analytics = await async_sessions.aggregate_analytics(limit, offset)
+        if not aggregate_analytics:
             logger.warning("No sessions available for aggregate analytics")
             raise HTTPException(status_code=404, detail="No sessions found")
-        
-        
-        logger.info(f"all_sessions type: {type(all_sessions)}")
-        
-        total_sessions = 0
-        total_interactions = 0
-        total_confidence_levels = 0
-        total_answer_time = 0
-        common_misconceptions = defaultdict(int)
-        difficulty_progression = defaultdict(int)
-        student_count = len(all_sessions)
-        for student_id, student_sessions in all_sessions.items():
-            logger.info(f"Processing sessions for student {student_id}")
-            
-            for session in student_sessions:
-                total_sessions += 1
-                total_interactions += len(session["interactions"])
-                
-                
-                total_confidence_levels += sum(interaction["confidence_level"] for interaction in session["interactions"])
-                total_answer_time += sum(interaction["answer_time"] for interaction in session["interactions"])
-
-                
-                for interaction in session["interactions"]:
-                    if interaction["correct_answer"] != "correct":
-                        common_misconceptions[interaction["question"]] += 1
-                
-                # Track difficulty progression
-                difficulty_progression[session["difficulty_level"]] += 1
-        
-        
-        avg_confidence_level = total_confidence_levels / total_interactions if total_interactions > 0 else 0
-        avg_interaction_duration = total_answer_time / total_interactions if total_interactions > 0 else 0
-        
-        aggregate_analytics = {
-            "number_of_students": student_count,
-            "total_sessions": total_sessions,
-            "total_interactions": total_interactions,
-            "difficulty_progression": dict(difficulty_progression),
-            "avg_interaction_duration": avg_interaction_duration,
-            "avg_confidence_level": avg_confidence_level,
-            "common_misconceptions": dict(common_misconceptions)
-        }
 
         logger.info("Aggregate analytics successfully retrieved")
         return aggregate_analytics
 
+    except HTTPException as http_error:
+        logger.error(f"HTTP error occurred: {http_error.detail}")
+        raise http_error
     except Exception as e:
         logger.error(f"Error retrieving aggregate analytics: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@app.get("/monitoring")
+async def get_monitoring():
+    """Internal counters for monitoring the service."""
+    return {"session_cache": session_manager.cache_stats(), "question_pool": question_pool.stats(), "llm": llm_caller.stats(), "recommendations": recommendations_memo.stats(), "session_io": async_sessions.stats()}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Request, OpenAI and session store metrics in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,121 @@
+"""
+Benchmark of the session file serializers on a large synthetic session file.
+
+Measures the size of the encoded file and the dump/parse throughput of the
+legacy pretty-printed JSON, compact JSON with the stdlib encoder, compact JSON
+with orjson and MessagePack (the last two when installed).
+
+    python scripts/bench_serializers.py --students 2000 --interactions 30
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uitils import serializers
+
+def synthetic_sessions(students, sessions_per_student, interactions_per_session, seed=0):
+    rng = random.Random(seed)
+    results = ["correct", "incorrect", "partially correct"]
+    start = datetime.datetime(2025, 1, 1)
+    data = {}
+    for s in range(students):
+        student_sessions = {}
+        for _ in range(sessions_per_student):
+            session_id = uuid.UUID(int=rng.getrandbits(128)).hex
+            interactions = [{
+                "interaction_id": uuid.UUID(int=rng.getrandbits(128)).hex,
+                "question": f"Question {rng.randrange(500)}: explain how {rng.choice(['fractions', 'decimals', 'ratios'])} work with an example.",
+                "answer": "An answer written by the student " * rng.randrange(1, 4),
+                "answer_time": round(rng.uniform(0.1, 5), 3),
+                "query_time": (start + datetime.timedelta(seconds=rng.randrange(10**7))).isoformat(),
+                "correct_answer": rng.choice(results),
+                "confidence_level": rng.randrange(1, 6)
+            } for _ in range(interactions_per_session)]
+            student_sessions[session_id] = {
+                "session_id": session_id,
+                "student_id": f"student-{s}",
+                "student_level": "beginner",
+                "difficulty_level": rng.choice(["easy", "medium", "hard"]),
+                "learning_goals": ["math"],
+                "session_state": "in-progress",
+                "session_progress": interactions_per_session,
+                "session_start_time": start.isoformat(),
+                "interactions": interactions,
+                "version": interactions_per_session
+            }
+        data[f"student-{s}"] = student_sessions
+    return data
+
+class StdlibCompactJson:
+    name = "json (stdlib, compact)"
+
+    def dumps(self, data):
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def loads(self, content):
+        return json.loads(content)
+
+def candidates():
+    legacy = serializers.JsonSerializer(indent=4)
+    legacy.name = "json-pretty (legacy)"
+    found = [legacy, StdlibCompactJson()]
+    if serializers.orjson is not None:
+        compact = serializers.JsonSerializer()
+        compact.name = "json (orjson)"
+        found.append(compact)
+    if serializers.msgpack is not None:
+        found.append(serializers.MsgpackSerializer())
+    return found
+
+def best_of(repeat, function):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, default=3, help="sessions per student")
+    parser.add_argument("--interactions", type=int, default=30, help="interactions per session")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the best one is reported")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    data = synthetic_sessions(args.students, args.sessions, args.interactions)
+    results = []
+    for serializer in candidates():
+        dump_time, content = best_of(args.repeat, lambda: serializer.dumps(data))
+        load_time, loaded = best_of(args.repeat, lambda: serializer.loads(content))
+        assert loaded == data, f"{serializer.name} does not round-trip the sessions"
+        size_mb = len(content) / 2**20
+        results.append({
+            "serializer": serializer.name,
+            "size_mb": round(size_mb, 2),
+            "dump_seconds": round(dump_time, 4),
+            "load_seconds": round(load_time, 4),
+            "dump_mb_per_s": round(size_mb / dump_time, 1),
+            "load_mb_per_s": round(size_mb / load_time, 1)
+        })
+
+    interactions = args.students * args.sessions * args.interactions
+    print(f"{args.students} students, {interactions} interactions (best of {args.repeat})")
+    print(f"{'serializer':<24}{'size MB':>10}{'dump s':>10}{'load s':>10}{'dump MB/s':>12}{'load MB/s':>12}")
+    for r in results:
+        print(f"{r['serializer']:<24}{r['size_mb']:>10}{r['dump_seconds']:>10}{r['load_seconds']:>10}{r['dump_mb_per_s']:>12}{r['load_mb_per_s']:>12}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"students": args.students, "interactions": interactions, "results": results}, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Micro-benchmarks of the SessionManager methods and the analytics computations.
+
+For every store and dataset size, generates a synthetic session file with
+that many students, opens the store on it (the sqlite and sharded stores
+import it, as on a first start) and times:
+
+  * load_sessions, with an empty cache (cold) and with a warm cache (the wal
+    store keeps its sessions in memory, so both are a dictionary lookup),
+  * insert_session, update_interaction, session_details and student_details
+    on random students,
+  * all_details,
+  * student_analytics, aggregate_analytics (the materialized aggregate) and
+    rebuild_aggregate (the full computation behind it).
+
+Each operation is run --repeat times (--repeat-store for the ones reading the
+whole store); the report gives the median, min and max, and the peak memory
+allocated by one run of the operation, measured separately with tracemalloc.
+
+    python scripts/bench_sessions.py --students 1000,10000,100000 --stores json,sqlite --json bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+# Per-operation info records would be part of the measured time.
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from bench_serializers import synthetic_sessions
+from uitils.serializers import get_serializer, write_file
+from uitils.session_store import build_session_manager
+
+def open_store(store, data_dir, serializer):
+    return build_session_manager(
+        store, os.path.join(data_dir, "student_sessions.json"), db_path=os.path.join(data_dir, "student_sessions.db"),
+        session_dir=os.path.join(data_dir, "student_sessions"), serializer=serializer
+    )
+
+def new_session(student_id):
+    session_id = uuid.uuid4().hex
+    return {
+        "session_id": session_id,
+        "student_id": student_id,
+        "student_level": "beginner",
+        "difficulty_level": "easy",
+        "learning_goals": ["math"],
+        "session_state": "not started yet",
+        "session_progress": 0,
+        "session_start_time": datetime.datetime.now().isoformat(),
+        "interactions": [{
+            "interaction_id": uuid.uuid4().hex,
+            "question": "What is 3/4 + 1/8?",
+            "answer": "",
+            "answer_time": 0,
+            "query_time": datetime.datetime.now().isoformat(),
+            "correct_answer": "not answered",
+            "confidence_level": 0
+        }]
+    }
+
+def operations(manager, targets, rng):
+    """Returns (name, function, reads the whole store) for every benchmarked operation."""
+    def target():
+        return rng.choice(targets)
+
+    def load_cold():
+        manager.cache.invalidate()
+        manager.load_sessions()
+
+    def insert():
+        student_id = target()[0]
+        manager.insert_session(student_id, new_session(student_id))
+
+    def update():
+        student_id, session_id, interaction_id = target()
+        manager.update_interaction(student_id, session_id, interaction_id, "benchmark answer", "medium", 0.5, 3, rng.choice(["correct", "incorrect"]))
+
+    return [
+        ("load_sessions (cold)", load_cold, True),
+        ("load_sessions (cached)", manager.load_sessions, True),
+        ("insert_session", insert, False),
+        ("update_interaction", update, False),
+        ("session_details", lambda: manager.session_details(*target()[:2]), False),
+        ("student_details", lambda: manager.student_details(target()[0]), False),
+        ("all_details", manager.all_details, True),
+        ("student_analytics", lambda: manager.student_analytics(target()[0]), False),
+        ("aggregate_analytics", manager.aggregate_analytics, False),
+        ("rebuild_aggregate", manager.rebuild_aggregate, True)
+    ]
+
+def measure(function, repeat, memory):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    result = {
+        "runs": repeat,
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3)
+    }
+    if memory:
+        tracemalloc.start()
+        function()
+        result["peak_alloc_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+    return result
+
+def prepare(students, args):
+    """Writes a synthetic session file. Returns its directory and (student, session, interaction) ids to work on."""
+    data_dir = tempfile.mkdtemp(prefix=f"bench_sessions_{students}_")
+    data = synthetic_sessions(students, args.sessions, args.interactions, seed=args.seed)
+    rng = random.Random(args.seed)
+    targets = []
+    for student_id in rng.sample(sorted(data), min(students, 1000)):
+        session = next(iter(data[student_id].values()))
+        targets.append((student_id, session["session_id"], rng.choice(session["interactions"])["interaction_id"]))
+    write_file(os.path.join(data_dir, "student_sessions.json"), data, get_serializer(args.serializer))
+    return data_dir, targets
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def list_of(kind):
+    return lambda value: [kind(v) for v in value.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=list_of(int), default=[1000, 10000, 100000], help="comma-separated dataset sizes")
+    parser.add_argument("--stores", type=list_of(str), default=["json", "wal", "sqlite", "sharded"], help="comma-separated session stores")
+    parser.add_argument("--sessions", type=int, default=2, help="sessions per student")
+    parser.add_argument("--interactions", type=int, default=10, help="interactions per session")
+    parser.add_argument("--serializer", default="json", choices=["json", "json-pretty", "msgpack"])
+    parser.add_argument("--repeat", type=int, default=50, help="runs of the per-student operations")
+    parser.add_argument("--repeat-store", type=int, default=3, help="runs of the operations reading the whole store")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc runs, which are slow on large stores")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep the generated data directories")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key != "json"},
+        "results": []
+    }
+    print(f"{'store':<9}{'students':>9}  {'operation':<24}{'median ms':>11}{'min ms':>10}{'max ms':>10}{'peak KB':>11}")
+    for students in args.students:
+        data_dir, targets = prepare(students, args)
+        try:
+            for store in args.stores:
+                store_dir = os.path.join(data_dir, store)
+                os.makedirs(store_dir)
+                shutil.copy(os.path.join(data_dir, "student_sessions.json"), store_dir)
+                started = time.perf_counter()
+                manager = open_store(store, store_dir, args.serializer)
+                manager.rebuild_aggregate()
+                open_seconds = time.perf_counter() - started
+                rng = random.Random(args.seed)
+                for name, function, whole_store in operations(manager, targets, rng):
+                    result = measure(function, args.repeat_store if whole_store else args.repeat, not args.no_memory)
+                    report["results"].append({"store": store, "students": students, "operation": name, **result})
+                    print(f"{store:<9}{students:>9}  {name:<24}{result['median_ms']:>11}{result['min_ms']:>10}{result['max_ms']:>10}"
+                          f"{result.get('peak_alloc_kb', '-')!s:>11}")
+                report["results"].append({"store": store, "students": students, "operation": "open and import", "runs": 1,
+                                          "median_ms": round(open_seconds * 1000, 3)})
+                del manager
+        finally:
+            if not args.keep:
+                shutil.rmtree(data_dir, ignore_errors=True)
+    # Peak resident memory of the whole run, in KB on Linux.
+    report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"peak resident memory: {report['max_rss_kb'] / 1024:.0f} MB")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Local stand-in for the OpenAI and Azure OpenAI chat completions API.
+
+Answers every chat completion with a canned JSON answer of the shape the
+prompt asks for (a question, a graded answer with a follow-up question, or
+next steps and knowledge gaps), after a configurable latency, and fails a
+configurable fraction of the calls with 429 or 503 so that the retries and
+the circuit breaker are exercised. Streaming requests are answered with
+chunks, as the real API does.
+
+Point the app at it with:
+
+    AZURE_OPENAI_API_BASE=http://127.0.0.1:8900 uvicorn main:app
+    python scripts/fake_openai.py --port 8900 --latency 0.5 --error-rate 0.02
+
+OPENAI_TYPE=openai with OPENAI_BASE_URL=http://127.0.0.1:8900/v1 works too.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CANNED_ANSWERS = {
+    "question": {"question": "What is 3/4 + 1/8? Explain how you found a common denominator."},
+    "grading": {"result": "correct", "confidence_level": 4,
+                "follow_up_question": "Well done! Now, what is 2/3 of 3/5, and how would you simplify the result?"},
+    "recommendations": {"next_steps": "Practice adding fractions with unlike denominators, then move on to multiplying fractions.",
+                        "knowledge_gaps": "Simplifying fractions after multiplying."}
+}
+
+def answer_kind(body):
+    """Recognizes what the prompt asks for from the JSON keys its instructions mention."""
+    text = " ".join(str(message.get("content", "")) for message in body.get("messages", []))
+    if "next_steps" in text:
+        return "recommendations"
+    if "follow_up_question" in text:
+        return "grading"
+    return "question"
+
+def create_app(latency=0.5, jitter=0.2, error_rate=0.0, answers=None, seed=None):
+    """
+    Builds the stand-in app. Each call waits latency seconds, varied by up to
+    ±jitter of it; error_rate is the fraction of calls answered with an error.
+    """
+    answers = {**CANNED_ANSWERS, **(answers or {})}
+    rng = random.Random(seed)
+    stats = {"calls": 0, "errors": 0, "streams": 0}
+    app = FastAPI()
+
+    def delay():
+        return max(0.0, latency * (1 + rng.uniform(-jitter, jitter)))
+
+    async def chat_completions(request: Request, deployment=None):
+        body = await request.json()
+        model = body.get("model") or deployment or "gpt-4o"
+        stats["calls"] += 1
+        if rng.random() < error_rate:
+            stats["errors"] += 1
+            await asyncio.sleep(delay() / 10)
+            status = rng.choice([429, 503])
+            return JSONResponse({"error": {"message": "Simulated failure", "type": "server_error", "code": str(status)}}, status_code=status)
+        content = json.dumps(answers[answer_kind(body)])
+        if body.get("stream"):
+            stats["streams"] += 1
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            return StreamingResponse(stream_chunks(body, content, model, delay(), include_usage), media_type="text/event-stream")
+        await asyncio.sleep(delay())
+        return {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": usage(body, content)
+        }
+
+    def usage(body, content):
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 4
+        completion_tokens = len(content) // 4
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens, "prompt_tokens_details": {"cached_tokens": 0}}
+
+    async def stream_chunks(body, content, model, total_delay, include_usage):
+        # A fifth of the latency before the first token, the rest spread over the chunks.
+        await asyncio.sleep(total_delay / 5)
+        pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+        for piece in pieces:
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(total_delay * 4 / 5 / len(pieces))
+        if include_usage:
+            # As the API does with stream_options={"include_usage": true}: a last chunk without choices.
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [], "usage": usage(body, content)}
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat_completions(request: Request):
+        return await chat_completions(request)
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def azure_chat_completions(deployment: str, request: Request):
+        return await chat_completions(request, deployment)
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency varies by up to this fraction of it")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failing with 429 or 503")
+    parser.add_argument("--answers", help="JSON file overriding the canned answers, keyed by question, grading or recommendations")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    answers = None
+    if args.answers:
+        with open(args.answers) as f:
+            answers = json.load(f)
+    app = create_app(args.latency, args.jitter, args.error_rate, answers, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+End-to-end load test of the API against a local OpenAI stand-in.
+
+For every combination of --students and --sessions, starts the stand-in
+(scripts/fake_openai.py) and the app with uvicorn on a fresh data directory,
+then runs one virtual user per student. Each virtual user creates its
+sessions one after the other and answers every question until the session
+is completed (100 interactions by default), polling the recommendations
+and reading its analytics along the way, as a student and their dashboard
+would. Reports p50/p95/p99 latency and requests per second per endpoint.
+
+    python scripts/load_test.py --students 10,50 --sessions 1 --latency 0.05 --json load.json
+
+The JSON report records the commit, the settings and the results, so runs of
+different commits with the same settings can be compared. --url runs the
+traffic against an app that is already running instead.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from bench_serializers import synthetic_sessions
+
+GOALS = [["fractions"], ["decimals", "percentages"], ["algebra"], ["geometry"]]
+LEVELS = ["beginner", "intermediate", "advanced"]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+class Recorder:
+    """Latencies and errors per endpoint, keyed by the route template."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def request(self, client, endpoint, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            return None
+        self.latencies.setdefault(endpoint, []).append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            return None
+        return response.json()
+
+    def summary(self, elapsed):
+        results = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies.get(endpoint, []))
+            results[endpoint] = {
+                "requests": len(latencies),
+                "errors": self.errors.get(endpoint, 0),
+                "rps": round(len(latencies) / elapsed, 2),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None
+            }
+        return results
+
+async def virtual_user(client, recorder, student_id, args, rng):
+    for _ in range(args.sessions_per_student):
+        created = await recorder.request(client, "POST /sessions", "POST", "/sessions", json={
+            "student_id": student_id, "student_level": rng.choice(LEVELS), "learning_goals": rng.choice(GOALS)
+        })
+        if created is None:
+            continue
+        session_id, interaction_id = created["session_id"], created["interaction_id"]
+        base = f"/sessions/{student_id}/{session_id}"
+        for answer in range(1, args.answers + 1):
+            await asyncio.sleep(rng.uniform(0, 2 * args.think_time))
+            graded = await recorder.request(
+                client, "POST /sessions/{student_id}/{session_id}/interactions", "POST", f"{base}/interactions",
+                json={"interaction_id": interaction_id, "answer": f"answer {answer}"}
+            )
+            if graded is None:
+                break
+            interaction_id = graded["message"]["interaction_id"]
+            if answer % args.poll_every == 0:
+                await recorder.request(client, "GET /sessions/{student_id}/{session_id}", "GET", base)
+                await recorder.request(client, "GET /sessions/{student_id}/{session_id}/recommendations", "GET", f"{base}/recommendations")
+            if answer % args.analytics_every == 0:
+                await recorder.request(client, "GET /analytics/student/{student_id}", "GET", f"/analytics/student/{student_id}")
+                if rng.random() < args.aggregate_fraction:
+                    await recorder.request(client, "GET /analytics/aggregate", "GET", "/analytics/aggregate")
+
+async def run_traffic(url, students, args):
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=students, max_keepalive_connections=students)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            virtual_user(client, recorder, f"load-student-{i}", args, random.Random(args.seed + i)) for i in range(students)
+        ])
+        elapsed = time.perf_counter() - started
+    return elapsed, recorder
+
+def wait_until_up(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+def start_servers(args, data_dir):
+    """Starts the OpenAI stand-in and the app. Returns the app URL and the processes to stop."""
+    fake_port, app_port = free_port(), free_port()
+    log = open(os.path.join(data_dir, "servers.log"), "w")
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(REPO, "scripts", "fake_openai.py"), "--port", str(fake_port),
+         "--latency", str(args.latency), "--error-rate", str(args.error_rate), "--seed", str(args.seed)],
+        stdout=log, stderr=subprocess.STDOUT
+    )
+    env = {
+        **os.environ,
+        "OPENAI_TYPE": "azure_openai",
+        "AZURE_OPENAI_API_BASE": f"http://127.0.0.1:{fake_port}",
+        "AZURE_OPENAI_API_KEY": "load-test",
+        "SESSION_STORE": args.store,
+        "QUESTION_POOL_DEPTH": str(args.question_pool_depth),
+        "LOG_LEVEL": "WARNING"
+    }
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO, "--port", str(app_port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=data_dir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    processes = [app, fake]
+    try:
+        wait_until_up(f"http://127.0.0.1:{fake_port}/stats", fake)
+        wait_until_up(f"http://127.0.0.1:{app_port}/monitoring", app)
+    except Exception:
+        stop(processes)
+        raise
+    return f"http://127.0.0.1:{app_port}", processes
+
+def stop(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def prepare_data_dir(args):
+    data_dir = tempfile.mkdtemp(prefix="load_test_")
+    # Existing students make the store as large as in production; the new sessions are added to them.
+    data = synthetic_sessions(args.preload_students, 2, 20, seed=args.seed) if args.preload_students else {}
+    with open(os.path.join(data_dir, "student_sessions.json"), "w") as f:
+        json.dump(data, f)
+    return data_dir
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(level, elapsed, results):
+    total = sum(r["requests"] for r in results.values())
+    print(f"\n{level['students']} students x {level['sessions_per_student']} sessions: {total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+    print(f"{'endpoint':<58}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for endpoint, r in results.items():
+        print(f"{endpoint:<58}{r['requests']:>9}{r['errors']:>8}{r['rps']:>8}{r['p50_ms']!s:>9}{r['p95_ms']!s:>9}{r['p99_ms']!s:>9}")
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int_list, default=[10, 50], help="comma-separated numbers of concurrent students")
+    parser.add_argument("--sessions", type=int_list, default=[1], help="comma-separated numbers of sessions per student")
+    parser.add_argument("--answers", type=int, default=100, help="answers per session; 100 completes a session")
+    parser.add_argument("--poll-every", type=int, default=5, help="read the session and its recommendations every N answers")
+    parser.add_argument("--analytics-every", type=int, default=20, help="read the student analytics every N answers")
+    parser.add_argument("--aggregate-fraction", type=float, default=0.1, help="fraction of the analytics reads that also read the aggregate")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds a student waits before answering")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per OpenAI call of the stand-in")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of OpenAI calls failing with 429 or 503")
+    parser.add_argument("--store", choices=["json", "wal", "sqlite", "sharded"], default="json")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers; the wal store supports one")
+    parser.add_argument("--preload-students", type=int, default=0, help="synthetic students in the store before the run")
+    parser.add_argument("--question-pool-depth", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="run against this already running app instead of starting one")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key != "json"},
+        "levels": []
+    }
+    for students in args.students:
+        for sessions in args.sessions:
+            args.sessions_per_student = sessions
+            processes, data_dir = [], None
+            if args.url:
+                url = args.url
+            else:
+                data_dir = prepare_data_dir(args)
+                url, processes = start_servers(args, data_dir)
+            try:
+                elapsed, recorder = asyncio.run(run_traffic(url, students, args))
+            finally:
+                stop(processes)
+            level = {"students": students, "sessions_per_student": sessions, "data_dir": data_dir,
+                     "elapsed_seconds": round(elapsed, 3), "results": recorder.summary(elapsed)}
+            level["requests_per_second"] = round(sum(r["requests"] for r in level["results"].values()) / elapsed, 2)
+            report["levels"].append(level)
+            print_results(level, elapsed, level["results"])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Stress test of the session stores under concurrent writers in several processes.
+
+Each process builds its own SessionManager on the same store, as uvicorn
+workers do, and runs threads that:
+
+  * append interactions to random students (update_session), and
+  * race to grade the pending interaction of a student (grade_and_advance with
+    the version they read), as concurrent answers to the same question do.
+
+Meanwhile one process drops the materialized aggregate and rebuilds it
+from the store --rebuilds times, as the first read after a restart does,
+and the log of aggregate deltas is compacted whenever it grows past
+--aggregate-compact-bytes.
+
+Questions are drawn from a skewed set, and answers graded correct,
+incorrect or partially correct at random, so that more questions are
+answered wrong than the misconception tracker has counters.
+
+Afterwards the store is checked: every appended interaction is present
+exactly once, no interaction was graded by two writers, and the materialized
+aggregate matches a rebuild from the store. Once the tracker has overflowed,
+its top misconceptions are checked against the exact counts instead: every
+question with more than 1/capacity of the wrong answers must be tracked,
+with a count no lower than its exact one.
+
+    python scripts/stress_sessions.py --store sharded --processes 4 --threads 4
+"""
+import argparse
+import collections
+import datetime
+import math
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uitils.analytics import MISCONCEPTION_RESULTS
+from uitils.session import VERSION_CONFLICT
+from uitils.session_store import build_session_manager
+
+def new_interaction(question):
+    return {
+        "interaction_id": uuid.uuid4().hex,
+        "question": question,
+        "answer": "",
+        "answer_time": 0,
+        "query_time": datetime.datetime.now().isoformat(),
+        "correct_answer": "not answered",
+        "confidence_level": 0
+    }
+
+def skewed_question(rng):
+    """A few questions are asked often and many rarely, as with generated questions."""
+    return f"question {int(rng.expovariate(0.1))}"
+
+def new_session(student_id):
+    return {
+        "session_id": "stress",
+        "student_id": student_id,
+        "student_level": "beginner",
+        "difficulty_level": "easy",
+        "learning_goals": ["stress"],
+        "session_state": "not started yet",
+        "session_progress": 0,
+        "session_start_time": datetime.datetime.now().isoformat(),
+        "interactions": [new_interaction("first question")]
+    }
+
+def open_store(args):
+    manager = build_session_manager(
+        args.store, os.path.join(args.dir, "sessions.json"),
+        db_path=os.path.join(args.dir, "sessions.db"), session_dir=os.path.join(args.dir, "sessions"),
+        misconception_capacity=args.misconception_capacity
+    )
+    # A small log is folded into the snapshot many times during the run.
+    manager.aggregate.compact_bytes = args.aggregate_compact_bytes
+    return manager
+
+def worker(args, worker_id, results):
+    manager = open_store(args)
+    rng = random.Random(worker_id)
+    appended, graded, conflicts = [], [], [0]
+
+    def run(thread_id):
+        for _ in range(args.operations):
+            student_id = f"student-{rng.randrange(args.students)}"
+            if rng.random() < 0.5:
+                interaction = new_interaction(skewed_question(rng))
+                manager.update_session(student_id, "stress", interaction)
+                appended.append(interaction["interaction_id"])
+                continue
+            session = manager.session_details(student_id, "stress")
+            pending = session["interactions"][-1]
+            follow_up = new_interaction(skewed_question(rng))
+            status = manager.grade_and_advance(
+                student_id, "stress", pending["interaction_id"], f"answer of {worker_id}/{thread_id}",
+                "medium", 0.1, 3, rng.choice(["correct", "incorrect", "partially correct"]), follow_up,
+                expected_version=session["version"]
+            )
+            if status == VERSION_CONFLICT:
+                conflicts[0] += 1
+            elif status == "Updated successfully. 🙂":
+                graded.append(follow_up["interaction_id"])
+
+    def rebuild():
+        for _ in range(args.rebuilds):
+            time.sleep(rng.uniform(0, 0.05))
+            manager.aggregate.invalidate()
+            manager.aggregate_analytics()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(args.threads)]
+    if worker_id == 0:
+        threads.append(threading.Thread(target=rebuild))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((appended, graded, conflicts[0]))
+
+def check_misconceptions(tracked, interactions, capacity):
+    """Returns the failures of the tracked top misconceptions against the exact counts of the stored interactions."""
+    exact = collections.Counter(i["question"] for i in interactions if i["correct_answer"] in MISCONCEPTION_RESULTS)
+    failures = []
+    for question, count in exact.items():
+        if count * capacity > sum(exact.values()) and tracked.get(question, 0) < count:
+            failures.append(f"{question!r} answered wrong {count} times but tracked with {tracked.get(question, 0)}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", choices=["json", "sharded", "sqlite"], default="sharded")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--students", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=50, help="operations per thread")
+    parser.add_argument("--rebuilds", type=int, default=5, help="aggregate rebuilds during the run")
+    parser.add_argument("--misconception-capacity", type=int, default=8, help="counters of the misconception tracker")
+    parser.add_argument("--aggregate-compact-bytes", type=int, default=4096, help="size of the aggregate delta log that triggers a compaction")
+    parser.add_argument("--dir", help="store directory (default: a new temporary directory)")
+    args = parser.parse_args()
+    args.dir = args.dir or tempfile.mkdtemp(prefix="stress_sessions_")
+
+    manager = open_store(args)
+    for i in range(args.students):
+        manager.insert_session(f"student-{i}", new_session(f"student-{i}"))
+    manager.rebuild_aggregate()
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(args, i, results)) for i in range(args.processes)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    appended = [i for outcome in outcomes for i in outcome[0]]
+    graded = [i for outcome in outcomes for i in outcome[1]]
+    conflicts = sum(outcome[2] for outcome in outcomes)
+
+    manager = open_store(args)
+    sessions = manager.load_sessions()
+    interactions = [i for student in sessions.values() for i in student["stress"]["interactions"]]
+    stored_ids = [i["interaction_id"] for i in interactions]
+    graded_count = sum(1 for i in interactions if i["correct_answer"] != "not answered")
+    expected = args.students + len(appended) + len(graded)
+
+    failures = []
+    if len(stored_ids) != expected:
+        failures.append(f"{expected} interactions expected, {len(stored_ids)} stored")
+    if len(set(stored_ids)) != len(stored_ids):
+        failures.append("duplicated interaction ids")
+    missing = set(appended + graded) - set(stored_ids)
+    if missing:
+        failures.append(f"{len(missing)} written interactions are missing")
+    if graded_count != len(graded):
+        failures.append(f"{len(graded)} answers recorded but {graded_count} interactions graded")
+    aggregate = manager.aggregate_analytics()
+    manager.rebuild_aggregate()
+    rebuilt = manager.aggregate_analytics()
+    wrong_questions = {i["question"] for i in interactions if i["correct_answer"] in MISCONCEPTION_RESULTS}
+    overflowed = len(wrong_questions) > args.misconception_capacity
+    if overflowed:
+        # Which rare questions remain tracked depends on the order of the updates.
+        failures += check_misconceptions(aggregate["common_misconceptions"], interactions, args.misconception_capacity)
+        failures += check_misconceptions(rebuilt["common_misconceptions"], interactions, args.misconception_capacity)
+    # Running float sums depend on the order of the updates: compare them with a tolerance.
+    differing = [
+        key for key in rebuilt
+        if not (overflowed and key == "common_misconceptions")
+        and not (math.isclose(aggregate[key], rebuilt[key]) if isinstance(rebuilt[key], float) else aggregate.get(key) == rebuilt[key])
+    ]
+    if differing:
+        failures.append(f"materialized aggregate differs from a rebuild in {', '.join(differing)}")
+
+    operations = args.processes * args.threads * args.operations
+    print(f"store={args.store} dir={args.dir}")
+    print(f"{operations} operations in {elapsed:.2f}s ({operations / elapsed:.0f}/s): "
+          f"{len(appended)} appends, {len(graded)} graded, {conflicts} version conflicts, "
+          f"{len(wrong_questions)} questions answered wrong for {args.misconception_capacity} misconception counters")
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print(f"OK: {len(stored_ids)} interactions stored, no lost or duplicated updates")
+
+if __name__ == "__main__":
+    main()
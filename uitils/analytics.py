@@ -0,0 +1,483 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import uuid
+import numpy as np
+from uitils.file_lock import SharedFileLock, file_signature
+from uitils.logger import custom_logger
+
+logger = custom_logger.get_logger()
+
+# int8 codes of the grading results; everything else (e.g. "not answered") is OTHER.
+CORRECT, INCORRECT, PARTIALLY_CORRECT, OTHER = 0, 1, 2, 3
+RESULT_CODES = {"correct": CORRECT, "incorrect": INCORRECT, "partially correct": PARTIALLY_CORRECT}
+
+# Grading results counted as misconceptions; pending ("not answered") questions are not.
+MISCONCEPTION_RESULTS = ("incorrect", "partially correct")
+
+def normalize_question(question):
+    """
+    Returns the key misconceptions about a question are counted under: case, spacing
+    and surrounding punctuation are ignored, so "What is 3/4 + 1/8?" and
+    "what is 3/4  + 1/8" count as the same question.
+    """
+    return " ".join(question.casefold().split()).strip(" .?!:;,'\"")
+
+def question_key(question):
+    """Returns the key misconceptions about a question are counted under: a short hash of its normalized form."""
+    return hashlib.blake2b(normalize_question(question).encode("utf-8"), digest_size=8).hexdigest()
+
+def rank_misconceptions(counts, limit=None, offset=0):
+    """
+    Groups exact (question, count) pairs by normalized question and returns
+    ({question: count} ranked offset to offset + limit, most frequent first,
+    number of distinct questions).
+    """
+    grouped = {}
+    for question, count in counts:
+        entry = grouped.setdefault(normalize_question(question), [0, question])
+        entry[0] += count
+        entry[1] = min(entry[1], question)
+    ranked = sorted(grouped.values(), key=lambda entry: (-entry[0], entry[1]))
+    page = ranked[offset:offset + limit if limit is not None else None]
+    return {question: count for count, question in page}, len(grouped)
+
+class MisconceptionTracker:
+    """
+    Most frequent misconceptions in at most `capacity` counters (Space-Saving algorithm).
+
+    Wrong answers are counted per normalized question. Until `capacity` questions
+    are tracked the counts are exact; after that, a new question takes the place
+    of one with the smallest count and starts from it, so a count overstates
+    by at most its error (the count it started from), and any question with more
+    than 1/capacity of the wrong answers is always tracked. Counts only grow:
+    Space-Saving cannot take answers back once questions have been evicted.
+
+    The counters are kept in buckets of equal count (stream-summary), so that
+    counting an answer and evicting a question both take constant time.
+    `counters` maps the question_key to [count, error] and `questions` maps it
+    to the wording shown: the first one in alphabetical order, so that it does
+    not depend on the order of updates.
+    """
+
+    def __init__(self, capacity=1000, counters=None, questions=None):
+        self.capacity = capacity
+        self.counters = {}
+        self.questions = dict(questions or {})
+        # count -> {key: None}, the keys of the counters with that count.
+        self._buckets = {}
+        for key, (count, error) in (counters or {}).items():
+            self.counters[key] = [count, error]
+            self._buckets.setdefault(count, {})[key] = None
+        self._min = min(self._buckets) if self._buckets else 0
+
+    @classmethod
+    def from_counts(cls, counts, capacity=1000):
+        """Builds the tracker from exact (question, count) pairs, keeping the `capacity` most frequent questions."""
+        counters, questions = {}, {}
+        for question, count in counts:
+            key = question_key(question)
+            counters[key] = [counters.get(key, [0])[0] + count, 0]
+            questions[key] = min(questions.get(key, question), question)
+        top = sorted(counters, key=lambda key: (-counters[key][0], questions[key]))[:capacity]
+        return cls(capacity, {key: counters[key] for key in top}, {key: questions[key] for key in top})
+
+    def __len__(self):
+        return len(self.counters)
+
+    def _unlink(self, key, count):
+        bucket = self._buckets[count]
+        if key is None:
+            # Any counter with the smallest count can be evicted; popitem takes the last in constant time.
+            key = bucket.popitem()[0]
+        else:
+            del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+            if count == self._min:
+                # Counts grow by one, and the key moves to count + 1 right after.
+                self._min = count + 1
+        return key
+
+    def add(self, question):
+        """Counts one more wrong answer to question."""
+        if self.capacity <= 0:
+            return
+        key = question_key(question)
+        entry = self.counters.get(key)
+        if entry is not None:
+            self._unlink(key, entry[0])
+            entry[0] += 1
+            self._buckets.setdefault(entry[0], {})[key] = None
+            self.questions[key] = min(self.questions[key], question)
+            return
+        floor = 0
+        if len(self.counters) >= self.capacity:
+            floor = self._min
+            evicted = self._unlink(None, floor)
+            del self.counters[evicted]
+            del self.questions[evicted]
+        else:
+            self._min = 1
+        self.counters[key] = [floor + 1, floor]
+        self._buckets.setdefault(floor + 1, {})[key] = None
+        self.questions[key] = question
+
+    def top(self, limit=None, offset=0):
+        """Returns {question: count} of the tracked questions ranked offset to offset + limit, most frequent first."""
+        ranked = sorted(self.counters, key=lambda key: (-self.counters[key][0], self.questions[key]))
+        page = ranked[offset:offset + limit if limit is not None else None]
+        return {self.questions[key]: self.counters[key][0] for key in page}
+
+def misconception_state(tracker):
+    """Returns the fields a MisconceptionTracker is stored under in the materialized aggregate."""
+    return {"misconception_counters": tracker.counters, "misconception_questions": tracker.questions}
+
+class AnalyticsEngine:
+    """
+    Columnar view of the interactions of one student or of the whole fleet.
+
+    The sessions are read once into NumPy arrays (confidence, answer time,
+    result code and question id); counts, means and per-question groupings
+    are then computed with vectorized operations.
+    """
+
+    def __init__(self, sessions):
+        confidence, answer_time, result, question = [], [], [], []
+        difficulty = []
+        question_ids = {}
+        for session in sessions:
+            difficulty.append(session["difficulty_level"])
+            for interaction in session["interactions"]:
+                confidence.append(interaction["confidence_level"])
+                answer_time.append(interaction["answer_time"])
+                result.append(RESULT_CODES.get(interaction["correct_answer"], OTHER))
+                question.append(question_ids.setdefault(interaction["question"], len(question_ids)))
+
+        self.session_count = len(difficulty)
+        self.questions = np.array(list(question_ids), dtype=object)
+        self.confidence = np.asarray(confidence, dtype=np.float64)
+        self.answer_time = np.asarray(answer_time, dtype=np.float64)
+        self.result = np.asarray(result, dtype=np.int8)
+        self.question = np.asarray(question, dtype=np.int64)
+        self.difficulty = np.asarray(difficulty, dtype=object)
+
+    def __len__(self):
+        return len(self.result)
+
+    def result_counts(self):
+        """Returns the number of interactions per result code, indexed by CORRECT, INCORRECT, ..."""
+        return np.bincount(self.result, minlength=OTHER + 1)
+
+    def question_counts(self, mask):
+        """Returns {question: number of interactions selected by mask}."""
+        counts = np.bincount(self.question[mask], minlength=len(self.questions))
+        asked = np.flatnonzero(counts)
+        return dict(zip(self.questions[asked].tolist(), counts[asked].tolist()))
+
+    def misconception_mask(self):
+        """Returns the mask of the interactions graded incorrect or partially correct."""
+        return (self.result == INCORRECT) | (self.result == PARTIALLY_CORRECT)
+
+    def difficulty_counts(self):
+        """Returns {difficulty level: number of sessions currently at that level}."""
+        if self.session_count == 0:
+            return {}
+        levels, counts = np.unique(self.difficulty.astype(str), return_counts=True)
+        return dict(zip(levels.tolist(), counts.tolist()))
+
+    def student_analytics(self, limit=None, offset=0):
+        """
+        Returns the /analytics/student response for the loaded sessions, with the
+        misconceptions ranked offset to offset + limit. One student's counts are exact.
+        """
+        counts = self.result_counts()
+        correct = self.result == CORRECT
+        misconceptions, misconceptions_total = rank_misconceptions(self.question_counts(self.misconception_mask()).items(), limit, offset)
+        return {
+            "total_sessions": self.session_count,
+            "total_interactions": len(self),
+            "total_correct_answers": int(counts[CORRECT]),
+            "total_incorrect_answers": int(counts[INCORRECT]),
+            "total_partially_correct_answers": int(counts[PARTIALLY_CORRECT]),
+            "avg_confidence_level": float(self.confidence.mean()) if len(self) else 0,
+            "avg_interaction_duration": float(self.answer_time.mean()) if len(self) else 0,
+            "concept_mastery": self.question_counts(correct),
+            "misconceptions": misconceptions,
+            "misconceptions_total": misconceptions_total
+        }
+
+    def aggregate_counters(self, misconception_capacity=1000):
+        """Returns the counters materialized by AggregateAnalytics, except the number of students."""
+        return {
+            "total_sessions": self.session_count,
+            "total_interactions": len(self),
+            "confidence_sum": float(self.confidence.sum()),
+            "answer_time_sum": float(self.answer_time.sum()),
+            "difficulty_progression": self.difficulty_counts(),
+            **misconception_state(MisconceptionTracker.from_counts(self.question_counts(self.misconception_mask()).items(), misconception_capacity))
+        }
+
+class AggregateAnalytics:
+    """
+    Materialized fleet-wide analytics, updated incrementally as sessions change.
+
+    The counters are stored in a snapshot file next to the session store and a
+    log of deltas: a mutation appends one short line with what it changed to
+    the log, and never rewrites the snapshot, so its cost does not depend on
+    the size of the counters. Each process keeps the counters in memory and
+    reads only the lines appended since its last read. Once the log is larger
+    than `compact_bytes` it is folded into a new snapshot, which starts a new
+    log. /analytics/aggregate is served without reading any session;
+    `SessionManager.rebuild_aggregate` recomputes the counters from the store.
+
+    Appends hold a shared file lock, so writers in different processes do not
+    wait for one another; compactions, rebuilds and invalidations hold it
+    exclusively. Misconceptions are kept in a MisconceptionTracker of
+    misconception_capacity counters, so the snapshot does not grow with the
+    number of distinct questions.
+    """
+
+    def __init__(self, path, misconception_capacity=1000, compact_bytes=1 << 20):
+        self.path = path
+        self.misconception_capacity = misconception_capacity
+        self.compact_bytes = compact_bytes
+        self.data = None
+        self.misconceptions = None
+        self._signature = None
+        self._log_path = None
+        self._log_offset = 0
+        self._lock = SharedFileLock(f"{path}.lock")
+        # Guards the in-memory counters, which the threads holding the shared lock all update.
+        self._state_lock = threading.Lock()
+
+    def empty(self):
+        """Returns zeroed counters."""
+        return {
+            "number_of_students": 0,
+            "total_sessions": 0,
+            "total_interactions": 0,
+            "confidence_sum": 0,
+            "answer_time_sum": 0,
+            "difficulty_progression": {},
+            "misconception_counters": {},
+            "misconception_questions": {}
+        }
+
+    def _load(self):
+        """Loads the snapshot, without its log. Returns False if the counters are not materialized."""
+        self.data = None
+        self.misconceptions = None
+        self._signature = None
+        self._log_path = None
+        try:
+            signature = file_signature(self.path)
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except json.JSONDecodeError as e:
+            logger.error(f"Error loading aggregate analytics from {self.path}: {str(e)}")
+            return False
+        if "log" not in data:
+            # Written before deltas were logged, when it was rewritten on every write; rebuild it.
+            return False
+        self._set(data)
+        self._signature = signature
+        return True
+
+    def _set(self, data):
+        self._log_path = f"{self.path}.{data.pop('log')}.log"
+        self._log_offset = 0
+        self.misconceptions = MisconceptionTracker(
+            self.misconception_capacity, data.pop("misconception_counters"), data.pop("misconception_questions")
+        )
+        self.data = data
+
+    def _current(self):
+        """Reloads the snapshot if another process replaced it. Returns False if the counters are not materialized."""
+        if self.data is None or file_signature(self.path) != self._signature:
+            return self._load()
+        return True
+
+    def _catch_up(self):
+        """Applies the deltas appended to the log since the last read. Returns False if the counters are not materialized."""
+        if not self._current():
+            return False
+        try:
+            with open(self._log_path, 'rb') as f:
+                f.seek(self._log_offset)
+                appended = f.read()
+        except FileNotFoundError:
+            return True
+        # A line is complete once its newline is written; a line being appended is read next time.
+        complete = appended[:appended.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            try:
+                delta = json.loads(line)
+            except json.JSONDecodeError:
+                # Only a line torn by a crash mid-append can be unreadable.
+                logger.warning(f"Skipping unreadable delta in {self._log_path}")
+                continue
+            self._apply_delta(delta)
+        self._log_offset += len(complete)
+        return True
+
+    def _save(self, data):
+        """Writes the counters as the new snapshot, with a new, empty log."""
+        data = {**data, "log": uuid.uuid4().hex}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+        signature = file_signature(self.path)
+        previous_log = self._log_path
+        self._set(data)
+        self._signature = signature
+        if previous_log is not None:
+            # The deltas of the previous log are in the new snapshot.
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(previous_log)
+
+    def refresh(self):
+        """Brings the in-memory counters up to date with the snapshot and the log. Returns False if they are not materialized."""
+        with self._lock.shared(), self._state_lock:
+            return self._catch_up()
+
+    def reset(self, data):
+        """Replaces the counters, e.g. after a rebuild from the store."""
+        with self._lock.exclusive(), self._state_lock:
+            # The log of the replaced snapshot is dropped with it.
+            self._current()
+            self._save(dict(data))
+
+    def compact(self):
+        """Folds the log into a new snapshot, unless another process did it in the meantime."""
+        with self._lock.exclusive(), self._state_lock:
+            if not self._catch_up() or self._log_offset < self.compact_bytes:
+                return
+            self._save({**self.data, **misconception_state(self.misconceptions)})
+            logger.info("Aggregate analytics log compacted into {}", self.path)
+
+    def invalidate(self):
+        """Drops the counters so that the next read rebuilds them from the store."""
+        with self._lock.exclusive(), self._state_lock:
+            self._current()
+            for path in (self.path, self._log_path):
+                if path is not None:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+            self.data = None
+            self.misconceptions = None
+            self._signature = None
+            self._log_path = None
+
+    def _bump(self, counts, key, delta):
+        counts[key] = counts.get(key, 0) + delta
+        if counts[key] == 0:
+            del counts[key]
+
+    def _delta(self, changes):
+        """
+        Sums up the changes recorded by a SessionManager mutation:
+        ("session_added", session, new_student), ("interaction_added", interaction),
+        ("interaction_removed", interaction) and ("difficulty_changed", old, new).
+        """
+        delta = {
+            "number_of_students": 0,
+            "total_sessions": 0,
+            "total_interactions": 0,
+            "confidence_sum": 0,
+            "answer_time_sum": 0,
+            "difficulty_progression": {},
+            "misconceptions": []
+        }
+
+        def add_interaction(interaction, sign=1):
+            delta["total_interactions"] += sign
+            delta["confidence_sum"] += sign * interaction["confidence_level"]
+            delta["answer_time_sum"] += sign * interaction["answer_time"]
+            # Only graded wrong answers are tracked, and never removed: regrading a wrong
+            # answer keeps it in the counts until the next rebuild.
+            if sign > 0 and interaction["correct_answer"] in MISCONCEPTION_RESULTS:
+                delta["misconceptions"].append(interaction["question"])
+
+        for change in changes:
+            kind = change[0]
+            if kind == "session_added":
+                _, session, new_student = change
+                delta["number_of_students"] += int(new_student)
+                delta["total_sessions"] += 1
+                self._bump(delta["difficulty_progression"], session["difficulty_level"], 1)
+                for interaction in session["interactions"]:
+                    add_interaction(interaction)
+            elif kind == "interaction_added":
+                add_interaction(change[1])
+            elif kind == "interaction_removed":
+                add_interaction(change[1], sign=-1)
+            elif kind == "difficulty_changed":
+                _, old_level, new_level = change
+                self._bump(delta["difficulty_progression"], old_level, -1)
+                self._bump(delta["difficulty_progression"], new_level, 1)
+        return delta
+
+    def _apply_delta(self, delta):
+        data = self.data
+        for key in ("number_of_students", "total_sessions", "total_interactions", "confidence_sum", "answer_time_sum"):
+            data[key] += delta[key]
+        for level, count in delta["difficulty_progression"].items():
+            self._bump(data["difficulty_progression"], level, count)
+        for question in delta["misconceptions"]:
+            self.misconceptions.add(question)
+
+    def apply(self, changes):
+        """
+        Appends the changes recorded by a SessionManager mutation to the log, in
+        constant time. Compacts the log once it is larger than compact_bytes.
+        """
+        if not changes:
+            return
+        try:
+            line = (json.dumps(self._delta(changes)) + "\n").encode("utf-8")
+            with self._lock.shared():
+                with self._state_lock:
+                    if not self._current():
+                        # Not materialized yet; the first read rebuilds it from the store.
+                        return
+                    log_path = self._log_path
+                # One write with O_APPEND: lines appended by several processes never interleave.
+                fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line)
+                    log_size = os.lseek(fd, 0, os.SEEK_END)
+                finally:
+                    os.close(fd)
+            if log_size >= self.compact_bytes:
+                self.compact()
+        except Exception as e:
+            # Never fail a session write because of analytics; rebuild on the next read instead.
+            logger.error(f"Error updating aggregate analytics, it will be rebuilt: {str(e)}")
+            self.invalidate()
+
+    def summary(self, limit=None, offset=0):
+        """
+        Returns the /analytics/aggregate response, with the common misconceptions
+        ranked offset to offset + limit, or None if there are no sessions.
+        """
+        with self._state_lock:
+            data = self.data
+            if data is None or data["total_sessions"] == 0:
+                return None
+            total_interactions = data["total_interactions"]
+            return {
+                "number_of_students": data["number_of_students"],
+                "total_sessions": data["total_sessions"],
+                "total_interactions": total_interactions,
+                "difficulty_progression": dict(data["difficulty_progression"]),
+                "avg_interaction_duration": data["answer_time_sum"] / total_interactions if total_interactions > 0 else 0,
+                "avg_confidence_level": data["confidence_sum"] / total_interactions if total_interactions > 0 else 0,
+                "common_misconceptions": self.misconceptions.top(limit, offset),
+                "common_misconceptions_total": len(self.misconceptions)
+            }
@@ -0,0 +1,129 @@
+import asyncio
+import contextvars
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from uitils.metrics import REGISTRY
+from uitils.logger import custom_logger
+
+logger = custom_logger.get_logger()
+
+SESSION_IO_WAIT_SECONDS = REGISTRY.histogram("session_io_queue_wait_seconds", "Time session store calls wait for a free I/O thread.")
+
+class AsyncSessionManager:
+    """
+    Async facade over a SessionManager for the route handlers.
+
+    Store calls read and write files or the database synchronously; they run
+    on a dedicated pool of max_workers threads instead of the event loop, so a
+    slow save delays the requests waiting for the store but not the others.
+    Writes of one student run one at a time, in the order they were made.
+    Reads take no lock: the stores apply a write to a copy of the student's
+    sessions and publish it once saved, so a read sees the data from before
+    or after a write, never in between.
+    The number of calls waiting for a thread is reported by stats().
+    """
+
+    def __init__(self, manager, max_workers=4):
+        self.manager = manager
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="session-io")
+        # One asyncio lock per student with a write in progress or waiting; asyncio locks wake waiters in FIFO order.
+        self._write_locks = weakref.WeakValueDictionary()
+        self._stats_lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.max_queued = 0
+        logger.info("AsyncSessionManager initialized with {} I/O threads", max_workers)
+
+    def _submit(self, function, *args):
+        with self._stats_lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        # The copied context carries the request's trace into the thread.
+        context = contextvars.copy_context()
+        return asyncio.get_running_loop().run_in_executor(self._executor, self._run, context, time.perf_counter(), function, args)
+
+    def _run(self, context, submitted, function, args):
+        SESSION_IO_WAIT_SECONDS.observe(time.perf_counter() - submitted)
+        with self._stats_lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return context.run(function, *args)
+        finally:
+            with self._stats_lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def _read(self, function, *args):
+        return await self._submit(function, *args)
+
+    async def _write(self, student_id, function, *args):
+        lock = self._write_locks.get(student_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._write_locks[student_id] = lock
+        await lock.acquire()
+        try:
+            future = self._submit(function, *args)
+        except BaseException:
+            lock.release()
+            raise
+        # Released when the write has finished, even if the request was cancelled in the
+        # meantime, so that the next write of the student cannot overtake it.
+        future.add_done_callback(lambda _: lock.release())
+        return await asyncio.shield(future)
+
+    async def insert_session(self, student_id, session_data):
+        return await self._write(student_id, self.manager.insert_session, student_id, session_data)
+
+    async def update_interaction(self, student_id, session_id, interaction_id, answer, updated_difficulty_level, student_response_time, confidence_level, result):
+        return await self._write(student_id, self.manager.update_interaction, student_id, session_id, interaction_id, answer,
+                                 updated_difficulty_level, student_response_time, confidence_level, result)
+
+    async def update_session(self, student_id, session_id, new_interaction):
+        return await self._write(student_id, self.manager.update_session, student_id, session_id, new_interaction)
+
+    async def grade_and_advance(self, student_id, session_id, interaction_id, answer, updated_difficulty_level, student_response_time, confidence_level, result, new_interaction, expected_version=None):
+        return await self._write(student_id, self.manager.grade_and_advance, student_id, session_id, interaction_id, answer,
+                                 updated_difficulty_level, student_response_time, confidence_level, result, new_interaction, expected_version)
+
+    async def get_session(self, student_id, session_id):
+        return await self._read(self.manager.get_session, student_id, session_id)
+
+    async def session_details(self, student_id, session_id):
+        return await self._read(self.manager.session_details, student_id, session_id)
+
+    async def interaction_details(self, student_id, session_id, interaction_id):
+        return await self._read(self.manager.interaction_details, student_id, session_id, interaction_id)
+
+    async def student_details(self, student_id):
+        return await self._read(self.manager.student_details, student_id)
+
+    async def student_analytics(self, student_id, limit=None, offset=0):
+        return await self._read(self.manager.student_analytics, student_id, limit, offset)
+
+    async def aggregate_analytics(self, limit=None, offset=0):
+        return await self._read(self.manager.aggregate_analytics, limit, offset)
+
+    def cache_stats(self):
+        return self.manager.cache_stats()
+
+    def stats(self):
+        """Returns the I/O thread pool counters for monitoring: calls waiting for a thread, running and completed."""
+        with self._stats_lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "max_queued": self.max_queued,
+                "students_writing": len(self._write_locks)
+            }
+
+    def shutdown(self):
+        """Waits for the calls in progress and stops the I/O threads."""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU cache.
+
+    Each entry is stored with a signature (for files: modification time and
+    size). A lookup with a different signature counts as a miss and drops the
+    stale entry, so callers can validate entries against the file on disk.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, signature=None):
+        """Returns the cached value for key, or None if it is missing or its signature changed."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != signature:
+                del self._entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, signature=None):
+        """Stores value under key, evicting the least recently used entries beyond maxsize."""
+        with self._lock:
+            self._entries[key] = (signature, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Drops one entry, or every entry when key is None."""
+        with self._lock:
+            if key is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+            elif self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        """Returns the hit/miss counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
@@ -0,0 +1,184 @@
+import contextlib
+import os
+import threading
+from uitils.tracing import span
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows: the lock then only holds between the threads of one process.
+    fcntl = None
+
+def file_signature(path):
+    """
+    Returns (inode, mtime, size) of a file, or None if it does not exist.
+
+    Files are replaced by renaming a temporary file over them, which creates a
+    new inode, so a change made by another process is detected even when the
+    modification time and size are unchanged.
+    """
+    try:
+        stat = os.stat(path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        return None
+
+class StoreInUseError(RuntimeError):
+    """Raised when a store that a single process may open is already open in another one."""
+
+def lock_for_process(path):
+    """
+    Takes an exclusive flock on `path` without waiting and returns the open
+    file that holds it until it is closed. Raises StoreInUseError if another
+    process, or another open file of this one, holds it.
+    """
+    if fcntl is None:
+        return None
+    file = open(path, 'a')
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        file.close()
+        raise StoreInUseError(f"{path} is held by another process")
+    return file
+
+class FileLock:
+    """
+    Reentrant exclusive lock held between the threads of this process and,
+    through an flock on `path`, between processes.
+
+    Used to make read-modify-write cycles on shared files safe when the app
+    runs with several uvicorn workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._depth = 0
+        self._owner = None
+        self._file = None
+
+    def acquire(self):
+        if self._owner == threading.get_ident():
+            # Reentrant acquisition by the holder: it cannot wait.
+            self._depth += 1
+            return
+        with span("lock_wait"):
+            self._acquire()
+
+    def _acquire(self):
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            try:
+                self._file = open(self.path, 'a')
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._owner = threading.get_ident()
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        self._owner = None
+        if self._file is not None:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            finally:
+                self._file.close()
+                self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+class SharedFileLock:
+    """
+    Lock held in shared mode by any number of holders, or in exclusive mode by
+    one, between the threads of this process and, through an flock on `path`
+    taken by every holder, between processes.
+
+    Not reentrant. Exclusive requests are served before new shared ones, so
+    that a steady stream of shared holders does not starve them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._condition = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._exclusive_waiting = 0
+
+    @contextlib.contextmanager
+    def shared(self):
+        with span("lock_wait"):
+            with self._condition:
+                self._condition.wait_for(lambda: not self._exclusive and not self._exclusive_waiting)
+                self._shared += 1
+            try:
+                file = self._flock(fcntl.LOCK_SH if fcntl is not None else None)
+            except BaseException:
+                self._release(exclusive=False)
+                raise
+        try:
+            yield self
+        finally:
+            self._unlock(file)
+            self._release(exclusive=False)
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with span("lock_wait"):
+            with self._condition:
+                self._exclusive_waiting += 1
+                try:
+                    self._condition.wait_for(lambda: not self._exclusive and not self._shared)
+                finally:
+                    self._exclusive_waiting -= 1
+                self._exclusive = True
+            try:
+                file = self._flock(fcntl.LOCK_EX if fcntl is not None else None)
+            except BaseException:
+                self._release(exclusive=True)
+                raise
+        try:
+            yield self
+        finally:
+            self._unlock(file)
+            self._release(exclusive=True)
+
+    def _flock(self, operation):
+        if operation is None:
+            return None
+        # One open file per holder: flocks of different open files exclude each other, even within a process.
+        file = open(self.path, 'a')
+        try:
+            fcntl.flock(file, operation)
+        except BaseException:
+            file.close()
+            raise
+        return file
+
+    def _unlock(self, file):
+        if file is not None:
+            try:
+                fcntl.flock(file, fcntl.LOCK_UN)
+            finally:
+                file.close()
+
+    def _release(self, exclusive):
+        with self._condition:
+            if exclusive:
+                self._exclusive = False
+            else:
+                self._shared -= 1
+            self._condition.notify_all()
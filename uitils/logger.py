@@ -1,34 +1,164 @@
 from loguru import logger
+import atexit
+import copy
 import os
+import queue
+import sys
+import threading
+import time
 from datetime import datetime
+from config import log_level, log_module_levels, log_sampling
+
+def parse_module_settings(setting):
+    """Parses "module=value,module=value" settings, e.g. "uitils.session=WARNING,main=INFO"."""
+    values = {}
+    for item in setting.split(","):
+        if "=" in item:
+            module, value = item.split("=", 1)
+            values[module.strip()] = value.strip()
+    return values
+
+class ModuleFilter:
+    """
+    Loguru filter applying per-module minimum levels and sampling.
+
+    A module's setting applies to its submodules too, the most specific one
+    wins. A sampling rate of N keeps one in N records below WARNING per call
+    site, so frequent messages stay visible without being written every time;
+    warnings and errors are always kept.
+    """
+
+    def __init__(self, default_level, module_levels=None, sampling=None):
+        self.default_level = logger.level(default_level.upper()).no
+        self.module_levels = {module: logger.level(level.upper()).no for module, level in (module_levels or {}).items()}
+        self.sampling = {module: int(rate) for module, rate in (sampling or {}).items()}
+        self.warning_level = logger.level("WARNING").no
+        self._resolved = {}
+        self._counts = {}
+
+    def _lookup(self, settings, name, default):
+        while True:
+            if name in settings:
+                return settings[name]
+            if "." not in name:
+                return settings.get("", default)
+            name = name.rsplit(".", 1)[0]
+
+    def _settings(self, name):
+        resolved = self._resolved.get(name)
+        if resolved is None:
+            resolved = (self._lookup(self.module_levels, name, self.default_level), self._lookup(self.sampling, name, 1))
+            self._resolved[name] = resolved
+        return resolved
+
+    def min_level(self):
+        """The lowest level any module logs at; records below it are dropped before being formatted."""
+        return min([self.default_level, *self.module_levels.values()])
+
+    def __call__(self, record):
+        name = record["name"] or ""
+        level, rate = self._settings(name)
+        if record["level"].no < level:
+            return False
+        if rate > 1 and record["level"].no < self.warning_level:
+            site = (name, record["line"])
+            count = self._counts.get(site, 0)
+            self._counts[site] = count + 1
+            return count % rate == 0
+        return True
+
+class BackgroundSink:
+    """
+    Loguru sink that hands formatted records to a writer thread.
+
+    The request thread only formats the record and queues it; the writer
+    thread passes it to `writer`, a logger holding the console and file sinks.
+    loguru's own enqueue=True pickles every record through a multiprocessing
+    pipe, which costs more per record than the write it takes off the request.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer.opt(raw=True, depth=0)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def __call__(self, message):
+        self._queue.put((self.writer, str(message)))
+
+    def submit(self, writer, message):
+        """Queues a raw message for another writer logger, e.g. one holding the sink of another file."""
+        self._queue.put((writer, message))
+
+    def _run(self):
+        while True:
+            writer, message = self._queue.get()
+            try:
+                writer.info(message)
+            finally:
+                self._queue.task_done()
+
+    def pending(self):
+        return self._queue.unfinished_tasks
+
+    def flush(self, timeout=5):
+        """Waits until the queued records are written, for at most timeout seconds."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
 
 class CustomLogger:
-    def __init__(self, log_directory: str = "logs", log_filename: str = "app", rotation: str = "1 day"):
+    def __init__(self, log_directory: str = "logs", log_filename: str = "app", rotation: str = "1 day",
+                 level: str = "DEBUG", module_levels: str = "", sampling: str = ""):
         """
         Initialize the logger with custom settings.
         :param log_directory: Directory where log files will be stored.
         :param log_filename: The base filename for logs (without date).
         :param rotation: The rotation pattern (e.g., '1 day', '500 MB').
+        :param level: Minimum level of the modules without a level of their own.
+        :param module_levels: Per-module levels, e.g. 'uitils.session=WARNING,main=INFO'.
+        :param sampling: Per-module sampling rates of records below WARNING, e.g. 'uitils.session=10'.
         """
         # Create log directory if it does not exist
         os.makedirs(log_directory, exist_ok=True)
-        
+
         # Use current date to create a date-based filename
         current_date = datetime.now().strftime("%Y-%m-%d")  # Get current date in YYYY-MM-DD format
         log_filename_with_date = f"{log_filename}_{current_date}.log"
         log_path = os.path.join(log_directory, log_filename_with_date)
-        
-        # Configure the logger
+
+        # Configure the logger. The console and file sinks belong to a separate
+        # writer logger fed by a background thread, so requests never wait on them.
         self.logger = logger
-        self.logger.add(log_path, rotation=rotation)  # Log rotation every day
-        
+        self.logger.remove()
+        # A logger without sinks, copied for the writers of other files.
+        self._blank_writer = copy.deepcopy(self.logger)
+        writer = copy.deepcopy(self.logger)
+        writer.add(sys.stderr, format="{message}")
+        writer.add(log_path, rotation=rotation, format="{message}")  # Log rotation every day
+        self.sink = BackgroundSink(writer)
+        self.filter = ModuleFilter(level, parse_module_settings(module_levels), parse_module_settings(sampling))
+        self.logger.add(self.sink, level=self.filter.min_level(), filter=self.filter)
+        atexit.register(self.flush)
+
     def get_logger(self):
         """
         Return the configured logger instance.
         """
         return self.logger
 
+    def file_writer(self, path):
+        """Returns a function that appends a line (newline included) to path from the background writer thread."""
+        writer = copy.deepcopy(self._blank_writer)
+        writer.add(path, format="{message}")
+        writer = writer.opt(raw=True, depth=0)
+        return lambda line: self.sink.submit(writer, line)
+
+    def flush(self):
+        """Waits for the records queued for the background writer."""
+        self.sink.flush()
+
 # Initialize the logger
-custom_logger = CustomLogger(log_directory="logs", log_filename="app")
+custom_logger = CustomLogger(log_directory="logs", log_filename="app", level=log_level, module_levels=log_module_levels, sampling=log_sampling)
 logger = custom_logger.get_logger()
-logger.info("Logger has been successfully initialized")
\ No newline at end of file
+logger.info("Logger has been successfully initialized")
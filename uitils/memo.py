@@ -0,0 +1,55 @@
+import asyncio
+from uitils.cache import LRUCache
+
+class VersionedMemo:
+    """
+    Memoizes async results per key against a version, with singleflight.
+
+    A result is reused while the version passed in is the one it was computed
+    for; a newer version misses and drops the entry, so bumping the version is
+    enough to invalidate it. Concurrent calls for the same (key, version) share
+    one computation instead of each starting their own.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.cache = LRUCache(maxsize)
+        self._in_flight = {}
+        self.coalesced = 0
+
+    def peek(self, key, version):
+        """Returns the memoized result for (key, version), or None."""
+        return self.cache.get(key, version)
+
+    def put(self, key, version, value):
+        self.cache.put(key, value, version)
+
+    async def get_or_compute(self, key, version, compute, cacheable=None):
+        """
+        Returns the result for (key, version), awaiting `compute()` if it is
+        neither memoized nor already being computed. Results rejected by
+        `cacheable` are returned but not memoized.
+        """
+        value = self.cache.get(key, version)
+        if value is not None:
+            return value
+        flight = self._in_flight.get((key, version))
+        if flight is None:
+            flight = asyncio.ensure_future(self._compute(key, version, compute, cacheable))
+            self._in_flight[(key, version)] = flight
+        else:
+            self.coalesced += 1
+        # A caller that goes away must not cancel the computation the others are waiting for.
+        return await asyncio.shield(flight)
+
+    async def _compute(self, key, version, compute, cacheable):
+        try:
+            value = await compute()
+            if cacheable is None or cacheable(value):
+                self.put(key, version, value)
+            return value
+        finally:
+            del self._in_flight[(key, version)]
+
+    def stats(self):
+        """Returns the cache counters plus coalesced and in-flight calls for monitoring."""
+        return {**self.cache.stats(), "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
@@ -0,0 +1,192 @@
+import bisect
+import threading
+import time
+
+# Seconds, from a cached read to a slow model answer.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+# Bytes, from a 1 KB student file to a 1 GB session file.
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(11))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """Base of the collectors: one series per combination of label values, all guarded by one lock."""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Returns the series of the given label values, creating it on first use."""
+        values = tuple(str(value) for value in values)
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            series = list(self._series.items())
+            for values, child in series:
+                lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+class _CounterSeries:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self, lock):
+        self._lock = lock
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+class Counter(_Metric):
+    """Monotonic total, e.g. retries or tokens."""
+
+    type = "counter"
+
+    def _new_series(self):
+        return _CounterSeries(self._lock)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+class _HistogramSeries:
+    __slots__ = ("_lock", "buckets", "counts", "sum", "count")
+
+    def __init__(self, lock, buckets):
+        self._lock = lock
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if index < len(self.counts):
+                self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            le = 'le="%s"' % _format_value(float(bound))
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, [le])} {cumulative}")
+        inf = 'le="+Inf"'
+        lines.append(f"{name}_bucket{_format_labels(labelnames, values, [inf])} {self.count}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {self.count}")
+        return lines
+
+class _Timer:
+    """Context manager observing the seconds spent in its block."""
+
+    def __init__(self, series):
+        self.series = series
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.series.observe(time.perf_counter() - self.started)
+        return False
+
+class Histogram(_Metric):
+    """Distribution of observed values, e.g. durations, in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramSeries(self._lock, self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+class CallbackGauge(_Metric):
+    """Value read when the metrics are scraped, e.g. from an existing stats() method."""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, callback):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def render(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}",
+                f"{self.name} {_format_value(self.callback())}"]
+
+class Registry:
+    """
+    In-process collectors rendered in the Prometheus text format by GET /metrics.
+
+    Updates take one uncontended lock per metric; nothing is sent anywhere,
+    the scraper pulls the current values.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, callback):
+        return self._register(CallbackGauge(name, documentation, callback))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
@@ -0,0 +1,248 @@
+import asyncio
+import contextlib
+import json
+import sqlite3
+import threading
+import time
+from uitils.logger import custom_logger
+
+logger = custom_logger.get_logger()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pool_keys (
+    key TEXT PRIMARY KEY,
+    requests INTEGER NOT NULL DEFAULT 0,
+    last_requested REAL NOT NULL,
+    refill_lease REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_pool_keys_last_requested ON pool_keys (last_requested);
+CREATE TABLE IF NOT EXISTS pool_questions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    question TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pool_questions_key ON pool_questions (key, seq);
+"""
+
+# A key is pooled once it has been requested this many times: one-off free-text goals are never refilled.
+REUSED = 2
+
+class QuestionPool:
+    """
+    Pool of pre-generated first questions for new sessions.
+
+    The first question of a session has no history, so it only depends on
+    (learning_goals, student_level, difficulty_level). Once a key has been
+    requested twice, up to `depth` questions are kept ready for it; `take`
+    claims one without calling the model and schedules a refill in the
+    background. Keys not requested for `key_ttl` seconds are dropped, and at
+    most `max_keys` keys are tracked, the least recently requested being
+    dropped first, so free-text learning goals cannot grow the pool or the
+    background spend without bound.
+
+    The pool is an SQLite database shared by the uvicorn workers. A question is
+    claimed by deleting its row in the transaction that reads it, so no two
+    workers serve the same one, and a refill first takes a lease on its key,
+    so only one worker generates questions for a key at a time. A lease
+    expires after `lease_seconds` in case its worker dies.
+    """
+
+    def __init__(self, recommender, path, depth=3, refill_interval=60, max_keys=100, key_ttl=86400, lease_seconds=120):
+        self.recommender = recommender
+        self.path = path
+        self.depth = depth
+        self.refill_interval = refill_interval
+        self.max_keys = max_keys
+        self.key_ttl = key_ttl
+        self.lease_seconds = lease_seconds
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._refilling = set()
+        self._tasks = set()
+        self._job = None
+        if depth > 0:
+            self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        """Returns the sqlite connection of the calling thread, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _key(self, learning_goals, student_level, difficulty_level):
+        # The goals keep their order: they are joined in that order into the prompt.
+        return json.dumps([list(learning_goals), student_level, difficulty_level])
+
+    def _claim(self, key):
+        """Records a request of the key and removes its oldest ready question. Returns (question or None, requests of the key)."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO pool_keys (key, requests, last_requested) VALUES (?, 1, ?) "
+                "ON CONFLICT (key) DO UPDATE SET requests = requests + 1, last_requested = excluded.last_requested",
+                (key, now)
+            )
+            requests = conn.execute("SELECT requests FROM pool_keys WHERE key = ?", (key,)).fetchone()[0]
+            if requests == 1:
+                # Only a new key can take the pool past max_keys.
+                self._evict(conn, "SELECT key FROM pool_keys ORDER BY last_requested DESC LIMIT -1 OFFSET ?", (self.max_keys,))
+            row = conn.execute("SELECT seq, question FROM pool_questions WHERE key = ? ORDER BY seq LIMIT 1", (key,)).fetchone()
+            if row is None:
+                return None, requests
+            conn.execute("DELETE FROM pool_questions WHERE seq = ?", (row[0],))
+            return row[1], requests
+
+    def _evict(self, conn, select, parameters):
+        keys = [(row[0],) for row in conn.execute(select, parameters)]
+        conn.executemany("DELETE FROM pool_questions WHERE key = ?", keys)
+        conn.executemany("DELETE FROM pool_keys WHERE key = ?", keys)
+
+    def _lease(self, key):
+        """Takes the refill lease of a pooled key. Returns the number of questions to generate, 0 if there is nothing to do."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT requests, refill_lease FROM pool_keys WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] < REUSED or row[1] > now:
+                # Not pooled, or another worker is refilling it.
+                return 0
+            ready = conn.execute("SELECT COUNT(*) FROM pool_questions WHERE key = ?", (key,)).fetchone()[0]
+            if ready >= self.depth:
+                return 0
+            conn.execute("UPDATE pool_keys SET refill_lease = ? WHERE key = ?", (now + self.lease_seconds, key))
+            return self.depth - ready
+
+    def _add(self, key, questions):
+        """Adds generated questions to a key that is still pooled, up to `depth`, and releases its lease. Returns the number added."""
+        with self._transaction() as conn:
+            if conn.execute("UPDATE pool_keys SET refill_lease = 0 WHERE key = ?", (key,)).rowcount == 0:
+                # Evicted while its questions were generated.
+                return 0
+            ready = conn.execute("SELECT COUNT(*) FROM pool_questions WHERE key = ?", (key,)).fetchone()[0]
+            added = questions[:max(self.depth - ready, 0)]
+            conn.executemany("INSERT INTO pool_questions (key, question) VALUES (?, ?)", [(key, question) for question in added])
+            return len(added)
+
+    def _pooled_keys(self):
+        """Drops the keys not requested for key_ttl seconds and returns the pooled ones."""
+        with self._transaction() as conn:
+            self._evict(conn, "SELECT key FROM pool_keys WHERE last_requested < ?", (time.time() - self.key_ttl,))
+            return [row[0] for row in conn.execute("SELECT key FROM pool_keys WHERE requests >= ?", (REUSED,))]
+
+    async def take(self, learning_goals, student_level, difficulty_level):
+        """
+        Returns a ready question for the key, or None if there is none, and
+        schedules a refill once the key has been reused. The database is
+        accessed in a worker thread, so that the event loop does not wait for it.
+        """
+        if self.depth <= 0:
+            return None
+        key = self._key(learning_goals, student_level, difficulty_level)
+        question, requests = await asyncio.to_thread(self._claim, key)
+        if question is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        if requests >= REUSED:
+            self._schedule_refill(key)
+        return question
+
+    def _schedule_refill(self, key):
+        if key in self._refilling:
+            return
+        task = asyncio.get_running_loop().create_task(self.refill(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def refill(self, key):
+        """Generates questions for a pooled key until `depth` are ready, unless another worker is doing it."""
+        if key in self._refilling:
+            return
+        self._refilling.add(key)
+        try:
+            missing = await asyncio.to_thread(self._lease, key)
+            if missing <= 0:
+                return
+            learning_goals, student_level, difficulty_level = json.loads(key)
+            questions = []
+            try:
+                responses = await asyncio.gather(*(
+                    self.recommender.recommend_question(learning_goals, student_level, difficulty_level, history=None)
+                    for _ in range(missing)
+                ))
+                for response in responses:
+                    if response.get("question", "OpenAI Not Responding") == "OpenAI Not Responding":
+                        logger.warning(f"Could not refill question pool for {key}")
+                        continue
+                    questions.append(response["question"])
+            finally:
+                # Releases the lease even if no question could be generated.
+                added = await asyncio.to_thread(self._add, key, questions)
+            if added:
+                logger.debug("Added {} questions to the pool for {}", added, key)
+        except Exception as e:
+            logger.error(f"Error refilling question pool for {key}: {str(e)}")
+        finally:
+            self._refilling.discard(key)
+
+    async def refill_all(self):
+        """Drops the keys that are no longer requested and tops up the pooled ones."""
+        for key in await asyncio.to_thread(self._pooled_keys):
+            await self.refill(key)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refill_all()
+            except Exception as e:
+                logger.error(f"Error running the question pool refill job: {str(e)}")
+            await asyncio.sleep(self.refill_interval)
+
+    def start(self):
+        """Starts the periodic refill job. Must be called from the event loop."""
+        if self.depth > 0 and self._job is None:
+            self._job = asyncio.get_running_loop().create_task(self._run())
+            logger.info("Question pool refill job started with depth {}", self.depth)
+
+    async def stop(self):
+        """Stops the refill job. Claims and refills are committed as they happen."""
+        if self._job is not None:
+            self._job.cancel()
+            try:
+                await self._job
+            except asyncio.CancelledError:
+                pass
+            self._job = None
+        for task in list(self._tasks):
+            task.cancel()
+
+    def stats(self):
+        """Returns the hit/miss counters for monitoring."""
+        keys = ready_questions = 0
+        if self.depth > 0:
+            conn = self._connection()
+            keys = conn.execute("SELECT COUNT(*) FROM pool_keys WHERE requests >= ?", (REUSED,)).fetchone()[0]
+            ready_questions = conn.execute("SELECT COUNT(*) FROM pool_questions").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "keys": keys,
+            "ready_questions": ready_questions,
+            "depth": self.depth,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0
+        }
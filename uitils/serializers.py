@@ -0,0 +1,115 @@
+import json
+import os
+import time
+from uitils.metrics import REGISTRY, SIZE_BUCKETS
+from uitils.tracing import span
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; without it compact JSON is written by the stdlib encoder.
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+SESSION_LOAD_SECONDS = REGISTRY.histogram("session_load_duration_seconds", "Time spent reading and parsing session data, by backend.", ["backend"])
+SESSION_SAVE_SECONDS = REGISTRY.histogram("session_save_duration_seconds", "Time spent encoding and writing session data, by backend.", ["backend"])
+SESSION_FILE_BYTES = REGISTRY.histogram(
+    "session_file_size_bytes", "Size of the session files read (op=load) and written (op=save), by backend.",
+    ["backend", "op"], buckets=SIZE_BUCKETS
+)
+
+class JsonSerializer:
+    """Compact JSON, encoded with orjson when it is installed. indent=4 reproduces the legacy pretty-printed files."""
+
+    def __init__(self, indent=None):
+        self.indent = indent
+        self.name = "json" if indent is None else "json-pretty"
+
+    def dumps(self, data):
+        if self.indent is None and orjson is not None:
+            return orjson.dumps(data)
+        if self.indent is None:
+            return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        return json.dumps(data, indent=self.indent).encode("utf-8")
+
+    def loads(self, content):
+        if orjson is not None:
+            return orjson.loads(content)
+        return json.loads(content)
+
+class MsgpackSerializer:
+    """Binary MessagePack records, smaller and faster to parse than JSON. Needs the msgpack package."""
+
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("The msgpack serializer needs the msgpack package: pip install msgpack")
+
+    def dumps(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, content):
+        return msgpack.unpackb(content, raw=False)
+
+SERIALIZERS = {
+    "json": JsonSerializer,
+    "json-pretty": lambda: JsonSerializer(indent=4),
+    "msgpack": MsgpackSerializer
+}
+
+def get_serializer(name):
+    """Returns the serializer selected by the SESSION_SERIALIZER setting."""
+    if name not in SERIALIZERS:
+        raise ValueError(f"Unknown session serializer: {name}")
+    return SERIALIZERS[name]()
+
+def loads_any(content, serializer):
+    """
+    Parses session data written in any supported format. JSON documents start
+    with a brace or whitespace, which no MessagePack map does, so files keep
+    loading after SESSION_SERIALIZER is changed and until they are rewritten.
+    """
+    if content[:1] in (b"{", b"[", b" ", b"\n", b"\r", b"\t"):
+        if isinstance(serializer, JsonSerializer):
+            return serializer.loads(content)
+        return JsonSerializer().loads(content)
+    if isinstance(serializer, MsgpackSerializer):
+        return serializer.loads(content)
+    return MsgpackSerializer().loads(content)
+
+def read_file(path, serializer):
+    """Returns the data of a session file, or {} if it is empty. Raises FileNotFoundError if it does not exist."""
+    started = time.perf_counter()
+    with span("file_read"):
+        with open(path, 'rb') as f:
+            content = f.read()
+        data = loads_any(content, serializer) if content.strip() else {}
+    SESSION_LOAD_SECONDS.labels(serializer.name).observe(time.perf_counter() - started)
+    SESSION_FILE_BYTES.labels(serializer.name, "load").observe(len(content))
+    return data
+
+def write_file(path, data, serializer, fsync=False):
+    """Writes data to a temporary file and renames it over path, so that readers never see a partial file."""
+    started = time.perf_counter()
+    tmp_path = f"{path}.tmp"
+    with span("file_write"):
+        content = serializer.dumps(data)
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    SESSION_SAVE_SECONDS.labels(serializer.name).observe(time.perf_counter() - started)
+    SESSION_FILE_BYTES.labels(serializer.name, "save").observe(len(content))
+
+def convert_file(path, serializer):
+    """Rewrites a session file in the format of serializer. Returns (size before, size after) in bytes."""
+    before = os.path.getsize(path)
+    write_file(path, read_file(path, serializer), serializer)
+    return before, os.path.getsize(path)
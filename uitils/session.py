@@ -1,57 +1,255 @@
-import json
 import statistics
+import threading
+from uitils.analytics import AggregateAnalytics, AnalyticsEngine
+from uitils.cache import LRUCache
+from uitils.file_lock import FileLock, file_signature
+from uitils.serializers import get_serializer, read_file, write_file
 from uitils.logger import custom_logger
 
 logger = custom_logger.get_logger()
 
+# Grading results that have a running counter in a session's "stats".
+RESULT_COUNTERS = {
+    "correct": "correct_count",
+    "incorrect": "incorrect_count",
+    "partially correct": "partially_correct_count"
+}
+
+# Status of a graded answer whose session was changed after it was read, e.g. by another worker.
+VERSION_CONFLICT = "Session was changed by another request."
+
 class SessionManager:
-    def __init__(self, json_file_path):
+    def __init__(self, json_file_path, cache_size=128, serializer=None, misconception_capacity=1000):
         self.json_file_path = json_file_path
-        logger.info(f"SessionManager initialized with file path: {json_file_path}")
+        self.serializer = serializer or get_serializer("json")
+        self.cache = LRUCache(cache_size)
+        # Guards state shared by the threads of this process, e.g. the aggregate rebuild.
+        self._lock = threading.RLock()
+        # Serializes read-modify-write cycles of the mutation methods, across processes too.
+        self._file_lock = FileLock(f"{json_file_path}.lock")
+        self.misconception_capacity = misconception_capacity
+        self.aggregate = AggregateAnalytics(f"{json_file_path}.aggregate.json", misconception_capacity=misconception_capacity)
+        logger.info("SessionManager initialized with file path: {}", json_file_path)
+
+    def _file_signature(self, path):
+        """Returns the signature of a file, used to detect changes made by other writers."""
+        return file_signature(path)
+
+    def cache_stats(self):
+        """Returns the hit/miss counters of the parsed session cache."""
+        return self.cache.stats()
     
     def load_sessions(self):
-        """Loads existing sessions from the JSON file."""
+        """Loads existing sessions from the JSON file, reusing the parsed data while the file is unchanged."""
+        signature = self._file_signature(self.json_file_path)
+        sessions = self.cache.get(self.json_file_path, signature)
+        if sessions is not None:
+            return sessions
         try:
-            with open(self.json_file_path, 'r') as f:
-                content = f.read().strip()
-                if not content:
-                    logger.info("Session file is empty. Returning empty dictionary.")
-                    return {}  # Return an empty dictionary if file is empty
-                logger.info("Loaded session data successfully.")
-                return json.loads(content)  # Load the valid JSON content
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+            sessions = read_file(self.json_file_path, self.serializer)  # An empty file holds no sessions
+            logger.debug("Loaded session data successfully.")
+        except FileNotFoundError as e:
             logger.error(f"Error loading sessions from file: {str(e)}")
-            return {}  # If file doesn't exist or has invalid JSON, return an empty dictionary
+            sessions = {}  # If file doesn't exist, start from an empty dictionary
+        except ValueError as e:
+            logger.error(f"Error loading sessions from file: {str(e)}")
+            return {}  # Invalid content is not cached so that a repaired file is picked up
+        self.cache.put(self.json_file_path, sessions, signature)
+        return sessions
 
     def save_sessions(self, sessions):
-        """Saves the updated session data back to the JSON file."""
+        """Saves the updated session data back to the session file and refreshes the cache."""
         try:
-            with open(self.json_file_path, 'w') as f:
-                json.dump(sessions, f, indent=4)
-                logger.info("Sessions data saved successfully.")
+            write_file(self.json_file_path, sessions, self.serializer)
+            self.cache.put(self.json_file_path, sessions, self._file_signature(self.json_file_path))
+            logger.debug("Sessions data saved successfully.")
         except Exception as e:
+            # The cached data may hold the unsaved change; force a reload from disk.
+            self.cache.invalidate(self.json_file_path)
             logger.error(f"Error saving sessions to file: {str(e)}")
 
+    def _persist(self, sessions, op, **record):
+        """Persists the outcome of one mutation. The JSON backend rewrites the whole file."""
+        self.save_sessions(sessions)
+
+    def _student_lock(self, student_id):
+        """Returns the lock held while a student's sessions are read, modified and persisted."""
+        return self._file_lock
+
+    def _mutation_scope(self):
+        """
+        Returns the lock held by a mutation until it is added to the aggregate, which happens after
+        the student lock is released. The JSON file has a single lock, held by every mutation.
+        """
+        return self._file_lock
+
+    def _writes_excluded(self):
+        """Returns the lock that keeps every mutation out while it is held. Mutations of the JSON file all hold its file lock."""
+        return self._file_lock
+
+    def _load_student_scope(self, student_id):
+        """Returns session data holding at least the given student's sessions. The JSON file holds every student."""
+        return self.load_sessions()
+
+    def _new_stats(self, interactions):
+        """Builds the running counters of a session from its interactions."""
+        stats = {
+            "interaction_count": 0,
+            "confidence_sum": 0,
+            "answer_time_sum": 0,
+            "correct_count": 0,
+            "incorrect_count": 0,
+            "partially_correct_count": 0
+        }
+        for interaction in interactions:
+            self._add_to_stats(stats, interaction)
+        return stats
+
+    def _add_to_stats(self, stats, interaction, sign=1):
+        """Adds (sign=1) or removes (sign=-1) the contribution of one interaction to the running counters."""
+        stats["interaction_count"] += sign
+        stats["confidence_sum"] += sign * interaction["confidence_level"]
+        stats["answer_time_sum"] += sign * interaction["answer_time"]
+        counter = RESULT_COUNTERS.get(interaction["correct_answer"])
+        if counter:
+            stats[counter] += sign
+
+    def _session_stats(self, session):
+        """Returns the running counters of a session, building them for sessions stored before they existed."""
+        stats = session.get("stats")
+        return stats if stats is not None else self._new_stats(session["interactions"])
+
+    def _stats_for_update(self, session):
+        """Returns the running counters of a session being mutated, adding them to it if it has none."""
+        if "stats" not in session:
+            session["stats"] = self._new_stats(session["interactions"])
+        return session["stats"]
+
+    def _copy_student(self, student_sessions):
+        """Returns a copy of a student's sessions that a mutation can change without affecting the original."""
+        copies = {}
+        for session_id, session in student_sessions.items():
+            session = {**session, "interactions": [dict(interaction) for interaction in session["interactions"]]}
+            if "stats" in session:
+                session["stats"] = dict(session["stats"])
+            copies[session_id] = session
+        return copies
+
+    def _writable_scope(self, student_id):
+        """
+        Returns the session data a mutation of the student is applied to. The loaded data is
+        shared with concurrent readers, so the student's sessions are copied (copy-on-write);
+        _persist publishes the copy once it is saved.
+        """
+        sessions = dict(self._load_student_scope(student_id))
+        if student_id in sessions:
+            sessions[student_id] = self._copy_student(sessions[student_id])
+        return sessions
+
+    def _session_averages(self, session):
+        """Returns (average confidence level, average answer time) of a session in constant time."""
+        stats = self._session_stats(session)
+        count = stats["interaction_count"]
+        if count == 0:
+            return 0, 0
+        return stats["confidence_sum"] / count, stats["answer_time_sum"] / count
+
+    def _bump_version(self, session):
+        """Marks a session as changed; results derived from the session are cached against its version."""
+        session["version"] = session.get("version", 0) + 1
+
+    def _apply_insert_session(self, sessions, student_id, session_data, changes=None):
+        """Applies a new session to the in-memory data. Returns False if it already exists."""
+        new_student = student_id not in sessions
+        student_sessions = sessions.setdefault(student_id, {})
+        session_id = session_data["session_id"]
+        if session_id in student_sessions:
+            return False
+        session_data["stats"] = self._new_stats(session_data["interactions"])
+        student_sessions[session_id] = session_data
+        if changes is not None:
+            changes.append(("session_added", session_data, new_student))
+        return True
+
+    def _apply_update_interaction(self, sessions, student_id, session_id, interaction_id, answer, updated_difficulty_level, student_response_time, confidence_level, result, changes=None):
+        """Applies a graded answer to the in-memory data and returns a status message."""
+        if student_id not in sessions or session_id not in sessions[student_id]:
+            return "Session or student does not exist."
+
+        session = sessions[student_id][session_id]
+        interaction = next((i for i in session["interactions"] if i["interaction_id"] == interaction_id), None)
+        if interaction is None:
+            return "Interaction ID not found."
+
+        if changes is not None:
+            changes.append(("interaction_removed", dict(interaction)))
+            changes.append(("difficulty_changed", session["difficulty_level"], updated_difficulty_level))
+        stats = self._stats_for_update(session)
+        self._add_to_stats(stats, interaction, sign=-1)
+        interaction["answer"] = answer
+        interaction["answer_time"] = student_response_time
+        interaction["confidence_level"] = confidence_level
+        interaction["correct_answer"] = result
+        self._add_to_stats(stats, interaction)
+        if changes is not None:
+            changes.append(("interaction_added", interaction))
+
+        # Recalculate session progress and state
+        history = session["interactions"]
+        session["difficulty_level"] = updated_difficulty_level
+        session["session_progress"] = (len(history) / 100) * 100 if len(history) < 100 else 100
+        session["session_state"] = "completed" if len(history) >= 100 else "in-progress"
+        self._bump_version(session)
+        return "Updated successfully. 🙂"
+
+    def _apply_update_session(self, sessions, student_id, session_id, new_interaction, changes=None):
+        """Appends a new interaction to the in-memory data. Replaying the same interaction is a no-op."""
+        if student_id not in sessions or session_id not in sessions[student_id]:
+            return False
+        session = sessions[student_id][session_id]
+        if any(i["interaction_id"] == new_interaction["interaction_id"] for i in session["interactions"]):
+            return False
+        self._add_to_stats(self._stats_for_update(session), new_interaction)
+        session["interactions"].append(new_interaction)
+        self._bump_version(session)
+        if changes is not None:
+            changes.append(("interaction_added", new_interaction))
+        return True
+
+    def _apply_grade_and_advance(self, sessions, student_id, session_id, interaction_id, answer, updated_difficulty_level, student_response_time, confidence_level, result, new_interaction, changes=None, expected_version=None):
+        """
+        Applies a graded answer and appends the next interaction in one step.
+        With expected_version, nothing is applied if the session has a different version.
+        """
+        session = sessions.get(student_id, {}).get(session_id)
+        if expected_version is not None and session is not None and session.get("version", 0) != expected_version:
+            return VERSION_CONFLICT
+        status = self._apply_update_interaction(
+            sessions, student_id, session_id, interaction_id, answer,
+            updated_difficulty_level, student_response_time, confidence_level, result, changes
+        )
+        if status == "Updated successfully. 🙂":
+            self._apply_update_session(sessions, student_id, session_id, new_interaction, changes)
+        return status
+
     def insert_session(self, student_id, session_data):
         """Inserts a new session for a student."""
         try:
-            sessions = self.load_sessions()
-
-            # Ensure student entry exists
-            if student_id not in sessions:
-                sessions[student_id] = {}
-
-            session_id = session_data["session_id"]
-
-            # Insert the new session
-            if session_id not in sessions[student_id]:
-                sessions[student_id][session_id] = session_data
-                logger.info(f"New session {session_id} inserted for student {student_id}.")
+            with self._mutation_scope():
+                with self._student_lock(student_id):
+                    sessions = self._writable_scope(student_id)
+                    session_id = session_data["session_id"]
+                    changes = []
+
+                    # Insert the new session
+                    inserted = self._apply_insert_session(sessions, student_id, session_data, changes)
+                    if inserted:
+                        self._persist(sessions, "insert_session", student_id=student_id, session_data=session_data)
+                self.aggregate.apply(changes)
+            if inserted:
+                logger.info("New session {} inserted for student {}.", session_id, student_id)
             else:
                 logger.warning(f"Session {session_id} already exists for student {student_id}. No changes made.")
-
-            # Save updated sessions
-            self.save_sessions(sessions)
             return "Session Started Successfully.🙂"
         except Exception as e:
             logger.error(f"Error inserting session for student {student_id}: {str(e)}")
@@ -60,48 +258,30 @@ class SessionManager:
     def update_interaction(self, student_id, session_id, interaction_id, answer, updated_difficulty_level, student_response_time, confidence_level, result):
         """Updates an interaction for a student session."""
         try:
-            sessions = self.load_sessions()
-
-            if student_id in sessions and session_id in sessions[student_id]:
-
-                
-                interactions = sessions[student_id][session_id]["interactions"]
-                interaction_found = False
-                for interaction in interactions:
-                    if interaction["interaction_id"] == interaction_id:
-                        
-                        interaction["answer"] = answer
-                        interaction["answer_time"] = student_response_time 
-                        interaction["confidence_level"] = confidence_level
-                        interaction["correct_answer"] = result 
-
-                        interaction_found = True
-                        logger.info(f"Interaction {interaction_id} updated for session {session_id} of student {student_id}.")
-                        break
-
-                if not interaction_found:
-                    logger.warning(f"Interaction with ID {interaction_id} not found for session {session_id} of student {student_id}.")
-                    return "Interaction ID not found."
-
-                # Recalculate session progress and state
-                history = sessions[student_id][session_id]["interactions"]
-                session_progress = (len(history) / 100) * 100 if len(history) < 100 else 100
-                session_state = "completed" if len(history) >= 100 else "in-progress"
-
-                # Update the session details
-                sessions[student_id][session_id]["difficulty_level"] = updated_difficulty_level
-                sessions[student_id][session_id]["session_progress"] = session_progress
-                sessions[student_id][session_id]["session_state"] = session_state
-
-                logger.info(f"Session {session_id} for student {student_id} updated with new progress and state.")
-            
-            else:
-                logger.warning(f"Session {session_id} for student {student_id} does not exist.")
-                return "Session or student does not exist."
-
-            # Save the updated sessions data
-            self.save_sessions(sessions)
-            return "Updated successfully. 🙂"
+            with self._mutation_scope():
+                with self._student_lock(student_id):
+                    sessions = self._writable_scope(student_id)
+                    changes = []
+                    status = self._apply_update_interaction(
+                        sessions, student_id, session_id, interaction_id, answer,
+                        updated_difficulty_level, student_response_time, confidence_level, result, changes
+                    )
+                    if status == "Session or student does not exist.":
+                        logger.warning(f"Session {session_id} for student {student_id} does not exist.")
+                        return status
+                    if status == "Interaction ID not found.":
+                        logger.warning(f"Interaction with ID {interaction_id} not found for session {session_id} of student {student_id}.")
+                        return status
+
+                    # Save the updated sessions data
+                    self._persist(
+                        sessions, "update_interaction", student_id=student_id, session_id=session_id,
+                        interaction_id=interaction_id, answer=answer, updated_difficulty_level=updated_difficulty_level,
+                        student_response_time=student_response_time, confidence_level=confidence_level, result=result
+                    )
+                self.aggregate.apply(changes)
+            logger.info("Interaction {} updated for session {} of student {}.", interaction_id, session_id, student_id)
+            return status
 
         except Exception as e:
             logger.error(f"Error updating interaction for student {student_id}, session {session_id}: {str(e)}")
@@ -111,26 +291,62 @@ class SessionManager:
     def update_session(self, student_id, session_id, new_interaction):
         """Updates an existing session with a new interaction."""
         try:
-            sessions = self.load_sessions()
-
-            # Ensure student and session exist
-            if student_id in sessions and session_id in sessions[student_id]:
-                sessions[student_id][session_id]["interactions"].append(new_interaction)
-                logger.info(f"New interaction added to session {session_id} for student {student_id}.")
+            with self._mutation_scope():
+                with self._student_lock(student_id):
+                    sessions = self._writable_scope(student_id)
+                    changes = []
+
+                    # Ensure student and session exist
+                    updated = self._apply_update_session(sessions, student_id, session_id, new_interaction, changes)
+                    if updated:
+                        self._persist(sessions, "update_session", student_id=student_id, session_id=session_id, new_interaction=new_interaction)
+                self.aggregate.apply(changes)
+            if updated:
+                logger.info("New interaction added to session {} for student {}.", session_id, student_id)
             else:
                 logger.warning(f"Session {session_id} for student {student_id} does not exist.")
-            
-            # Save updated sessions
-            self.save_sessions(sessions)
         except Exception as e:
             logger.error(f"Error updating session for student {student_id}, session {session_id}: {str(e)}")
 
+    def grade_and_advance(self, student_id, session_id, interaction_id, answer, updated_difficulty_level, student_response_time, confidence_level, result, new_interaction, expected_version=None):
+        """
+        Records a graded answer and appends the follow-up interaction with one load and one persist.
+        Pass the version the answer was graded against as expected_version to get VERSION_CONFLICT,
+        instead of a second follow-up question, when the session changed in the meantime.
+        """
+        try:
+            with self._mutation_scope():
+                with self._student_lock(student_id):
+                    sessions = self._writable_scope(student_id)
+                    changes = []
+                    status = self._apply_grade_and_advance(
+                        sessions, student_id, session_id, interaction_id, answer, updated_difficulty_level,
+                        student_response_time, confidence_level, result, new_interaction, changes, expected_version
+                    )
+                    if status != "Updated successfully. 🙂":
+                        logger.warning(f"Could not grade interaction {interaction_id} of session {session_id} for student {student_id}: {status}")
+                        return status
+
+                    self._persist(
+                        sessions, "grade_and_advance", student_id=student_id, session_id=session_id,
+                        interaction_id=interaction_id, answer=answer, updated_difficulty_level=updated_difficulty_level,
+                        student_response_time=student_response_time, confidence_level=confidence_level, result=result,
+                        new_interaction=new_interaction
+                    )
+                self.aggregate.apply(changes)
+            logger.info("Interaction {} graded and interaction {} added to session {} of student {}.", interaction_id, new_interaction['interaction_id'], session_id, student_id)
+            return status
+
+        except Exception as e:
+            logger.error(f"Error grading interaction for student {student_id}, session {session_id}: {str(e)}")
+            return "Please try again later. 😞"
+
     def get_session(self, student_id, session_id):
         """Retrieve a specific session by session_id for a given student."""
         try:
-            sessions = self.load_sessions()
+            sessions = self._load_student_scope(student_id)
             session = sessions.get(student_id, {}).get(session_id)
-            logger.info(f"Retrieved session {session_id} for student {student_id}.")
+            logger.debug("Retrieved session {} for student {}.", session_id, student_id)
             return session
         except Exception as e:
             logger.error(f"Error retrieving session {session_id} for student {student_id}: {str(e)}")
@@ -139,11 +355,8 @@ class SessionManager:
     def session_details(self, student_id, session_id):
         """Get detailed session information for a specific student."""
         try:
-            sessions = self.load_sessions()
-            if student_id not in sessions:
-                sessions[student_id] = {}
-
-            if session_id in sessions[student_id]:
+            sessions = self._load_student_scope(student_id)
+            if session_id in sessions.get(student_id, {}):
                 history = sessions[student_id][session_id]["interactions"]
                 session_progress = sessions[student_id][session_id]["session_progress"]
                 session_state = sessions[student_id][session_id]["session_state"]
@@ -152,15 +365,7 @@ class SessionManager:
                 learning_goals = sessions[student_id][session_id]["learning_goals"]
                 number_of_interactions = len(history)
                 
-                try:
-                    avg_confidence_level = statistics.mean([rating["confidence_level"] for rating in history])
-                except:
-                    avg_confidence_level = 0
-                
-                try:
-                    avg_answer_time = statistics.mean([res["answer_time"] for res in history])
-                except:
-                    avg_answer_time = 0
+                avg_confidence_level, avg_answer_time = self._session_averages(sessions[student_id][session_id])
                 
                 response = {
                     "session_state": session_state,
@@ -171,9 +376,10 @@ class SessionManager:
                     "avg_confidence_level": avg_confidence_level,
                     "avg_answer_time": avg_answer_time,
                     "learning_goals": learning_goals,
-                    "interactions":history
+                    "interactions":history,
+                    "version": sessions[student_id][session_id].get("version", 0)
                 }
-                logger.info(f"Retrieved detailed session information for session {session_id} of student {student_id}.")
+                logger.debug("Retrieved detailed session information for session {} of student {}.", session_id, student_id)
                 return response
         except Exception as e:
             logger.error(f"Error retrieving session details for student {student_id}, session {session_id}: {str(e)}")
@@ -182,12 +388,8 @@ class SessionManager:
     def interaction_details(self, student_id, session_id, interaction_id):
         """Get detailed session information for a specific student."""
         try:
-            sessions = self.load_sessions()
-            if student_id not in sessions:
-                print(f"Student {student_id} not found, adding to sessions.")  # Debug print
-                sessions[student_id] = {}
-            
-            if session_id in sessions[student_id]:
+            sessions = self._load_student_scope(student_id)
+            if session_id in sessions.get(student_id, {}):
                 history = sessions[student_id][session_id]["interactions"]
                 session_progress = sessions[student_id][session_id]["session_progress"]
                 session_state = sessions[student_id][session_id]["session_state"]
@@ -224,9 +426,10 @@ class SessionManager:
                     "avg_response_time": avg_response_time,
                     "learning_goals": learning_goals,
                     "interactions": history,
-                    "interaction_details":interaction_details
+                    "interaction_details":interaction_details,
+                    "version": sessions[student_id][session_id].get("version", 0)
                 }
-                logger.info(f"Retrieved detailed session information for session {session_id} of student {student_id}.")
+                logger.debug("Retrieved detailed session information for session {} of student {}.", session_id, student_id)
                 return response
 
         except Exception as e:
@@ -236,7 +439,7 @@ class SessionManager:
     def student_details(self, student_id):
         """Get detailed session information for all sessions of a specific student."""
         try:
-            sessions = self.load_sessions()
+            sessions = self._load_student_scope(student_id)
 
             if student_id not in sessions:
                 logger.warning(f"Student {student_id} not found in sessions data.")
@@ -254,15 +457,7 @@ class SessionManager:
                 learning_goals = session_data["learning_goals"]
                 number_of_interactions = len(history)
 
-                try:
-                    avg_confidence_level = statistics.mean([rating["confidence_level"] for rating in history])
-                except:
-                    avg_confidence_level = 0
-
-                try:
-                    avg_answer_time = statistics.mean([res["answer_time"] for res in history])
-                except:
-                    avg_answer_time = 0
+                avg_confidence_level, avg_answer_time = self._session_averages(session_data)
 
                 session_detail = {
                     "session_id": session_id,
@@ -278,7 +473,7 @@ class SessionManager:
                 }
                 all_session_details.append(session_detail)
 
-            logger.info(f"Retrieved detailed session information for student {student_id}.")
+            logger.debug("Retrieved detailed session information for student {}.", student_id)
             return all_session_details
 
         except Exception as e:
@@ -303,15 +498,7 @@ class SessionManager:
                     learning_goals = session_data["learning_goals"]
                     number_of_interactions = len(history)
 
-                    try:
-                        avg_confidence_level = statistics.mean([rating["confidence_level"] for rating in history])
-                    except:
-                        avg_confidence_level = 0
-
-                    try:
-                        avg_answer_time = statistics.mean([res["answer_time"] for res in history])
-                    except:
-                        avg_answer_time = 0
+                    avg_confidence_level, avg_answer_time = self._session_averages(session_data)
 
                     session_detail = {
                         "session_id": session_id,
@@ -329,7 +516,7 @@ class SessionManager:
 
                 all_students_details[student_id] = all_session_details
 
-            logger.info("Retrieved detailed session information for all students.")
+            logger.debug("Retrieved detailed session information for all students.")
             return all_students_details
 
         except Exception as e:
@@ -339,12 +526,12 @@ class SessionManager:
     def get_all_session_ids(self, student_id):
         """Retrieve a list of all session IDs for a specific student."""
         try:
-            sessions = self.load_sessions()
+            sessions = self._load_student_scope(student_id)
 
             # Check if the student exists
             if student_id in sessions:
                 session_ids = list(sessions[student_id].keys())
-                logger.info(f"Retrieved all session IDs for student {student_id}.")
+                logger.debug("Retrieved all session IDs for student {}.", student_id)
                 return session_ids
             else:
                 logger.warning(f"Student {student_id} not found in sessions data.")
@@ -352,4 +539,41 @@ class SessionManager:
 
         except Exception as e:
             logger.error(f"Error retrieving session IDs for student {student_id}: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+    def student_analytics(self, student_id, limit=None, offset=0):
+        """
+        Compute performance analytics across all sessions of a student, with the misconceptions
+        ranked offset to offset + limit. Returns None if the student has no sessions.
+        """
+        student_sessions = self._load_student_scope(student_id).get(student_id)
+        if not student_sessions:
+            return None
+        return AnalyticsEngine(student_sessions.values()).student_analytics(limit, offset)
+
+    def _compute_aggregate(self):
+        """Computes the aggregate analytics counters from every stored session."""
+        sessions = self.load_sessions()
+        engine = AnalyticsEngine(session for student_sessions in sessions.values() for session in student_sessions.values())
+        return {
+            "number_of_students": sum(1 for student_sessions in sessions.values() if student_sessions),
+            **engine.aggregate_counters(self.misconception_capacity)
+        }
+
+    def rebuild_aggregate(self):
+        """
+        Recomputes the materialized aggregate analytics from the store. No mutation runs in the
+        meantime: one committed after the store was read would be missing from the new counters.
+        """
+        with self._lock, self._writes_excluded():
+            self.aggregate.reset(self._compute_aggregate())
+        logger.info("Aggregate analytics rebuilt from the session store.")
+
+    def aggregate_analytics(self, limit=None, offset=0):
+        """
+        Returns analytics across all students from the materialized aggregate, with the common
+        misconceptions ranked offset to offset + limit. Returns None if there are no sessions.
+        """
+        if not self.aggregate.refresh():
+            self.rebuild_aggregate()
+        return self.aggregate.summary(limit, offset)
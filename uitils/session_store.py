@@ -0,0 +1,86 @@
+import json
+import os
+from uitils.session import SessionManager
+from uitils.wal_session import WalSessionManager
+from uitils.sqlite_session import SQLiteSessionManager
+from uitils.sharded_session import ShardedSessionManager
+from uitils.serializers import get_serializer, convert_file
+from uitils.file_lock import StoreInUseError
+from uitils.logger import custom_logger
+
+logger = custom_logger.get_logger()
+
+def build_session_manager(store_type, file_path, wal_compact_every=1000, db_path="student_sessions.db", cache_size=128, session_dir="student_sessions", serializer="json",
+                          misconception_capacity=1000):
+    """Creates the SessionManager backend selected by the SESSION_STORE setting."""
+    serializer = get_serializer(serializer)
+    if store_type == "json":
+        return SessionManager(file_path, cache_size=cache_size, serializer=serializer, misconception_capacity=misconception_capacity)
+    if store_type == "wal":
+        return WalSessionManager(file_path, compact_every=wal_compact_every, serializer=serializer, misconception_capacity=misconception_capacity)
+    if store_type == "sqlite":
+        manager = SQLiteSessionManager(db_path, misconception_capacity=misconception_capacity)
+        if manager.is_empty() and os.path.exists(file_path):
+            # First start on SQLite: carry over the sessions recorded in the JSON file.
+            manager.save_sessions(SessionManager(file_path).load_sessions())
+            logger.info(f"Imported sessions from {file_path} into {db_path}")
+        return manager
+    if store_type == "sharded":
+        manager = ShardedSessionManager(session_dir, cache_size=cache_size, serializer=serializer, misconception_capacity=misconception_capacity)
+        if manager.is_empty() and os.path.exists(file_path):
+            # First start with one file per student: split the sessions recorded in the JSON file.
+            manager.save_sessions(SessionManager(file_path).load_sessions())
+            logger.info(f"Imported sessions from {file_path} into {session_dir}")
+        return manager
+    logger.error(f"Unknown session store type: {store_type}")
+    raise ValueError(f"Unknown session store type: {store_type}")
+
+def session_files(manager):
+    """Returns (path, lock) of every file holding the sessions of a file-based store."""
+    if isinstance(manager, SQLiteSessionManager):
+        raise ValueError("The sqlite store does not keep sessions in files")
+    if isinstance(manager, ShardedSessionManager):
+        return [(manager._student_path(student_id), manager._student_lock(student_id)) for student_id in manager._student_ids()]
+    if isinstance(manager, WalSessionManager):
+        # Fold the log into the snapshot first, so that the snapshot holds every session.
+        manager.compact()
+        return [(manager.json_file_path, manager._lock)]
+    return [(manager.json_file_path, manager._file_lock)] if os.path.exists(manager.json_file_path) else []
+
+def convert_sessions(manager):
+    """Rewrites every session file of the store in the format of its serializer. Returns the total sizes before and after."""
+    before = after = 0
+    for path, lock in session_files(manager):
+        with lock:
+            sizes = convert_file(path, manager.serializer)
+        manager.cache.invalidate(path)
+        before += sizes[0]
+        after += sizes[1]
+        logger.info(f"Converted {path} to {manager.serializer.name}: {sizes[0]} -> {sizes[1]} bytes")
+    return before, after
+
+if __name__ == "__main__":
+    import argparse
+    from config import session_store, session_file_path, session_db_path, session_dir, wal_compact_every, session_serializer, misconception_capacity
+
+    parser = argparse.ArgumentParser(description="Maintenance commands for the configured session store.")
+    parser.add_argument("command", choices=["rebuild-aggregate", "convert"], help=(
+        "rebuild-aggregate: recompute /analytics/aggregate from the store; "
+        "convert: rewrite the session files in the format given by --to"
+    ))
+    parser.add_argument("--to", default=session_serializer, help="serializer for convert: json, json-pretty or msgpack (default: SESSION_SERIALIZER)")
+    args = parser.parse_args()
+
+    try:
+        # The wal store refuses to open while the app holds it, instead of racing its appends.
+        manager = build_session_manager(session_store, session_file_path, wal_compact_every=wal_compact_every, db_path=session_db_path, session_dir=session_dir,
+                                        serializer=args.to if args.command == "convert" else session_serializer, misconception_capacity=misconception_capacity)
+    except StoreInUseError as e:
+        parser.exit(1, f"{e}\n")
+
+    if args.command == "convert":
+        before, after = convert_sessions(manager)
+        print(f"Converted the {session_store} store to {args.to}: {before} -> {after} bytes")
+    else:
+        manager.rebuild_aggregate()
+        print(json.dumps(manager.aggregate_analytics(), indent=4))
@@ -0,0 +1,116 @@
+import os
+import threading
+import weakref
+from urllib.parse import quote, unquote
+from uitils.session import SessionManager
+from uitils.file_lock import FileLock, SharedFileLock
+from uitils.serializers import read_file, write_file
+from uitils.logger import custom_logger
+
+logger = custom_logger.get_logger()
+
+class ShardedSessionManager(SessionManager):
+    """
+    SessionManager that keeps one JSON file per student under a directory.
+
+    A request loads and rewrites only the file of its student, so its I/O does
+    not grow with the number of students. Writes take a lock per student,
+    held between the threads of the process and, through an flock on the
+    student's lock file, between processes; writes for different students run
+    in parallel. Files are replaced atomically, so reads need no lock.
+    """
+
+    def __init__(self, session_dir, cache_size=128, serializer=None, misconception_capacity=1000):
+        super().__init__(session_dir, cache_size=cache_size, serializer=serializer, misconception_capacity=misconception_capacity)
+        self.session_dir = session_dir
+        os.makedirs(session_dir, exist_ok=True)
+        self._student_locks = weakref.WeakValueDictionary()
+        self._student_locks_guard = threading.Lock()
+        # Held shared by every mutation until it is added to the aggregate, and exclusively while the aggregate is rebuilt.
+        self._store_lock = SharedFileLock(f"{session_dir}.store.lock")
+        logger.info("ShardedSessionManager initialized with directory: {}", session_dir)
+
+    def _student_path(self, student_id, suffix=".json"):
+        # Student ids are percent-encoded so that any id is a valid, flat file name.
+        return os.path.join(self.session_dir, quote(student_id, safe="") + suffix)
+
+    def _student_ids(self):
+        with os.scandir(self.session_dir) as entries:
+            return [unquote(entry.name[:-len(".json")]) for entry in entries if entry.name.endswith(".json")]
+
+    def is_empty(self):
+        return not self._student_ids()
+
+    def _student_lock(self, student_id):
+        """Returns the lock of one student, shared by the threads of this process while any holds it."""
+        with self._student_locks_guard:
+            lock = self._student_locks.get(student_id)
+            if lock is None:
+                lock = FileLock(self._student_path(student_id, ".lock"))
+                self._student_locks[student_id] = lock
+            return lock
+
+    def _mutation_scope(self):
+        # Shared: mutations of different students, and their aggregate updates, run in parallel.
+        return self._store_lock.shared()
+
+    def _writes_excluded(self):
+        return self._store_lock.exclusive()
+
+    def _load_student(self, student_id):
+        """Returns the sessions of one student, or None if the student has no file."""
+        path = self._student_path(student_id)
+        signature = self._file_signature(path)
+        if signature is None:
+            return None
+        student_sessions = self.cache.get(path, signature)
+        if student_sessions is not None:
+            return student_sessions
+        try:
+            student_sessions = read_file(path, self.serializer)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.error(f"Error loading sessions of student {student_id} from {path}: {str(e)}")
+            return None
+        self.cache.put(path, student_sessions, signature)
+        return student_sessions
+
+    def _save_student(self, student_id, student_sessions):
+        """Writes the sessions of one student to a temporary file and renames it over the previous one."""
+        path = self._student_path(student_id)
+        try:
+            write_file(path, student_sessions, self.serializer)
+            self.cache.put(path, student_sessions, self._file_signature(path))
+        except Exception:
+            # The cached data may hold the unsaved change; force a reload from disk.
+            self.cache.invalidate(path)
+            raise
+
+    def _load_student_scope(self, student_id):
+        student_sessions = self._load_student(student_id)
+        return {} if student_sessions is None else {student_id: student_sessions}
+
+    def _persist(self, sessions, op, **record):
+        """Rewrites the file of the student the mutation belongs to."""
+        student_id = record["student_id"]
+        self._save_student(student_id, sessions.get(student_id, {}))
+
+    def load_sessions(self):
+        """Assembles the sessions of every student. Only used for fleet-wide views such as all_details."""
+        sessions = {}
+        for student_id in self._student_ids():
+            student_sessions = self._load_student(student_id)
+            if student_sessions is not None:
+                sessions[student_id] = student_sessions
+        return sessions
+
+    def save_sessions(self, sessions):
+        """Writes the file of every student in sessions, e.g. when importing the JSON file."""
+        try:
+            for student_id, student_sessions in sessions.items():
+                with self._student_lock(student_id):
+                    self._save_student(student_id, student_sessions)
+            logger.info("Saved sessions of {} students to {}.", len(sessions), self.session_dir)
+        except Exception as e:
+            logger.error(f"Error saving sessions to {self.session_dir}: {str(e)}")
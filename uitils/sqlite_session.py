@@ -0,0 +1,553 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from uitils.session import SessionManager, VERSION_CONFLICT
+from uitils.analytics import MisconceptionTracker, MISCONCEPTION_RESULTS, misconception_state, rank_misconceptions
+from uitils.serializers import SESSION_LOAD_SECONDS, SESSION_SAVE_SECONDS, SESSION_FILE_BYTES
+from uitils.tracing import span
+from uitils.logger import custom_logger
+
+logger = custom_logger.get_logger()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    student_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    student_level TEXT,
+    difficulty_level TEXT,
+    learning_goals TEXT,
+    session_state TEXT,
+    session_progress REAL,
+    session_start_time TEXT,
+    interaction_count INTEGER NOT NULL DEFAULT 0,
+    confidence_sum REAL NOT NULL DEFAULT 0,
+    answer_time_sum REAL NOT NULL DEFAULT 0,
+    correct_count INTEGER NOT NULL DEFAULT 0,
+    incorrect_count INTEGER NOT NULL DEFAULT 0,
+    partially_correct_count INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, session_id)
+);
+CREATE TABLE IF NOT EXISTS interactions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    interaction_id TEXT NOT NULL,
+    question TEXT,
+    answer TEXT,
+    answer_time REAL,
+    query_time TEXT,
+    correct_answer TEXT,
+    confidence_level INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_session ON interactions (student_id, session_id, seq);
+CREATE INDEX IF NOT EXISTS idx_interactions_id ON interactions (interaction_id);
+"""
+
+INTERACTION_COLUMNS = ("interaction_id", "question", "answer", "answer_time", "query_time", "correct_answer", "confidence_level")
+
+# Running counters kept on each sessions row, mirroring the "stats" of a JSON session.
+STATS_COLUMNS = {
+    "interaction_count": "INTEGER",
+    "confidence_sum": "REAL",
+    "answer_time_sum": "REAL",
+    "correct_count": "INTEGER",
+    "incorrect_count": "INTEGER",
+    "partially_correct_count": "INTEGER"
+}
+
+class SQLiteSessionManager(SessionManager):
+    """
+    SessionManager backed by the stdlib sqlite3 module.
+
+    Sessions and interactions live in their own tables, indexed by
+    (student_id, session_id) and interaction_id, so lookups and updates touch
+    only the rows of one session. Analytics run as SQL aggregates.
+    """
+
+    def __init__(self, db_path, misconception_capacity=1000):
+        super().__init__(db_path, cache_size=0, misconception_capacity=misconception_capacity)
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+        self._add_stats_columns()
+        self._add_version_column()
+        logger.info("SQLiteSessionManager initialized with database: {}", db_path)
+
+    def _connection(self):
+        """Returns the sqlite connection of the calling thread, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        """
+        Returns a context manager running the enclosed statements in one write transaction.
+        The aggregate is updated inside it, so that concurrent writers apply their changes in commit order.
+        """
+        return _Transaction(self._connection(), self.db_path)
+
+    def _writes_excluded(self):
+        """Every mutation runs in a write transaction, so holding one keeps them out, in every process."""
+        return self._transaction()
+
+    def _add_stats_columns(self):
+        """Adds and backfills the running counters on databases created before they existed."""
+        conn = self._connection()
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(sessions)")}
+        missing = [column for column in STATS_COLUMNS if column not in existing]
+        if not missing:
+            return
+        with self._transaction() as conn:
+            for column in missing:
+                conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} {STATS_COLUMNS[column]} NOT NULL DEFAULT 0")
+            conn.execute(
+                "UPDATE sessions SET "
+                "interaction_count = (SELECT COUNT(*) FROM interactions i WHERE i.student_id = sessions.student_id AND i.session_id = sessions.session_id), "
+                "confidence_sum = (SELECT COALESCE(SUM(confidence_level), 0) FROM interactions i WHERE i.student_id = sessions.student_id AND i.session_id = sessions.session_id), "
+                "answer_time_sum = (SELECT COALESCE(SUM(answer_time), 0) FROM interactions i WHERE i.student_id = sessions.student_id AND i.session_id = sessions.session_id), "
+                "correct_count = (SELECT COUNT(*) FROM interactions i WHERE i.student_id = sessions.student_id AND i.session_id = sessions.session_id AND correct_answer = 'correct'), "
+                "incorrect_count = (SELECT COUNT(*) FROM interactions i WHERE i.student_id = sessions.student_id AND i.session_id = sessions.session_id AND correct_answer = 'incorrect'), "
+                "partially_correct_count = (SELECT COUNT(*) FROM interactions i WHERE i.student_id = sessions.student_id AND i.session_id = sessions.session_id AND correct_answer = 'partially correct')"
+            )
+        logger.info("Added running session counters to {}", self.db_path)
+
+    def _add_version_column(self):
+        """Adds the session version on databases created before it existed."""
+        conn = self._connection()
+        if "version" not in {row["name"] for row in conn.execute("PRAGMA table_info(sessions)")}:
+            conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            logger.info("Added session versions to {}", self.db_path)
+
+    def _session_row_to_dict(self, row, interactions):
+        return {
+            "session_id": row["session_id"],
+            "student_id": row["student_id"],
+            "student_level": row["student_level"],
+            "difficulty_level": row["difficulty_level"],
+            "learning_goals": json.loads(row["learning_goals"]),
+            "session_state": row["session_state"],
+            "session_progress": row["session_progress"],
+            "session_start_time": row["session_start_time"],
+            "interactions": interactions,
+            "stats": {column: row[column] for column in STATS_COLUMNS},
+            "version": row["version"]
+        }
+
+    def _interaction_row_to_dict(self, row):
+        return {column: row[column] for column in INTERACTION_COLUMNS}
+
+    def _load_interactions(self, student_id, session_id):
+        rows = self._connection().execute(
+            "SELECT * FROM interactions WHERE student_id = ? AND session_id = ? ORDER BY seq",
+            (student_id, session_id)
+        ).fetchall()
+        return [self._interaction_row_to_dict(row) for row in rows]
+
+    def _load_student(self, student_id):
+        """Loads all sessions of one student, keyed by session_id, with two indexed queries."""
+        with SESSION_LOAD_SECONDS.labels("sqlite").time(), span("db_read"):
+            conn = self._connection()
+            session_rows = conn.execute("SELECT * FROM sessions WHERE student_id = ?", (student_id,)).fetchall()
+            interactions = defaultdict(list)
+            for row in conn.execute("SELECT * FROM interactions WHERE student_id = ? ORDER BY seq", (student_id,)):
+                interactions[row["session_id"]].append(self._interaction_row_to_dict(row))
+            return {row["session_id"]: self._session_row_to_dict(row, interactions[row["session_id"]]) for row in session_rows}
+
+    def _insert_interaction(self, conn, student_id, session_id, interaction):
+        conn.execute(
+            "INSERT INTO interactions (student_id, session_id, interaction_id, question, answer, answer_time, query_time, correct_answer, confidence_level) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (student_id, session_id) + tuple(interaction[column] for column in INTERACTION_COLUMNS)
+        )
+        self._add_to_stats_row(conn, student_id, session_id, interaction)
+
+    def _add_to_stats_row(self, conn, student_id, session_id, interaction, sign=1):
+        """Adds (sign=1) or removes (sign=-1) one interaction's contribution to its session's counters."""
+        result = interaction["correct_answer"]
+        conn.execute(
+            "UPDATE sessions SET interaction_count = interaction_count + ?, confidence_sum = confidence_sum + ?, "
+            "answer_time_sum = answer_time_sum + ?, correct_count = correct_count + ?, incorrect_count = incorrect_count + ?, "
+            "partially_correct_count = partially_correct_count + ? WHERE student_id = ? AND session_id = ?",
+            (sign, sign * interaction["confidence_level"], sign * interaction["answer_time"],
+             sign * (result == "correct"), sign * (result == "incorrect"), sign * (result == "partially correct"),
+             student_id, session_id)
+        )
+
+    def _insert_session_rows(self, conn, student_id, session_data):
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO sessions (student_id, session_id, student_level, difficulty_level, learning_goals, session_state, session_progress, session_start_time, version) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (student_id, session_data["session_id"], session_data["student_level"], session_data["difficulty_level"],
+             json.dumps(session_data["learning_goals"]), session_data["session_state"], session_data["session_progress"],
+             session_data.get("session_start_time"), session_data.get("version", 0))
+        )
+        if cursor.rowcount == 0:
+            return False
+        for interaction in session_data["interactions"]:
+            self._insert_interaction(conn, student_id, session_data["session_id"], interaction)
+        return True
+
+    def load_sessions(self):
+        """Loads every session from the database in the JSON file layout."""
+        try:
+            conn = self._connection()
+            sessions = {}
+            for row in conn.execute("SELECT * FROM sessions"):
+                sessions.setdefault(row["student_id"], {})[row["session_id"]] = self._session_row_to_dict(row, [])
+            for row in conn.execute("SELECT * FROM interactions ORDER BY seq"):
+                sessions[row["student_id"]][row["session_id"]]["interactions"].append(self._interaction_row_to_dict(row))
+            logger.debug("Loaded session data successfully.")
+            return sessions
+        except sqlite3.Error as e:
+            logger.error(f"Error loading sessions from database: {str(e)}")
+            return {}
+
+    def save_sessions(self, sessions):
+        """Replaces the database contents with the given session data, e.g. when importing a JSON file."""
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM interactions")
+                conn.execute("DELETE FROM sessions")
+                for student_id, student_sessions in sessions.items():
+                    for session_data in student_sessions.values():
+                        self._insert_session_rows(conn, student_id, session_data)
+            self.rebuild_aggregate()
+            logger.debug("Sessions data saved successfully.")
+        except Exception as e:
+            logger.error(f"Error saving sessions to database: {str(e)}")
+
+    def is_empty(self):
+        """Returns True if no session has been stored yet."""
+        return self._connection().execute("SELECT 1 FROM sessions LIMIT 1").fetchone() is None
+
+    def insert_session(self, student_id, session_data):
+        """Inserts a new session for a student."""
+        try:
+            session_id = session_data["session_id"]
+            with self._transaction() as conn:
+                new_student = conn.execute("SELECT 1 FROM sessions WHERE student_id = ? LIMIT 1", (student_id,)).fetchone() is None
+                inserted = self._insert_session_rows(conn, student_id, session_data)
+                if inserted:
+                    self.aggregate.apply([("session_added", session_data, new_student)])
+            if inserted:
+                logger.info("New session {} inserted for student {}.", session_id, student_id)
+            else:
+                logger.warning(f"Session {session_id} already exists for student {student_id}. No changes made.")
+            return "Session Started Successfully.🙂"
+        except Exception as e:
+            logger.error(f"Error inserting session for student {student_id}: {str(e)}")
+            return "Please Try After Sometime."
+
+    def _update_interaction_rows(self, conn, student_id, session_id, interaction_id, answer, updated_difficulty_level, student_response_time, confidence_level, result, changes):
+        """Applies a graded answer inside the caller's transaction and returns a status message."""
+        session_row = conn.execute(
+            "SELECT interaction_count, difficulty_level FROM sessions WHERE student_id = ? AND session_id = ?", (student_id, session_id)
+        ).fetchone()
+        if session_row is None:
+            return "Session or student does not exist."
+
+        previous = conn.execute(
+            "SELECT * FROM interactions WHERE interaction_id = ? AND student_id = ? AND session_id = ?",
+            (interaction_id, student_id, session_id)
+        ).fetchone()
+        if previous is None:
+            return "Interaction ID not found."
+
+        graded = {**self._interaction_row_to_dict(previous), "answer": answer, "answer_time": student_response_time,
+                  "confidence_level": confidence_level, "correct_answer": result}
+        conn.execute(
+            "UPDATE interactions SET answer = ?, answer_time = ?, confidence_level = ?, correct_answer = ? WHERE seq = ?",
+            (answer, student_response_time, confidence_level, result, previous["seq"])
+        )
+        self._add_to_stats_row(conn, student_id, session_id, previous, sign=-1)
+        self._add_to_stats_row(conn, student_id, session_id, graded)
+        changes.append(("interaction_removed", previous))
+        changes.append(("difficulty_changed", session_row["difficulty_level"], updated_difficulty_level))
+        changes.append(("interaction_added", graded))
+
+        # Recalculate session progress and state
+        number_of_interactions = session_row["interaction_count"]
+        session_progress = (number_of_interactions / 100) * 100 if number_of_interactions < 100 else 100
+        session_state = "completed" if number_of_interactions >= 100 else "in-progress"
+        conn.execute(
+            "UPDATE sessions SET difficulty_level = ?, session_progress = ?, session_state = ?, version = version + 1 WHERE student_id = ? AND session_id = ?",
+            (updated_difficulty_level, session_progress, session_state, student_id, session_id)
+        )
+        return "Updated successfully. 🙂"
+
+    def update_interaction(self, student_id, session_id, interaction_id, answer, updated_difficulty_level, student_response_time, confidence_level, result):
+        """Updates an interaction for a student session."""
+        try:
+            changes = []
+            with self._transaction() as conn:
+                status = self._update_interaction_rows(
+                    conn, student_id, session_id, interaction_id, answer,
+                    updated_difficulty_level, student_response_time, confidence_level, result, changes
+                )
+                self.aggregate.apply(changes)
+            if status == "Session or student does not exist.":
+                logger.warning(f"Session {session_id} for student {student_id} does not exist.")
+            elif status == "Interaction ID not found.":
+                logger.warning(f"Interaction with ID {interaction_id} not found for session {session_id} of student {student_id}.")
+            else:
+                logger.info("Interaction {} updated for session {} of student {}.", interaction_id, session_id, student_id)
+            return status
+
+        except Exception as e:
+            logger.error(f"Error updating interaction for student {student_id}, session {session_id}: {str(e)}")
+            return "Please try again later. 😞"
+
+    def grade_and_advance(self, student_id, session_id, interaction_id, answer, updated_difficulty_level, student_response_time, confidence_level, result, new_interaction, expected_version=None):
+        """Records a graded answer and appends the follow-up interaction in one transaction."""
+        try:
+            changes = []
+            with self._transaction() as conn:
+                version_row = conn.execute(
+                    "SELECT version FROM sessions WHERE student_id = ? AND session_id = ?", (student_id, session_id)
+                ).fetchone()
+                if expected_version is not None and version_row is not None and version_row["version"] != expected_version:
+                    status = VERSION_CONFLICT
+                else:
+                    status = self._update_interaction_rows(
+                        conn, student_id, session_id, interaction_id, answer,
+                        updated_difficulty_level, student_response_time, confidence_level, result, changes
+                    )
+                if status == "Updated successfully. 🙂":
+                    self._insert_interaction(conn, student_id, session_id, new_interaction)
+                    changes.append(("interaction_added", new_interaction))
+                self.aggregate.apply(changes)
+            if status != "Updated successfully. 🙂":
+                logger.warning(f"Could not grade interaction {interaction_id} of session {session_id} for student {student_id}: {status}")
+            else:
+                logger.info("Interaction {} graded and interaction {} added to session {} of student {}.", interaction_id, new_interaction['interaction_id'], session_id, student_id)
+            return status
+
+        except Exception as e:
+            logger.error(f"Error grading interaction for student {student_id}, session {session_id}: {str(e)}")
+            return "Please try again later. 😞"
+
+    def update_session(self, student_id, session_id, new_interaction):
+        """Updates an existing session with a new interaction."""
+        try:
+            with self._transaction() as conn:
+                exists = conn.execute("SELECT 1 FROM sessions WHERE student_id = ? AND session_id = ?", (student_id, session_id)).fetchone()
+                duplicate = conn.execute(
+                    "SELECT 1 FROM interactions WHERE interaction_id = ? AND student_id = ? AND session_id = ?",
+                    (new_interaction["interaction_id"], student_id, session_id)
+                ).fetchone()
+                if exists and not duplicate:
+                    self._insert_interaction(conn, student_id, session_id, new_interaction)
+                    conn.execute("UPDATE sessions SET version = version + 1 WHERE student_id = ? AND session_id = ?", (student_id, session_id))
+                    self.aggregate.apply([("interaction_added", new_interaction)])
+            if exists:
+                logger.info("New interaction added to session {} for student {}.", session_id, student_id)
+            else:
+                logger.warning(f"Session {session_id} for student {student_id} does not exist.")
+        except Exception as e:
+            logger.error(f"Error updating session for student {student_id}, session {session_id}: {str(e)}")
+
+    def get_session(self, student_id, session_id):
+        """Retrieve a specific session by session_id for a given student."""
+        try:
+            with SESSION_LOAD_SECONDS.labels("sqlite").time(), span("db_read"):
+                row = self._connection().execute(
+                    "SELECT * FROM sessions WHERE student_id = ? AND session_id = ?", (student_id, session_id)
+                ).fetchone()
+                if row is None:
+                    return None
+                session = self._session_row_to_dict(row, self._load_interactions(student_id, session_id))
+            logger.debug("Retrieved session {} for student {}.", session_id, student_id)
+            return session
+        except Exception as e:
+            logger.error(f"Error retrieving session {session_id} for student {student_id}: {str(e)}")
+            return None
+
+    def _session_summary(self, session):
+        history = session["interactions"]
+        avg_confidence_level, avg_answer_time = self._session_averages(session)
+        return {
+            "session_state": session["session_state"],
+            "session_progress": session["session_progress"],
+            "number_of_interactions": len(history),
+            "difficulty_level": session["difficulty_level"],
+            "student_level": session["student_level"],
+            "avg_confidence_level": avg_confidence_level,
+            "avg_answer_time": avg_answer_time,
+            "learning_goals": session["learning_goals"],
+            "interactions": history
+        }
+
+    def session_details(self, student_id, session_id):
+        """Get detailed session information for a specific student."""
+        session = self.get_session(student_id, session_id)
+        if session is None:
+            return None
+        return {**self._session_summary(session), "version": session["version"]}
+
+    def interaction_details(self, student_id, session_id, interaction_id):
+        """Get detailed session information for a specific student."""
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT * FROM interactions WHERE interaction_id = ? AND student_id = ? AND session_id = ?",
+                (interaction_id, student_id, session_id)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Interaction with ID {interaction_id} not found.")
+            session = self.get_session(student_id, session_id)
+            history = session["interactions"]
+            response = {
+                "session_state": session["session_state"],
+                "session_progress": session["session_progress"],
+                "number_of_interactions": len(history),
+                "difficulty_level": session["difficulty_level"],
+                "student_level": session["student_level"],
+                "avg_student_rating": 0,
+                "avg_response_time": 0,
+                "learning_goals": session["learning_goals"],
+                "interactions": history,
+                "interaction_details": self._interaction_row_to_dict(row),
+                "version": session["version"]
+            }
+            logger.debug("Retrieved detailed session information for session {} of student {}.", session_id, student_id)
+            return response
+        except Exception as e:
+            logger.error(f"Error retrieving session details for student {student_id}, session {session_id}: {str(e)}")
+            return None
+
+    def student_details(self, student_id):
+        """Get detailed session information for all sessions of a specific student."""
+        try:
+            student_sessions = self._load_student(student_id)
+            if not student_sessions:
+                logger.warning(f"Student {student_id} not found in sessions data.")
+                return None
+            logger.debug("Retrieved detailed session information for student {}.", student_id)
+            return [{"session_id": session_id, **self._session_summary(session)} for session_id, session in student_sessions.items()]
+        except Exception as e:
+            logger.error(f"Error retrieving student details for student {student_id}: {str(e)}")
+            return None
+
+    def all_details(self):
+        """Get detailed session information for all students and their sessions."""
+        try:
+            sessions = self.load_sessions()
+            logger.debug("Retrieved detailed session information for all students.")
+            return {
+                student_id: [{"session_id": session_id, **self._session_summary(session)} for session_id, session in student_sessions.items()]
+                for student_id, student_sessions in sessions.items()
+            }
+        except Exception as e:
+            logger.error(f"Error retrieving all session details: {str(e)}")
+            return None
+
+    def get_all_session_ids(self, student_id):
+        """Retrieve a list of all session IDs for a specific student."""
+        try:
+            rows = self._connection().execute("SELECT session_id FROM sessions WHERE student_id = ?", (student_id,)).fetchall()
+            logger.debug("Retrieved all session IDs for student {}.", student_id)
+            return [row["session_id"] for row in rows]
+        except Exception as e:
+            logger.error(f"Error retrieving session IDs for student {student_id}: {str(e)}")
+            return []
+
+    def student_analytics(self, student_id, limit=None, offset=0):
+        """Compute performance analytics for a student with SQL aggregates, with the misconceptions ranked offset to offset + limit."""
+        conn = self._connection()
+        totals = conn.execute(
+            "SELECT COUNT(*) AS sessions, SUM(interaction_count) AS total, SUM(correct_count) AS correct, "
+            "SUM(incorrect_count) AS incorrect, SUM(partially_correct_count) AS partially_correct, "
+            "SUM(confidence_sum) AS confidence, SUM(answer_time_sum) AS answer_time "
+            "FROM sessions WHERE student_id = ?",
+            (student_id,)
+        ).fetchone()
+        if totals["sessions"] == 0:
+            return None
+
+        grouped = conn.execute(
+            "SELECT question, correct_answer, COUNT(*) AS count "
+            "FROM interactions WHERE student_id = ? GROUP BY question, correct_answer",
+            (student_id,)
+        ).fetchall()
+
+        misconceptions, misconceptions_total = rank_misconceptions(
+            ((row["question"], row["count"]) for row in grouped if row["correct_answer"] in MISCONCEPTION_RESULTS), limit, offset
+        )
+        total_interactions = totals["total"]
+        return {
+            "total_sessions": totals["sessions"],
+            "total_interactions": total_interactions,
+            "total_correct_answers": totals["correct"],
+            "total_incorrect_answers": totals["incorrect"],
+            "total_partially_correct_answers": totals["partially_correct"],
+            "avg_confidence_level": totals["confidence"] / total_interactions if total_interactions > 0 else 0,
+            "avg_interaction_duration": totals["answer_time"] / total_interactions if total_interactions > 0 else 0,
+            "concept_mastery": {row["question"]: row["count"] for row in grouped if row["correct_answer"] == "correct"},
+            "misconceptions": misconceptions,
+            "misconceptions_total": misconceptions_total
+        }
+
+    def _compute_aggregate(self):
+        """Computes the aggregate analytics counters with SQL aggregates."""
+        conn = self._connection()
+        sessions = conn.execute("SELECT COUNT(DISTINCT student_id) AS students, COUNT(*) AS total FROM sessions").fetchone()
+        totals = conn.execute(
+            "SELECT COALESCE(SUM(interaction_count), 0) AS total, COALESCE(SUM(confidence_sum), 0) AS confidence, "
+            "COALESCE(SUM(answer_time_sum), 0) AS answer_time FROM sessions"
+        ).fetchone()
+        difficulty_progression = conn.execute("SELECT difficulty_level, COUNT(*) FROM sessions GROUP BY difficulty_level").fetchall()
+        common_misconceptions = conn.execute(
+            "SELECT question, COUNT(*) FROM interactions WHERE correct_answer IN ('incorrect', 'partially correct') GROUP BY question"
+        ).fetchall()
+
+        return {
+            "number_of_students": sessions["students"],
+            "total_sessions": sessions["total"],
+            "total_interactions": totals["total"],
+            "confidence_sum": totals["confidence"],
+            "answer_time_sum": totals["answer_time"],
+            "difficulty_progression": dict(difficulty_progression),
+            **misconception_state(MisconceptionTracker.from_counts(common_misconceptions, self.misconception_capacity))
+        }
+
+class _Transaction:
+    """
+    Runs a block of statements inside BEGIN IMMEDIATE ... COMMIT, rolling back on error.
+    Committed transactions are recorded as saves of the "sqlite" backend, with the database size.
+    """
+
+    def __init__(self, conn, db_path):
+        self.conn = conn
+        self.db_path = db_path
+        self.span = span("db_write")
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.span.__enter__()
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except BaseException as e:
+            self.span.__exit__(type(e), e, e.__traceback__)
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is not None:
+                self.conn.execute("ROLLBACK")
+                return False
+            self.conn.execute("COMMIT")
+        finally:
+            self.span.__exit__(exc_type, exc, tb)
+        SESSION_SAVE_SECONDS.labels("sqlite").observe(time.perf_counter() - self.started)
+        SESSION_FILE_BYTES.labels("sqlite", "save").observe(os.path.getsize(self.db_path))
+        return False
@@ -0,0 +1,117 @@
+import json
+
+def sse_event(event, data):
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class JsonFieldStream:
+    """
+    Incremental parser for the flat JSON object the model answers with.
+
+    Text is fed as it is streamed. `feed` returns the events that the new text
+    completes: ("delta", key, text) for every decoded piece of a string value,
+    and ("field", key, value) once a value is complete. Anything before the
+    opening brace (code fences, quotes) is ignored. `result` parses the whole
+    text once the stream is over.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self._depth = 0
+        self._key = None
+        self._expect = "key"        # "key", "value" or "next" (a comma or the closing brace)
+        self._in_string = False
+        self._string = []           # decoded text of the current key or string value
+        self._escape = ""           # pending escape sequence, e.g. "\\u00"
+        self._raw = []              # text of the current non-string value
+
+    def feed(self, text):
+        self.chunks.append(text)
+        events = []
+        delta = []
+        for char in text:
+            if self._in_string:
+                if self._escape:
+                    self._escape += char
+                    if self._escape_complete():
+                        decoded = json.loads(f'"{self._escape}"')
+                        self._escape = ""
+                        self._string.append(decoded)
+                        delta.append(decoded)
+                elif char == "\\":
+                    self._escape = char
+                elif char == '"':
+                    self._in_string = False
+                    self._end_string(events, delta)
+                    delta = []
+                else:
+                    self._string.append(char)
+                    delta.append(char)
+                continue
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                continue
+            if self._depth > 1 or (self._expect == "value" and self._raw):
+                # Inside a nested or non-string value: collect it until it ends.
+                if char in "{[":
+                    self._depth += 1
+                elif char in "}]" and self._depth > 1:
+                    self._depth -= 1
+                elif char in ",}" and self._depth == 1:
+                    self._end_raw(events)
+                    if char == "}":
+                        self._depth = 0
+                    continue
+                self._raw.append(char)
+                continue
+            if char.isspace() or char == ":":
+                continue
+            if char == '"' and self._expect in ("key", "value"):
+                self._in_string = True
+                self._string = []
+                delta = []
+            elif char == "," and self._expect == "next":
+                self._expect = "key"
+            elif char == "}":
+                self._depth = 0
+            elif self._expect == "value":
+                if char in "{[":
+                    self._depth += 1
+                self._raw.append(char)
+        if self._in_string and self._expect == "value" and delta:
+            events.append(("delta", self._key, "".join(delta)))
+        return events
+
+    def _escape_complete(self):
+        if self._escape[1:2] == "u":
+            return len(self._escape) == 6
+        return len(self._escape) == 2
+
+    def _end_string(self, events, delta):
+        text = "".join(self._string)
+        if self._expect == "key":
+            self._key = text
+            self._expect = "value"
+            return
+        if delta:
+            events.append(("delta", self._key, "".join(delta)))
+        events.append(("field", self._key, text))
+        self._expect = "next"
+
+    def _end_raw(self, events):
+        raw = "".join(self._raw).strip()
+        self._raw = []
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = raw
+        events.append(("field", self._key, value))
+        self._expect = "key"
+
+    def text(self):
+        return "".join(self.chunks)
+
+    def result(self):
+        """Parses the complete answer the same way as the non-streaming calls."""
+        return json.loads(self.text().replace("`", "").replace("json", ""))
@@ -0,0 +1,173 @@
+import contextvars
+import datetime
+import functools
+import json
+import re
+import threading
+import time
+import uuid
+from uitils.logger import custom_logger
+
+# The trace of the request being handled and the innermost open span. Both are
+# context variables, so they follow the request into awaited coroutines, the
+# tasks it creates and the threadpool that runs its blocking calls.
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Trace:
+    """Spans recorded while handling one request, identified by a trace id."""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.started_at = datetime.datetime.now().isoformat()
+        self.started = time.perf_counter()
+        self.spans = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _new_span_id(self):
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def totals(self):
+        """
+        Returns {span name: (milliseconds, count)}. A span nested in a span of
+        the same name, e.g. get_session called by session_details, is counted
+        once through its outermost ancestor.
+        """
+        totals = {}
+        for span in list(self.spans):
+            if span["nested"]:
+                continue
+            duration, count = totals.get(span["name"], (0.0, 0))
+            totals[span["name"]] = (duration + span["duration_ms"], count + 1)
+        return totals
+
+    def server_timing(self):
+        """Formats the per-name totals and the elapsed time as a Server-Timing header value."""
+        entries = [f'{_token(name)};dur={duration:.1f};desc="{count}x"' for name, (duration, count) in self.totals().items()]
+        entries.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self, **fields):
+        return {
+            "trace_id": self.trace_id,
+            "started_at": self.started_at,
+            **fields,
+            "duration_ms": round(self.elapsed_ms(), 3),
+            "spans": [{key: value for key, value in span.items() if key != "nested"} for span in list(self.spans)]
+        }
+
+def _token(name):
+    # Server-Timing metric names are HTTP tokens.
+    return re.sub(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]", "_", name)
+
+class span:
+    """
+    Context manager timing a block as a span of the current trace.
+
+    Outside of a traced request it does nothing beyond reading a context
+    variable, so it can stay around code that also runs in background tasks.
+    Attributes are recorded with the span, e.g. span("llm", call="QnA response").
+    """
+
+    __slots__ = ("name", "attributes", "trace", "span_id", "parent", "nested", "started", "_token")
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.trace = None
+
+    def __enter__(self):
+        self.trace = _current_trace.get()
+        if self.trace is None:
+            return self
+        self.parent = _current_span.get()
+        self.nested = False
+        ancestor = self.parent
+        while ancestor is not None:
+            if ancestor.name == self.name:
+                self.nested = True
+                break
+            ancestor = ancestor.parent
+        self.span_id = self.trace._new_span_id()
+        self._token = _current_span.set(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        trace = self.trace
+        if trace is None:
+            return False
+        finished = time.perf_counter()
+        _current_span.reset(self._token)
+        record = {
+            "id": self.span_id,
+            "parent": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "start_ms": round((self.started - trace.started) * 1000, 3),
+            "duration_ms": round((finished - self.started) * 1000, 3),
+            "nested": self.nested,
+            **self.attributes
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        trace.spans.append(record)
+        return False
+
+def start_trace(trace_id=None):
+    """Starts a trace in the current context. Returns the trace and the token to pass to end_trace."""
+    trace = Trace(trace_id)
+    return trace, _current_trace.set(trace)
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+def current_trace():
+    return _current_trace.get()
+
+def trace_methods(obj, names, span_name, attribute="method"):
+    """
+    Wraps the given methods of obj in spans named span_name, recording the
+    method name as an attribute. Calls the object makes to its own wrapped
+    methods become nested spans.
+    """
+    for name in names:
+        method = getattr(obj, name, None)
+        if method is None:
+            continue
+        setattr(obj, name, _traced(method, span_name, {attribute: name}))
+
+def _traced(method, span_name, attributes):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with span(span_name, **attributes):
+            return method(*args, **kwargs)
+    return wrapper
+
+class SlowTraceLog:
+    """
+    Appends traces that took at least threshold_ms to a JSONL file, one trace per line.
+    The lines are written by the background thread of the logger, so that the request
+    that was slow does not also wait on the file.
+    """
+
+    def __init__(self, path, threshold_ms):
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self._write = custom_logger.file_writer(path) if self.enabled else None
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    def record(self, trace, **fields):
+        """Queues the trace for writing if it is slow. Returns True if it was queued."""
+        if not self.enabled or trace.elapsed_ms() < self.threshold_ms:
+            return False
+        self._write(json.dumps(trace.to_dict(**fields), ensure_ascii=False) + "\n")
+        return True
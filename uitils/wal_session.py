@@ -0,0 +1,119 @@
+import json
+import os
+from uitils.session import SessionManager
+from uitils.serializers import write_file
+from uitils.file_lock import lock_for_process, StoreInUseError
+from uitils.tracing import span
+from uitils.logger import custom_logger
+
+logger = custom_logger.get_logger()
+
+class WalSessionManager(SessionManager):
+    """
+    SessionManager that appends one record per mutation to a write-ahead log
+    instead of rewriting the whole JSON file on every write.
+
+    The JSON file keeps its usual layout and acts as the compacted snapshot.
+    At startup the snapshot is loaded and the log is replayed on top of it.
+    Every `compact_every` records the snapshot is rewritten and the log truncated.
+    Replaying a record twice is harmless, so a crash between the two steps is safe.
+
+    The data lives in this process's memory, so the store is owned by one
+    process: an flock on `<log>.lock` is held until close, and opening the
+    store in a second process, e.g. a maintenance command run while the app
+    is up, raises StoreInUseError instead of appending to or truncating the
+    log behind the owner's back.
+    """
+
+    def __init__(self, json_file_path, log_file_path=None, compact_every=1000, fsync=False, serializer=None, misconception_capacity=1000):
+        # All data is held in memory, so the parsed-file cache is not needed.
+        super().__init__(json_file_path, cache_size=0, serializer=serializer, misconception_capacity=misconception_capacity)
+        self.log_file_path = log_file_path or f"{json_file_path}.wal"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        try:
+            self._owner_lock = lock_for_process(f"{self.log_file_path}.lock")
+        except StoreInUseError:
+            raise StoreInUseError(f"The wal store {self.log_file_path} is open in another process; stop it first") from None
+        self._sessions = super().load_sessions()
+        self._records_since_compaction = self._replay()
+        self._log = open(self.log_file_path, 'a', encoding='utf-8')
+        if self._records_since_compaction >= self.compact_every:
+            self.compact()
+        logger.info("WalSessionManager initialized with snapshot {} and log {}", json_file_path, self.log_file_path)
+
+    def _replay(self):
+        """Applies every record in the log to the snapshot and returns the number of records read."""
+        if not os.path.exists(self.log_file_path):
+            return 0
+        count = 0
+        with open(self.log_file_path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Only the last record can be torn by a crash mid-append.
+                    logger.warning(f"Skipping unreadable record at line {line_number} of {self.log_file_path}")
+                    continue
+                op = record.pop("op")
+                getattr(self, f"_apply_{op}")(self._sessions, **record)
+                count += 1
+        logger.info("Replayed {} records from {}", count, self.log_file_path)
+        return count
+
+    def _student_lock(self, student_id):
+        # The data lives in this process's memory: the log supports a single worker process.
+        return self._lock
+
+    def _mutation_scope(self):
+        return self._lock
+
+    def _writes_excluded(self):
+        return self._lock
+
+    def load_sessions(self):
+        """Returns a snapshot of the in-memory session data rebuilt from the snapshot and the log."""
+        # A copy of the outer dict: students added in the meantime do not change it while it is iterated.
+        return dict(self._sessions)
+
+    def _load_student_scope(self, student_id):
+        student_sessions = self._sessions.get(student_id)
+        return {} if student_sessions is None else {student_id: student_sessions}
+
+    def _writable_scope(self, student_id):
+        student_sessions = self._sessions.get(student_id)
+        return {} if student_sessions is None else {student_id: self._copy_student(student_sessions)}
+
+    def _persist(self, sessions, op, **record):
+        """Appends one record describing the mutation to the log, then publishes the student's new sessions."""
+        with self._lock:
+            with span("file_write"):
+                self._log.write(json.dumps({"op": op, **record}) + "\n")
+                self._log.flush()
+                if self.fsync:
+                    os.fsync(self._log.fileno())
+            student_id = record["student_id"]
+            self._sessions[student_id] = sessions[student_id]
+            self._records_since_compaction += 1
+            if self._records_since_compaction >= self.compact_every:
+                self.compact()
+
+    def compact(self):
+        """Writes the current data as the new snapshot and truncates the log."""
+        with self._lock:
+            write_file(self.json_file_path, self._sessions, self.serializer, fsync=True)
+            self._log.close()
+            self._log = open(self.log_file_path, 'w', encoding='utf-8')
+            logger.info("Compacted {} log records into {}", self._records_since_compaction, self.json_file_path)
+            self._records_since_compaction = 0
+
+    def close(self):
+        """Flushes and closes the log file, and gives up the ownership of the store."""
+        with self._lock:
+            self._log.close()
+            if self._owner_lock is not None:
+                self._owner_lock.close()
+                self._owner_lock = None